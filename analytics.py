@@ -0,0 +1,130 @@
+"""
+Parallel lactation-curve fitting.
+
+Fits Wood's model y = a * t^b * e^(-c*t) to every animal's milk series,
+where t is days in milk since the animal's last recorded calving (or since
+its first milk record when no calving has been recorded) and y is the day's
+total: milking sessions are summed per day, and a day with a sensor meter
+total counts that total alone, so it is never added to manual entries for
+the same day (see the overlap rule in validation.py). Animals are sharded
+across a process pool; each worker streams only its own slice of
+milk_records from SQLite and returns fitted parameters, which are written
+back to lactation_fits in one bulk upsert.
+
+Usage:
+    python analytics.py [--farm FARM] [--workers N]
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import groupby
+
+import numpy as np
+from sqlalchemy import case, create_engine, func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from crud import (Animal, AnimalLifecycle, LactationFit, METER_SESSION, MilkRecord, get_db_session, get_engine,
+                  init_db)
+
+MIN_RECORDS = 5
+STREAM_BATCH = 5000
+
+
+def fit_wood(days, liters):
+    """Fit Wood's curve by least squares on ln y = ln a + b ln t - c t. Returns a dict or None."""
+    t = np.asarray(days, dtype=float)
+    y = np.asarray(liters, dtype=float)
+    mask = y > 0
+    t, y = t[mask], y[mask]
+    if len(t) < MIN_RECORDS or np.unique(t).size < 3:
+        return None
+    X = np.column_stack([np.ones_like(t), np.log(t), -t])
+    log_y = np.log(y)
+    (log_a, b, c), *_ = np.linalg.lstsq(X, log_y, rcond=None)
+    residual = log_y - X @ np.array([log_a, b, c])
+    total = ((log_y - log_y.mean()) ** 2).sum()
+    a = float(np.exp(log_a))
+    peak_day = peak_yield = None
+    if b > 0 and c > 0:
+        peak_day = float(b / c)
+        peak_yield = float(a * peak_day ** b * np.exp(-c * peak_day))
+    return {
+        'a': a, 'b': float(b), 'c': float(c),
+        'peak_day': peak_day, 'peak_yield': peak_yield,
+        'r_squared': float(1 - (residual ** 2).sum() / total) if total > 0 else None,
+        'n_records': int(len(t)),
+    }
+
+
+def _fit_shard(database_url, animal_ids):
+    """Worker: stream one shard's milk series and fit each animal."""
+    engine = create_engine(database_url)
+    is_meter = MilkRecord.session == METER_SESSION
+    day_total = case((func.max(is_meter) == 1, func.sum(case((is_meter, MilkRecord.quantity_liters)))),
+                     else_=func.sum(MilkRecord.quantity_liters))
+    query = (select(MilkRecord.animal_id, MilkRecord.date, day_total)
+             .where(MilkRecord.animal_id.in_(animal_ids))
+             .group_by(MilkRecord.animal_id, MilkRecord.date)
+             .order_by(MilkRecord.animal_id, MilkRecord.date))
+    today = date.today()
+    results = []
+    try:
+        with engine.connect() as conn:
+            calvings = dict(conn.execute(
+                select(AnimalLifecycle.animal_id, AnimalLifecycle.last_calving)
+                .where(AnimalLifecycle.animal_id.in_(animal_ids), AnimalLifecycle.last_calving.isnot(None))).all())
+            rows = conn.execution_options(yield_per=STREAM_BATCH).execute(query)
+            for animal_id, series in groupby(rows, key=lambda r: r[0]):
+                calved = calvings.get(animal_id)
+                series = [r for r in series if calved is None or r[1] >= calved]
+                if not series:
+                    continue
+                first = calved or series[0][1]
+                days = [(r[1] - first).days + 1 for r in series]
+                fit = fit_wood(days, [r[2] for r in series])
+                if fit is not None:
+                    results.append(dict(fit, animal_id=animal_id, fitted_on=today))
+    finally:
+        engine.dispose()
+    return results
+
+
+def _shards(ids, count):
+    size = max(1, -(-len(ids) // count))
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+def run_lactation_fits(farm_id=None, workers=None):
+    """Fit every animal of a farm in parallel and bulk-upsert the results. Returns the number fitted."""
+    database_url = str(get_engine(farm_id).url)
+    with get_db_session(farm_id) as db:
+        animal_ids = [row[0] for row in db.query(Animal.id).order_by(Animal.id)]
+    if not animal_ids:
+        return 0
+
+    workers = workers or os.cpu_count() or 1
+    # A few shards per worker keeps cores busy when series lengths differ
+    shards = _shards(animal_ids, workers * 4)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        fits = [fit for shard in pool.map(_fit_shard, [database_url] * len(shards), shards) for fit in shard]
+
+    if fits:
+        stmt = insert(LactationFit.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['animal_id'],
+            set_={col: stmt.excluded[col] for col in fits[0] if col != 'animal_id'},
+        )
+        with get_db_session(farm_id) as db:
+            db.execute(stmt, fits)
+            db.commit()
+    return len(fits)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fit lactation curves for every animal")
+    parser.add_argument('--farm', default=None, help="Farm id (default farm if omitted)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+    init_db(args.farm)
+    print(f"Fitted lactation curves for {run_lactation_fits(args.farm, args.workers)} animals.")
@@ -0,0 +1,322 @@
+"""
+Headless JSON API over crud.py for parlour integrations (milk meters,
+feeding robots). Built on the standard library HTTP server so it needs no
+extra dependencies. Every endpoint takes an optional `farm` query
+parameter; the default farm is used when it is omitted.
+
+Endpoints:
+    GET  /animals                         animal list, supports If-None-Match
+    POST /animals                         create one animal
+    GET  /animals/<id>/milk|feed|medicine history, ?start=&end=&page=&page_size=
+    POST /milk | /feed | /medicine        create one record (milk/feed are upserts)
+    POST /milk/batch | /feed/batch        bulk upsert an array of records
+    POST /sensors/batch                   ingest an array of parlour meter readings
+    GET  /summary                         farm summary for the last 30 days
+
+Milk and feed writes are idempotent upserts on their natural keys
+(animal_id, date, session) and (animal_id, date, feed_type), so a meter
+file can be re-posted without creating duplicates. They are checked by
+validation.py first: a single record that fails (including one for an
+unknown animal) is quarantined and answered with 422, and a batch stores
+the records that pass and lists the index and reasons of each quarantined
+one.
+
+Usage:
+    python api.py [--host 127.0.0.1] [--port 8000]
+"""
+import argparse
+import json
+import logging
+import re
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from crud import (Animal, DEFAULT_FARM, farm_exists, get_db_session, get_read_session, get_table_version,
+                  init_db, list_animals, list_milk_by_animal, list_feed_by_animal, list_medicine_by_animal,
+                  create_animal, create_medicine_record, get_farm_summary, MILK_SESSIONS)
+from milk_columns import sync_milk_columns
+from sensors import ingest_readings
+from validation import upsert_validated
+
+log = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 1000
+MAX_BATCH_SIZE = 10000
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# -----------------------------
+# Request parsing helpers
+# -----------------------------
+
+def _require(item, field, parse):
+    if not isinstance(item, dict):
+        raise ApiError(400, f"Expected a JSON object, got {type(item).__name__}")
+    if field not in item or item[field] in (None, ''):
+        raise ApiError(400, f"Missing field: {field}")
+    try:
+        return parse(item[field])
+    except (TypeError, ValueError):
+        raise ApiError(400, f"Invalid value for {field}: {item[field]!r}")
+
+def _positive(value):
+    value = float(value)
+    if value <= 0:
+        raise ValueError(value)
+    return value
+
+def _text(value):
+    value = str(value).strip()
+    if not value:
+        raise ValueError(value)
+    return value
+
+def _session(value):
+    if value not in MILK_SESSIONS:
+        raise ValueError(value)
+    return value
+
+def _milk_fields(item):
+    return {
+        'animal_id': _require(item, 'animal_id', int),
+        'date': _require(item, 'date', date.fromisoformat),
+        'quantity_liters': _require(item, 'quantity_liters', _positive),
+        'session': _require(item, 'session', _session) if 'session' in item else 'Daily',
+    }
+
+def _feed_fields(item):
+    return {
+        'animal_id': _require(item, 'animal_id', int),
+        'date': _require(item, 'date', date.fromisoformat),
+        'feed_type': _require(item, 'feed_type', _text),
+        'quantity_kg': _require(item, 'quantity_kg', _positive),
+    }
+
+def _medicine_fields(item):
+    return {
+        'animal_id': _require(item, 'animal_id', int),
+        'date': _require(item, 'date', date.fromisoformat),
+        'medicine_name': _require(item, 'medicine_name', _text),
+        'dosage': _require(item, 'dosage', _text),
+        'reason': _require(item, 'reason', _text),
+    }
+
+def _sensor_fields(item):
+    fields = {
+        'animal_id': _require(item, 'animal_id', int),
+        'ts': _require(item, 'ts', str),
+        'yield_liters': _require(item, 'yield_liters', _positive),
+    }
+    for field, parse in (('conductivity', float), ('flow_rate', float), ('duration_s', int)):
+        if item.get(field) is not None:
+            fields[field] = _require(item, field, parse)
+    return fields
+
+def _check_animals(db, animal_ids):
+    wanted = set(animal_ids)
+    found = {row[0] for row in db.query(Animal.id).filter(Animal.id.in_(wanted))}
+    missing = wanted - found
+    if missing:
+        raise ApiError(404, f"Unknown animal ids: {sorted(missing)}")
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+# -----------------------------
+# Handlers
+# -----------------------------
+
+def list_animals_handler(farm, query, headers, body):
+    with get_read_session(farm) as db:
+        etag = f'"{farm}-animals-{get_table_version(db, "animals")}"'
+        if headers.get('If-None-Match') == etag:
+            return 304, None, {'ETag': etag}
+        animals = [a._asdict() for a in list_animals(db)]
+    return 200, {'items': animals}, {'ETag': etag}
+
+def create_animal_handler(farm, query, headers, body):
+    name = _require(body, 'name', _text)
+    breed = _require(body, 'breed', _text)
+    date_of_birth = _require(body, 'date_of_birth', date.fromisoformat)
+    with get_db_session(farm) as db:
+        animal = create_animal(db, name, breed, date_of_birth, body.get('notes'))
+        return 201, {'id': animal.id}, {}
+
+def _history_handler(list_records):
+    def handler(farm, query, headers, body, animal_id):
+        page = _require(query, 'page', int) if 'page' in query else 1
+        page_size = _require(query, 'page_size', int) if 'page_size' in query else 100
+        if page < 1 or not 1 <= page_size <= MAX_PAGE_SIZE:
+            raise ApiError(400, f"page must be >= 1 and page_size between 1 and {MAX_PAGE_SIZE}")
+        start = _require(query, 'start', date.fromisoformat) if 'start' in query else None
+        end = _require(query, 'end', date.fromisoformat) if 'end' in query else None
+        with get_read_session(farm) as db:
+            # Fetch one extra row to know whether another page exists
+            rows = list_records(db, int(animal_id), start, end, limit=page_size + 1,
+                                offset=(page - 1) * page_size)
+        return 200, {
+            'items': [r._asdict() for r in rows[:page_size]],
+            'page': page,
+            'page_size': page_size,
+            'next_page': page + 1 if len(rows) > page_size else None,
+        }, {}
+    return handler
+
+def _create_handler(parse, create):
+    def handler(farm, query, headers, body):
+        fields = parse(body)
+        with get_db_session(farm) as db:
+            _check_animals(db, [fields['animal_id']])
+            record = create(db, **fields)
+            return 201, {'id': record.id}, {}
+    return handler
+
+def _validated_create_handler(parse, kind):
+    def handler(farm, query, headers, body):
+        fields = parse(body)
+        with get_db_session(farm) as db:
+            stored, rejected = upsert_validated(db, kind, [fields], 'api')
+        if rejected:
+            raise ApiError(422, f"Record quarantined for review: {', '.join(rejected[0].reasons)}")
+        return 201, {'id': stored[0].id}, {}
+    return handler
+
+def _batch_handler(parse, kind):
+    def handler(farm, query, headers, body):
+        if not isinstance(body, list):
+            raise ApiError(400, "Expected a JSON array of records")
+        if len(body) > MAX_BATCH_SIZE:
+            raise ApiError(413, f"Batch larger than {MAX_BATCH_SIZE} records")
+        rows = [parse(item) for item in body]
+        with get_db_session(farm) as db:
+            stored, rejected = upsert_validated(db, kind, rows, 'api')
+        if kind == 'milk':
+            # Append the new rows to the dashboard's column files while they are fresh. The batch is
+            # already committed, so a failure here must not tell the client to retry; the next
+            # open_milk_columns picks the rows up anyway.
+            try:
+                sync_milk_columns(farm, append_only=True)
+            except Exception:
+                log.exception("Column sync after a milk batch failed for farm %s", farm)
+        return 201, {
+            'stored': len(stored),
+            'quarantined': [{'index': r.index, 'reasons': r.reasons} for r in rejected],
+        }, {}
+    return handler
+
+def sensor_batch_handler(farm, query, headers, body):
+    if not isinstance(body, list):
+        raise ApiError(400, "Expected a JSON array of readings")
+    if len(body) > MAX_BATCH_SIZE:
+        raise ApiError(413, f"Batch larger than {MAX_BATCH_SIZE} readings")
+    rows = [_sensor_fields(item) for item in body]
+    with get_db_session(farm) as db:
+        _check_animals(db, [r['animal_id'] for r in rows])
+    try:
+        stored = ingest_readings(farm, rows)
+    except ValueError as e:
+        raise ApiError(400, f"Invalid reading: {e}")
+    return 201, {'stored': stored}, {}
+
+def summary_handler(farm, query, headers, body):
+    with get_read_session(farm) as db:
+        return 200, get_farm_summary(db), {}
+
+ROUTES = [
+    ('GET', re.compile(r'^/animals$'), list_animals_handler),
+    ('POST', re.compile(r'^/animals$'), create_animal_handler),
+    ('GET', re.compile(r'^/animals/(\d+)/milk$'), _history_handler(list_milk_by_animal)),
+    ('GET', re.compile(r'^/animals/(\d+)/feed$'), _history_handler(list_feed_by_animal)),
+    ('GET', re.compile(r'^/animals/(\d+)/medicine$'), _history_handler(list_medicine_by_animal)),
+    ('POST', re.compile(r'^/milk$'), _validated_create_handler(_milk_fields, 'milk')),
+    ('POST', re.compile(r'^/feed$'), _validated_create_handler(_feed_fields, 'feed')),
+    ('POST', re.compile(r'^/medicine$'), _create_handler(_medicine_fields, create_medicine_record)),
+    ('POST', re.compile(r'^/milk/batch$'), _batch_handler(_milk_fields, 'milk')),
+    ('POST', re.compile(r'^/feed/batch$'), _batch_handler(_feed_fields, 'feed')),
+    ('POST', re.compile(r'^/sensors/batch$'), sensor_batch_handler),
+    ('GET', re.compile(r'^/summary$'), summary_handler),
+]
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            body = self._read_body()
+            farm = query.pop('farm', DEFAULT_FARM)
+            if not farm_exists(farm):
+                raise ApiError(404, f"Unknown farm: {farm}")
+            for route_method, pattern, handler in ROUTES:
+                match = pattern.match(url.path)
+                if match and route_method == method:
+                    status, payload, headers = handler(farm, query, self.headers, body, *match.groups())
+                    break
+            else:
+                raise ApiError(404, f"No route for {method} {url.path}")
+        except ApiError as e:
+            status, payload, headers = e.status, {'error': e.message}, {}
+        except Exception as e:
+            status, payload, headers = 500, {'error': str(e)}, {}
+        self._respond(status, payload, headers)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(400, "Request body is not valid JSON")
+
+    def _respond(self, status, payload, headers):
+        body = b'' if payload is None else json.dumps(payload, default=_json_default).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if payload is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host='127.0.0.1', port=8000):
+    init_db()
+    server = ThreadingHTTPServer((host, port), ApiRequestHandler)
+    print(f"Dairy farm API listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the dairy farm JSON API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    serve(args.host, args.port)
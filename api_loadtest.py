@@ -0,0 +1,89 @@
+"""
+Sustained-ingest load test for api.py.
+
+Starts N client threads that each POST batches of synthetic milk records
+to /milk/batch for a fixed duration, then reports records/second and
+request latency percentiles. Run it against a running API on a scratch
+farm so test data does not mix with real records:
+
+    python api.py --port 8000 &
+    python api_loadtest.py --farm loadtest --clients 4 --batch-size 500 --seconds 30
+"""
+import argparse
+import http.client
+import json
+import random
+import statistics
+import threading
+import time
+from datetime import date, timedelta
+
+from crud import create_animal, create_farm, get_db_session, list_animals
+
+
+def _ensure_animals(farm, count):
+    create_farm(farm)
+    with get_db_session(farm) as db:
+        ids = [a.id for a in list_animals(db)]
+        for i in range(len(ids), count):
+            ids.append(create_animal(db, f"Load Cow {i + 1}", "Holstein", date(2020, 1, 1)).id)
+    return ids[:count]
+
+def _client(host, port, farm, animal_ids, batch_size, deadline, latencies, counts, errors):
+    conn = http.client.HTTPConnection(host, port)
+    start_day = date.today() - timedelta(days=365)
+    inserted = 0
+    while time.monotonic() < deadline:
+        batch = [{
+            'animal_id': random.choice(animal_ids),
+            'date': (start_day + timedelta(days=random.randrange(365))).isoformat(),
+            'quantity_liters': round(random.uniform(5, 35), 2),
+        } for _ in range(batch_size)]
+        body = json.dumps(batch)
+        began = time.perf_counter()
+        conn.request('POST', f'/milk/batch?farm={farm}', body, {'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        payload = response.read()
+        latencies.append(time.perf_counter() - began)
+        if response.status == 201:
+            # Quarantined records are accepted by the endpoint but not stored
+            inserted += json.loads(payload)['stored']
+        else:
+            errors.append(response.status)
+    conn.close()
+    counts.append(inserted)
+
+def run(host, port, farm, clients, batch_size, seconds, animals):
+    animal_ids = _ensure_animals(farm, animals)
+    latencies, counts, errors = [], [], []
+    deadline = time.monotonic() + seconds
+    threads = [threading.Thread(target=_client, args=(host, port, farm, animal_ids, batch_size, deadline,
+                                                      latencies, counts, errors))
+               for _ in range(clients)]
+    began = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - began
+
+    total = sum(counts)
+    print(f"Clients: {clients}  Batch size: {batch_size}  Duration: {elapsed:.1f}s")
+    print(f"Records inserted: {total}  Throughput: {total / elapsed:,.0f} records/s")
+    print(f"Requests: {len(latencies)}  Errors: {len(errors)}")
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100)
+        print(f"Latency p50: {cuts[49] * 1000:.1f} ms  p95: {cuts[94] * 1000:.1f} ms  p99: {cuts[98] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the milk batch ingest endpoint")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--farm', default='loadtest', help="Scratch farm to ingest into")
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--animals', type=int, default=100)
+    args = parser.parse_args()
+    run(args.host, args.port, args.farm, args.clients, args.batch_size, args.seconds, args.animals)
@@ -1,6 +1,7 @@
 import streamlit as st
 from sqlalchemy import create_engine
-from crud import init_db
+from crud import init_db, list_farms, DEFAULT_FARM
+from session_memory import profile_page
 
 # Initialize DB once
 init_db()
@@ -53,19 +54,24 @@ def inject_navbar():
     </style>
     """, unsafe_allow_html=True)
 
-    # Get current page from query parameters
+    # Get current page and farm from query parameters
     current_page = st.query_params.get("page", "Home")
+    farm = st.query_params.get("farm", DEFAULT_FARM)
     
     # Navbar HTML with proper string formatting
     navbar_html = f"""
     <nav class="navbar">
-        <div class="nav-brand">🐄 DairyPro</div>
-        <a class="nav-item {'nav-active' if current_page == 'Home' else ''}" href="/?page=Home">Home</a>
-        <a class="nav-item {'nav-active' if current_page == 'Animals' else ''}" href="/?page=Animals">Animals</a>
-        <a class="nav-item {'nav-active' if current_page == 'Milk Production' else ''}" href="/?page=Milk Production">Milk</a>
-        <a class="nav-item {'nav-active' if current_page == 'Feeding Logs' else ''}" href="/?page=Feeding Logs">Feeding</a>
-        <a class="nav-item {'nav-active' if current_page == 'Medicine Logs' else ''}" href="/?page=Medicine Logs">Medicine</a>
-        <a class="nav-item {'nav-active' if current_page == 'Dashboard' else ''}" href="/?page=Dashboard">Analytics</a>
+        <div class="nav-brand">🐄 DairyPro <small style="color: #7f8c8d;">· {farm}</small></div>
+        <a class="nav-item {'nav-active' if current_page == 'Home' else ''}" href="/?page=Home&farm={farm}">Home</a>
+        <a class="nav-item {'nav-active' if current_page == 'Animals' else ''}" href="/?page=Animals&farm={farm}">Animals</a>
+        <a class="nav-item {'nav-active' if current_page == 'Profile' else ''}" href="/?page=Profile&farm={farm}">Profile</a>
+        <a class="nav-item {'nav-active' if current_page == 'Groups' else ''}" href="/?page=Groups&farm={farm}">Groups</a>
+        <a class="nav-item {'nav-active' if current_page == 'Milk Production' else ''}" href="/?page=Milk Production&farm={farm}">Milk</a>
+        <a class="nav-item {'nav-active' if current_page == 'Feeding Logs' else ''}" href="/?page=Feeding Logs&farm={farm}">Feeding</a>
+        <a class="nav-item {'nav-active' if current_page == 'Medicine Logs' else ''}" href="/?page=Medicine Logs&farm={farm}">Medicine</a>
+        <a class="nav-item {'nav-active' if current_page == 'Dashboard' else ''}" href="/?page=Dashboard&farm={farm}">Analytics</a>
+        <a class="nav-item {'nav-active' if current_page == 'Reports' else ''}" href="/?page=Reports&farm={farm}">Reports</a>
+        <a class="nav-item {'nav-active' if current_page == 'Farms' else ''}" href="/?page=Farms&farm={farm}">Farms</a>
     </nav>
     """
     
@@ -77,31 +83,51 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Fall back to the default farm for unknown farm ids
+if st.query_params.get("farm", DEFAULT_FARM) not in list_farms():
+    st.query_params["farm"] = DEFAULT_FARM
+
 # Inject custom navbar
 inject_navbar()
 
 # Get current page from query parameters
 page = st.query_params.get("page", "Home")
 
-# Page routing
-if page == "Home":
-    from pages.home import show_home
-    show_home()
-elif page == "Animals":
-    from pages.animals import show_animals
-    show_animals()
-elif page == "Milk Production":
-    from pages.milk import show_milk
-    show_milk()
-elif page == "Feeding Logs":
-    from pages.feed import show_feed
-    show_feed()
-elif page == "Medicine Logs":
-    from pages.medicine import show_medicine
-    show_medicine()
-elif page == "Dashboard":
-    from pages.reports import show_dashboard
-    show_dashboard()
+# Page routing, profiled for the Diagnostics page
+with profile_page(page):
+    if page == "Home":
+        from pages.home import show_home
+        show_home()
+    elif page == "Animals":
+        from pages.animals import show_animals
+        show_animals()
+    elif page == "Profile":
+        from pages.profile import show_profile
+        show_profile()
+    elif page == "Groups":
+        from pages.groups import show_groups
+        show_groups()
+    elif page == "Milk Production":
+        from pages.milk import show_milk
+        show_milk()
+    elif page == "Feeding Logs":
+        from pages.feed import show_feed
+        show_feed()
+    elif page == "Medicine Logs":
+        from pages.medicine import show_medicine
+        show_medicine()
+    elif page == "Dashboard":
+        from pages.reports import show_dashboard
+        show_dashboard()
+    elif page == "Reports":
+        from pages.report_library import show_report_library
+        show_report_library()
+    elif page == "Farms":
+        from pages.farms import show_farms
+        show_farms()
+    elif page == "Diagnostics":
+        from pages.diagnostics import show_diagnostics
+        show_diagnostics()
 
 # Hide sidebar completely
 st.markdown("""
@@ -0,0 +1,68 @@
+"""
+Concurrent-writer throughput comparison between crud.py and async_crud.py.
+
+Runs W writers that each insert N single milk records (one transaction per
+record, like device uploads) first through the sync API with a thread per
+writer, then through the async API on one event loop, and prints records
+per second for both. Uses a scratch farm so real data is untouched:
+
+    python async_benchmark.py --farm benchmark --writers 50 --records 40
+"""
+import argparse
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import async_crud
+from crud import create_animal, create_farm, get_db_session, list_animals, upsert_milk_record
+
+
+def _records(animal_ids, count):
+    start_day = date.today() - timedelta(days=365)
+    return [(random.choice(animal_ids), start_day + timedelta(days=random.randrange(365)),
+             round(random.uniform(5, 35), 2)) for _ in range(count)]
+
+def _sync_writer(farm, records):
+    with get_db_session(farm) as db:
+        for animal_id, day, liters in records:
+            upsert_milk_record(db, animal_id, day, liters)
+
+def run_sync(farm, batches):
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(batches)) as pool:
+        list(pool.map(lambda records: _sync_writer(farm, records), batches))
+    return time.perf_counter() - began
+
+async def _async_writer(farm, records):
+    async with async_crud.get_async_session(farm) as db:
+        for animal_id, day, liters in records:
+            await async_crud.create_milk_record(db, animal_id, day, liters)
+
+async def _run_async(farm, batches):
+    began = time.perf_counter()
+    await asyncio.gather(*(_async_writer(farm, records) for records in batches))
+    elapsed = time.perf_counter() - began
+    await async_crud.dispose_async_engines()
+    return elapsed
+
+def run(farm, writers, records):
+    create_farm(farm)
+    with get_db_session(farm) as db:
+        animal_ids = [a.id for a in list_animals(db)] or [create_animal(db, "Bench Cow", "Holstein", date(2020, 1, 1)).id]
+    total = writers * records
+    sync_elapsed = run_sync(farm, [_records(animal_ids, records) for _ in range(writers)])
+    async_elapsed = asyncio.run(_run_async(farm, [_records(animal_ids, records) for _ in range(writers)]))
+    print(f"Writers: {writers}  Records per writer: {records}")
+    print(f"Sync  (thread per writer): {total / sync_elapsed:,.0f} records/s")
+    print(f"Async (single event loop): {total / async_elapsed:,.0f} records/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare sync and async concurrent write throughput")
+    parser.add_argument('--farm', default='benchmark', help="Scratch farm to write into")
+    parser.add_argument('--writers', type=int, default=50)
+    parser.add_argument('--records', type=int, default=40)
+    args = parser.parse_args()
+    run(args.farm, args.writers, args.records)
@@ -0,0 +1,206 @@
+"""
+Async counterpart of crud.py for the ingestion service and scheduled jobs.
+
+Uses SQLAlchemy's async engine on aiosqlite, one engine per farm, so many
+concurrent device uploads can share a single event loop instead of a
+thread per connection. Operations delegate to the synchronous crud
+functions through AsyncSession.run_sync, so withdrawal flagging, bulk
+inserts and row types behave as in the sync API. Single milk and feed
+inserts from concurrent callers are validated and group-committed into one
+transaction, which is where the async path gains over a thread per writer.
+
+Usage:
+    async with get_async_session(farm_id) as db:
+        await create_milk_records(db, records)
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+import crud
+import validation
+
+_async_engines = {}
+_async_session_factories = {}
+_write_locks = {}
+_pending_writes = {}
+
+
+def get_async_engine(farm_id=None) -> AsyncEngine:
+    farm_id = farm_id or crud.DEFAULT_FARM
+    if farm_id not in _async_engines:
+        # Resolving the sync engine validates the farm and creates its schema
+        path = crud.get_engine(farm_id).url.database
+        bind = create_async_engine(f'sqlite+aiosqlite:///{path}', echo=False, connect_args={'timeout': 30})
+        event.listen(bind.sync_engine, 'connect', crud._enable_wal)
+        _async_engines[farm_id] = bind
+        _async_session_factories[farm_id] = async_sessionmaker(bind=bind, expire_on_commit=False)
+    return _async_engines[farm_id]
+
+
+@asynccontextmanager
+async def get_async_session(farm_id=None) -> AsyncGenerator[AsyncSession, Any]:
+    """
+    Async context manager providing a session bound to a farm's database.
+    Usage:
+        async with get_async_session(farm_id) as db:
+            # await operations on db
+    """
+    get_async_engine(farm_id)
+    session = _async_session_factories[farm_id or crud.DEFAULT_FARM]()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+async def dispose_async_engines():
+    for bind in _async_engines.values():
+        await bind.dispose()
+    _async_engines.clear()
+    _async_session_factories.clear()
+    _write_locks.clear()
+    _pending_writes.clear()
+
+def _write_lock(db_session):
+    # SQLite allows one writer at a time; queueing writers on the event loop
+    # is far cheaper than letting them spin on the database busy handler.
+    key = (id(asyncio.get_running_loop()), str(db_session.bind.url))
+    lock = _write_locks.get(key)
+    if lock is None:
+        lock = _write_locks[key] = asyncio.Lock()
+    return lock
+
+async def _run(db_session, fn, *args):
+    result = await db_session.run_sync(fn, *args)
+    # End the transaction left open by refreshes and reads so the pooled
+    # connection goes back to the pool between device uploads.
+    await db_session.commit()
+    return result
+
+async def _write(db_session, fn, *args):
+    async with _write_lock(db_session):
+        return await _run(db_session, fn, *args)
+
+def _upsert_validated(db_session, kind, records):
+    """upsert_validated, returning each record's stored row or RecordRejected in submission order."""
+    stored, rejected = validation.upsert_validated(db_session, kind, records, 'async')
+    outcomes = list(stored)
+    # Stored rows keep their relative order, so putting each rejection back at its index restores the batch order
+    for r in rejected:
+        outcomes.insert(r.index, validation.RecordRejected(r.reasons))
+    return outcomes
+
+async def _group_commit(db_session, kind, fields):
+    """
+    Validate and upsert one record, sharing a transaction with any concurrent
+    callers. Records queued while the previous flush held the write lock are
+    validated as one batch and written together in one bulk INSERT ... ON
+    CONFLICT ... RETURNING, so many small device uploads cost about as much
+    as one batch. A rejected record is quarantined and its caller gets
+    RecordRejected. If the batch fails, its records are retried one at a
+    time so only the caller whose record is bad sees the error.
+    """
+    key = (id(asyncio.get_running_loop()), str(db_session.bind.url), kind)
+    pending = _pending_writes.setdefault(key, [])
+    future = asyncio.get_running_loop().create_future()
+    pending.append((fields, future))
+    async with _write_lock(db_session):
+        if not future.done():
+            batch = pending[:]
+            del pending[:]
+            try:
+                outcomes = await _run(db_session, _upsert_validated, kind, [f for f, _ in batch])
+            except Exception as e:
+                await db_session.rollback()
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                else:
+                    await _commit_each(db_session, kind, batch)
+            else:
+                for outcome, (_, waiting) in zip(outcomes, batch):
+                    _settle(waiting, outcome)
+    return await future
+
+def _settle(waiting, outcome):
+    if isinstance(outcome, validation.RecordRejected):
+        waiting.set_exception(outcome)
+    else:
+        waiting.set_result(outcome)
+
+async def _commit_each(db_session, kind, batch):
+    for fields, waiting in batch:
+        try:
+            outcome = (await _run(db_session, _upsert_validated, kind, [fields]))[0]
+        except Exception as e:
+            await db_session.rollback()
+            waiting.set_exception(e)
+        else:
+            _settle(waiting, outcome)
+
+# -----------------------------
+# Async CRUD Operations
+# -----------------------------
+
+async def create_animal(db_session, name, breed, date_of_birth, notes=None):
+    return await _write(db_session, crud.create_animal, name, breed, date_of_birth, notes)
+
+async def get_animal(db_session, animal_id):
+    return await _run(db_session, crud.get_animal, animal_id)
+
+async def list_animals(db_session):
+    return await _run(db_session, crud.list_animals)
+
+async def create_milk_record(db_session, animal_id, date, quantity_liters, session='Daily'):
+    """
+    Upserts on (animal_id, date, session) and returns a crud.MilkRow, or raises
+    validation.RecordRejected if the record was quarantined. Concurrent calls
+    are group-committed.
+    """
+    fields = {'animal_id': animal_id, 'date': date, 'quantity_liters': quantity_liters, 'session': session}
+    return await _group_commit(db_session, 'milk', fields)
+
+async def create_milk_records(db_session, records):
+    return await _write(db_session, crud.create_milk_records, records)
+
+async def upsert_milk_records(db_session, records):
+    return await _write(db_session, crud.upsert_milk_records, records)
+
+async def list_milk_by_animal(db_session, animal_id, start_date=None, end_date=None, limit=None, offset=None):
+    return await _run(db_session, crud.list_milk_by_animal, animal_id, start_date, end_date, limit, offset)
+
+async def list_milk_records(db_session, start_date=None, end_date=None):
+    return await _run(db_session, crud.list_milk_records, start_date, end_date)
+
+async def create_feed_record(db_session, animal_id, date, feed_type, quantity_kg):
+    """
+    Upserts on (animal_id, date, feed_type) and returns a crud.FeedRow, or
+    raises validation.RecordRejected if the record was quarantined. Concurrent
+    calls are group-committed.
+    """
+    fields = {'animal_id': animal_id, 'date': date, 'feed_type': feed_type, 'quantity_kg': quantity_kg}
+    return await _group_commit(db_session, 'feed', fields)
+
+async def create_feed_records(db_session, records):
+    return await _write(db_session, crud.create_feed_records, records)
+
+async def upsert_feed_records(db_session, records):
+    return await _write(db_session, crud.upsert_feed_records, records)
+
+async def list_feed_by_animal(db_session, animal_id, start_date=None, end_date=None, limit=None, offset=None):
+    return await _run(db_session, crud.list_feed_by_animal, animal_id, start_date, end_date, limit, offset)
+
+async def create_medicine_record(db_session, animal_id, date, medicine_name, dosage, reason):
+    return await _write(db_session, crud.create_medicine_record, animal_id, date, medicine_name, dosage, reason)
+
+async def list_medicine_by_animal(db_session, animal_id, start_date=None, end_date=None, limit=None, offset=None):
+    return await _run(db_session, crud.list_medicine_by_animal, animal_id, start_date, end_date, limit, offset)
+
+async def get_milk_totals(db_session, start_date=None, end_date=None):
+    return await _run(db_session, crud.get_milk_totals, start_date, end_date)
+
+async def get_farm_summary(db_session, days=30):
+    return await _run(db_session, crud.get_farm_summary, days)
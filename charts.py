@@ -0,0 +1,86 @@
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Figure builders shared by the live dashboard and the offline report scheduler
+
+def milk_frame(milk_records, start_date=None, end_date=None):
+    """DataFrame of Date/Liters for milk rows, optionally bounded by date."""
+    df = pd.DataFrame([
+        {"Date": r.date, "Liters": r.quantity_liters}
+        for r in milk_records
+        if (start_date is None or r.date >= start_date) and (end_date is None or r.date <= end_date)
+    ])
+    return df
+
+def daily_production_figure(df_milk):
+    fig = px.line(df_milk.groupby("Date").sum().reset_index(),
+                  x="Date", y="Liters",
+                  title="Daily Milk Production",
+                  height=400)
+    fig.update_layout(hovermode="x unified",
+                      xaxis=dict(rangeslider=dict(visible=True)))
+    return fig
+
+def animal_performance_frame(animals, milk_records, today, totals=None):
+    """
+    One row per animal with age and total milk. Totals are grouped from
+    milk_records in pandas unless already given as an animal_id-indexed Series.
+    """
+    if totals is None:
+        totals = (pd.DataFrame(milk_records).groupby("animal_id")["quantity_liters"].sum()
+                  if milk_records else pd.Series(dtype=float))
+    df = pd.DataFrame([{
+        "ID": a.id,
+        "Name": a.name,
+        "Breed": a.breed,
+        "Age": (today - a.date_of_birth).days // 365,
+    } for a in animals])
+    if not df.empty:
+        df["Total Milk"] = df["ID"].map(totals).fillna(0.0)
+    return df
+
+def top_producers_figure(animal_df, n=5):
+    top = animal_df.sort_values("Total Milk", ascending=False).head(n)
+    return px.bar(top, x="Name", y="Total Milk", color="Breed",
+                  text_auto=".1f", height=300)
+
+def breed_productivity_figure(animal_df):
+    breed_stats = animal_df.groupby("Breed").agg(
+        Total_Milk=("Total Milk", "sum"),
+        Avg_Milk=("Total Milk", "mean"),
+        Count=("Breed", "count")
+    ).reset_index()
+    return px.scatter(breed_stats, x="Count", y="Avg_Milk", size="Total_Milk",
+                      color="Breed", hover_name="Breed", size_max=40)
+
+def age_production_figure(animal_df):
+    return px.scatter(animal_df, x="Age", y="Total Milk", color="Breed",
+                      hover_data=["Name"], trendline="lowess")
+
+def animal_milk_timeline_figure(profile):
+    """Daily milk for one animal, with withheld days, treatments and lifecycle events marked."""
+    df = pd.DataFrame([{"Date": r.date, "Liters": r.quantity_liters, "Withheld": r.withheld}
+                       for r in profile.milk])
+    fig = go.Figure()
+    if not df.empty:
+        daily = df.groupby("Date").agg(Liters=("Liters", "sum"), Withheld=("Withheld", "any")).reset_index()
+        fig.add_trace(go.Scatter(x=daily["Date"], y=daily["Liters"], mode="lines+markers", name="Milk (L)"))
+        withheld = daily[daily["Withheld"]]
+        if not withheld.empty:
+            fig.add_trace(go.Scatter(x=withheld["Date"], y=withheld["Liters"], mode="markers", name="Withheld",
+                                     marker=dict(color="#e74c3c", size=9, symbol="x")))
+    if profile.medicine:
+        fig.add_trace(go.Scatter(x=[m.date for m in profile.medicine], y=[0] * len(profile.medicine),
+                                 mode="markers", name="Treatment", text=[m.medicine_name for m in profile.medicine],
+                                 marker=dict(color="#8e44ad", size=11, symbol="triangle-up")))
+    for event in profile.events:
+        fig.add_vline(x=event.date, line_dash="dot", line_color="#7f8c8d")
+        fig.add_annotation(x=event.date, y=1, yref="paper", text=event.event_type, showarrow=False,
+                           textangle=-90, xanchor="right", yanchor="top", font=dict(size=10))
+    fig.update_layout(title="Milk Timeline", height=400, hovermode="x unified")
+    return fig
+
+def animal_feed_timeline_figure(profile):
+    df = pd.DataFrame([{"Date": r.date, "Feed Type": r.feed_type, "Kg": r.quantity_kg} for r in profile.feed])
+    return px.bar(df, x="Date", y="Kg", color="Feed Type", title="Feed Timeline", height=350)
@@ -0,0 +1,91 @@
+import streamlit as st
+from sqlalchemy.exc import OperationalError
+from crud import get_db_session, get_all_animal_names, search_animal_names
+import write_journal
+import validation
+
+# Pickers only ever list this many animals; type-ahead narrows the rest
+PICKER_LIMIT = 50
+
+# Last animal list seen per farm, so pickers keep working while the central database is unreachable
+_offline_options = {}
+
+def animal_picker_options(farm, key):
+    """Render a type-ahead search box and return ({name: id} of matching animals, search text)."""
+    search = st.text_input(
+        "🔎 Find Animal",
+        key=key,
+        placeholder="Type a name, breed, note or #tag",
+        help=f"Shows the first {PICKER_LIMIT} matching animals"
+    ).strip()
+    try:
+        with get_db_session(farm) as db:
+            if search:
+                options = search_animal_names(db, search, PICKER_LIMIT)
+            else:
+                options = get_all_animal_names(db, PICKER_LIMIT)
+                _offline_options[farm] = options
+    except OperationalError:
+        if farm not in _offline_options:
+            raise
+        options = [(id, name) for id, name in _offline_options[farm] if search.lower() in name.lower()]
+    return {name: id for id, name in options}, search
+
+def journal_sync_panel(farm):
+    """Show entries saved offline on this terminal, with a button to sync them to the central database."""
+    waiting = len(write_journal.pending(farm))
+    if not waiting:
+        return
+    st.info(f"📴 {waiting} entries saved offline on this terminal are waiting to sync")
+    if st.button("🔄 Sync Offline Entries", key=f"journal_sync_{farm}"):
+        try:
+            result = write_journal.replay(farm)
+        except OperationalError:
+            st.error("Central database is still unreachable - entries remain queued")
+            return
+        st.success(f"✅ Synced {result.applied} entries ({result.duplicates} already present)")
+        if result.quarantined:
+            st.warning(f"🚧 {result.quarantined} entries failed validation and were quarantined for review")
+        if result.conflicts:
+            st.warning(f"⚠️ {len(result.conflicts)} entries conflict with the central database and were set aside")
+            st.dataframe(
+                {
+                    "Kind": [c["kind"] for c in result.conflicts],
+                    "Animal ID": [c["fields"]["animal_id"] for c in result.conflicts],
+                    "Date": [c["fields"]["date"] for c in result.conflicts],
+                    "Reason": [c["reason"] for c in result.conflicts],
+                    "Queued At": [c["queued_at"] for c in result.conflicts],
+                },
+                use_container_width=True
+            )
+
+def quarantine_review_panel(farm, kind):
+    """List records of `kind` that failed validation, with buttons to store or discard the selected ones."""
+    with get_db_session(farm) as db:
+        held = validation.list_quarantined(db, kind)
+    if not held:
+        return
+    with st.expander(f"🚧 {len(held)} entries quarantined for review"):
+        st.dataframe(
+            {
+                "ID": [q.id for q in held],
+                "Animal ID": [q.animal_id for q in held],
+                "Date": [q.date for q in held],
+                "Quantity": [q.quantity for q in held],
+                "Reasons": [q.reasons for q in held],
+                "Source": [q.source for q in held],
+                "Received": [q.created_on for q in held],
+            },
+            use_container_width=True, hide_index=True
+        )
+        selected = st.multiselect("Entries", options=[q.id for q in held], key=f"quarantine_{kind}_{farm}")
+        cols = st.columns(2)
+        if cols[0].button("✅ Store as Submitted", key=f"quarantine_release_{kind}_{farm}", disabled=not selected):
+            with get_db_session(farm) as db:
+                released = validation.release_quarantined(db, selected)
+            st.success(f"✅ Stored {released} entries")
+            st.rerun()
+        if cols[1].button("🗑️ Discard", key=f"quarantine_discard_{kind}_{farm}", disabled=not selected):
+            with get_db_session(farm) as db:
+                validation.discard_quarantined(db, selected)
+            st.rerun()
@@ -1,8 +1,22 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, Float, ForeignKey
+from sqlalchemy import (create_engine, event, select, Column, Integer, String, Date, Float, Boolean, ForeignKey,
+                        Index, inspect, text, func, literal)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship, Session
+from sqlalchemy.orm import sessionmaker, relationship, selectinload, joinedload, Session
 from contextlib import contextmanager
-from typing import Generator, Any
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_right
+from datetime import date as dt_date, timedelta
+from typing import Generator, Any, NamedTuple, Optional
+import logging
+import numpy as np
+import os
+import re
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
 
 # -----------------------------
 # Database Schema Definitions:
@@ -18,12 +32,16 @@ from typing import Generator, Any
 #   animal_id: Integer, Foreign Key -> Animal.id
 #   date: Date
 #   quantity_liters: Float
+#   withheld: Boolean (inside a medicine withdrawal window)
+#   session: String (one of MILK_SESSIONS, or METER_SESSION for sensor rollups)
+#   unique (animal_id, date, session)
 # FeedRecord:
 #   id: Integer, Primary Key
 #   animal_id: Integer, Foreign Key -> Animal.id
 #   date: Date
 #   feed_type: String
 #   quantity_kg: Float
+#   unique (animal_id, date, feed_type)
 # MedicineRecord:
 #   id: Integer, Primary Key
 #   animal_id: Integer, Foreign Key -> Animal.id
@@ -31,9 +49,89 @@ from typing import Generator, Any
 #   medicine_name: String
 #   dosage: String
 #   reason: String
+# MedicineWithdrawal:
+#   medicine_name: String, Primary Key
+#   milk_withdrawal_days: Integer
+# TableVersion (bumped by triggers on every insert/update/delete):
+#   table_name: String, Primary Key
+#   version: Integer
+# LactationFit (Wood's model y = a * t^b * e^(-c*t), written by analytics.py):
+#   animal_id: Integer, Primary Key, Foreign Key -> Animal.id
+#   a, b, c, peak_day, peak_yield, r_squared: Float
+#   n_records: Integer
+#   fitted_on: Date
+# FeedDelivery:
+#   id: Integer, Primary Key
+#   date: Date
+#   feed_type: String
+#   quantity_kg: Float
+#   supplier: String (optional)
+# FeedStock (running balance kept by triggers on feed_records/feed_deliveries):
+#   feed_type: String, Primary Key
+#   balance_kg: Float
+# JournalReceipt (idempotency keys of offline entries replayed by write_journal.py):
+#   key: String, Primary Key
+#   applied_on: Date
+# LifecycleEvent:
+#   id: Integer, Primary Key
+#   animal_id: Integer, Foreign Key -> Animal.id
+#   date: Date
+#   event_type: String (one of LIFECYCLE_EVENTS)
+#   pregnant: Boolean (pregnancy check result, optional)
+#   notes: String (optional)
+# AnimalLifecycle (derived from an animal's events whenever one is added or removed):
+#   animal_id: Integer, Primary Key, Foreign Key -> Animal.id
+#   status: String (Heifer, Lactating, Dry or Culled)
+#   lactation_number: Integer
+#   last_calving, dry_off_date, last_insemination: Date (optional)
+#   pregnant: Boolean (optional, unknown until checked)
+#   expected_calving, dry_off_due: Date (optional, indexed for calendar queries)
+# AnimalGroup (pen or management group):
+#   id: Integer, Primary Key
+#   name: String, unique
+#   notes: String (optional)
+# GroupMember:
+#   group_id: Integer, Primary Key, Foreign Key -> AnimalGroup.id
+#   animal_id: Integer, Primary Key, Foreign Key -> Animal.id
+# SensorReading (parlour meter readings, WITHOUT ROWID, clustered on (animal_id, ts)):
+#   animal_id: Integer, Primary Key
+#   ts: Integer, Primary Key (unix seconds)
+#   yield_liters, conductivity, flow_rate: Float
+#   duration_s: Integer
+# AnimalMonthYield (running milk totals per animal and month, kept by triggers on milk_records):
+#   month: String, Primary Key (YYYY-MM)
+#   animal_id: Integer, Primary Key
+#   liters: Float
+#   days: Integer (days with at least one milk record)
+# YieldSketch (KLL quantile sketch of animals' average daily yields, see sketches.py):
+#   month: String, Primary Key (YYYY-MM)
+#   breed: String, Primary Key ('*' for the whole herd)
+#   sketch: String (JSON)
+# StaleSketchMonth (months whose yield sketches predate a milk write, flagged by triggers on milk_records):
+#   month: String, Primary Key (YYYY-MM)
+# QuarantinedRecord (milk/feed entries rejected by validation.py or set aside by a schema upgrade, awaiting review):
+#   id: Integer, Primary Key
+#   kind: String ('milk' or 'feed')
+#   animal_id: Integer (not a foreign key; unknown animals are quarantined too)
+#   date: Date
+#   quantity: Float
+#   payload: String (JSON of the submitted fields)
+#   reasons: String ('; '-separated rule names)
+#   source: String (form, api, async, journal, sensors, upgrade, ...)
+#   created_on: Date
 
 Base = declarative_base()
 
+# Milking sessions; 'Daily' holds a whole day's total
+MILK_SESSIONS = ('Daily', 'Morning', 'Midday', 'Evening')
+# Whole-day totals rolled up from parlour meter readings by sensors.py; kept
+# apart from manual entries and not offered for them
+METER_SESSION = 'Meter'
+
+LIFECYCLE_EVENTS = ('Calving', 'Dry-off', 'Insemination', 'Pregnancy check', 'Cull')
+GESTATION_DAYS = 283
+DRY_PERIOD_DAYS = 60
+
 class Animal(Base):
     __tablename__ = 'animals'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -45,6 +143,10 @@ class Animal(Base):
     milk_records = relationship('MilkRecord', back_populates='animal', cascade='all, delete-orphan')
     feed_records = relationship('FeedRecord', back_populates='animal', cascade='all, delete-orphan')
     medicine_records = relationship('MedicineRecord', back_populates='animal', cascade='all, delete-orphan')
+    lactation_fit = relationship('LactationFit', uselist=False, cascade='all, delete-orphan')
+    lifecycle_events = relationship('LifecycleEvent', cascade='all, delete-orphan')
+    lifecycle = relationship('AnimalLifecycle', uselist=False, cascade='all, delete-orphan')
+    group_memberships = relationship('GroupMember', cascade='all, delete-orphan')
 
 class MilkRecord(Base):
     __tablename__ = 'milk_records'
@@ -52,9 +154,17 @@ class MilkRecord(Base):
     animal_id = Column(Integer, ForeignKey('animals.id'), nullable=False)
     date = Column(Date, nullable=False)
     quantity_liters = Column(Float, nullable=False)
+    withheld = Column(Boolean, nullable=False, default=False, server_default=text('0'))
+    session = Column(String, nullable=False, default='Daily', server_default=text("'Daily'"))
 
     animal = relationship('Animal', back_populates='milk_records')
 
+    __table_args__ = (
+        Index('ix_milk_records_animal_date', 'animal_id', 'date'),
+        Index('ix_milk_records_date', 'date'),
+        Index('uq_milk_records_animal_date_session', 'animal_id', 'date', 'session', unique=True),
+    )
+
 class FeedRecord(Base):
     __tablename__ = 'feed_records'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -65,6 +175,11 @@ class FeedRecord(Base):
 
     animal = relationship('Animal', back_populates='feed_records')
 
+    __table_args__ = (
+        Index('uq_feed_records_animal_date_type', 'animal_id', 'date', 'feed_type', unique=True),
+        Index('ix_feed_records_date', 'date'),
+    )
+
 class MedicineRecord(Base):
     __tablename__ = 'medicine_records'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -76,15 +191,453 @@ class MedicineRecord(Base):
 
     animal = relationship('Animal', back_populates='medicine_records')
 
+    __table_args__ = (Index('ix_medicine_records_animal_date', 'animal_id', 'date'),)
+
+class MedicineWithdrawal(Base):
+    __tablename__ = 'medicine_withdrawals'
+    medicine_name = Column(String, primary_key=True)
+    milk_withdrawal_days = Column(Integer, nullable=False, default=0)
+
+class TableVersion(Base):
+    __tablename__ = 'table_versions'
+    table_name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class FeedDelivery(Base):
+    __tablename__ = 'feed_deliveries'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    date = Column(Date, nullable=False)
+    feed_type = Column(String, nullable=False)
+    quantity_kg = Column(Float, nullable=False)
+    supplier = Column(String)
+
+class FeedStock(Base):
+    __tablename__ = 'feed_stock'
+    feed_type = Column(String, primary_key=True)
+    balance_kg = Column(Float, nullable=False, default=0.0)
+
+class JournalReceipt(Base):
+    __tablename__ = 'journal_receipts'
+    key = Column(String, primary_key=True)
+    applied_on = Column(Date, nullable=False)
+
+class LactationFit(Base):
+    __tablename__ = 'lactation_fits'
+    animal_id = Column(Integer, ForeignKey('animals.id'), primary_key=True)
+    a = Column(Float, nullable=False)
+    b = Column(Float, nullable=False)
+    c = Column(Float, nullable=False)
+    peak_day = Column(Float)
+    peak_yield = Column(Float)
+    r_squared = Column(Float)
+    n_records = Column(Integer, nullable=False)
+    fitted_on = Column(Date, nullable=False)
+
+class LifecycleEvent(Base):
+    __tablename__ = 'lifecycle_events'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    animal_id = Column(Integer, ForeignKey('animals.id'), nullable=False)
+    date = Column(Date, nullable=False)
+    event_type = Column(String, nullable=False)
+    pregnant = Column(Boolean)
+    notes = Column(String)
+
+    __table_args__ = (Index('ix_lifecycle_events_animal_date', 'animal_id', 'date'),
+                      Index('ix_lifecycle_events_type_date', 'event_type', 'date'))
+
+class AnimalLifecycle(Base):
+    __tablename__ = 'animal_lifecycle'
+    animal_id = Column(Integer, ForeignKey('animals.id'), primary_key=True)
+    status = Column(String, nullable=False, default='Heifer')
+    lactation_number = Column(Integer, nullable=False, default=0)
+    last_calving = Column(Date)
+    dry_off_date = Column(Date)
+    last_insemination = Column(Date)
+    pregnant = Column(Boolean)
+    expected_calving = Column(Date)
+    dry_off_due = Column(Date)
+
+    __table_args__ = (Index('ix_animal_lifecycle_expected_calving', 'expected_calving'),
+                      Index('ix_animal_lifecycle_dry_off_due', 'dry_off_due'))
+
+class AnimalGroup(Base):
+    __tablename__ = 'animal_groups'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False, unique=True)
+    notes = Column(String)
+
+    members = relationship('GroupMember', cascade='all, delete-orphan')
+
+class GroupMember(Base):
+    __tablename__ = 'group_members'
+    group_id = Column(Integer, ForeignKey('animal_groups.id'), primary_key=True)
+    animal_id = Column(Integer, ForeignKey('animals.id'), primary_key=True)
+
+    __table_args__ = (Index('ix_group_members_animal', 'animal_id'),)
+
+class SensorReading(Base):
+    __tablename__ = 'sensor_readings'
+    animal_id = Column(Integer, ForeignKey('animals.id'), primary_key=True)
+    ts = Column(Integer, primary_key=True)
+    yield_liters = Column(Float, nullable=False)
+    conductivity = Column(Float)
+    flow_rate = Column(Float)
+    duration_s = Column(Integer)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+class YieldSketch(Base):
+    __tablename__ = 'yield_sketches'
+    month = Column(String, primary_key=True)
+    breed = Column(String, primary_key=True)
+    sketch = Column(String, nullable=False)
+
+class StaleSketchMonth(Base):
+    __tablename__ = 'stale_sketch_months'
+    month = Column(String, primary_key=True)
+
+class AnimalMonthYield(Base):
+    __tablename__ = 'animal_month_yields'
+    month = Column(String, primary_key=True)
+    animal_id = Column(Integer, primary_key=True)
+    liters = Column(Float, nullable=False)
+    days = Column(Integer, nullable=False)
+
+class QuarantinedRecord(Base):
+    __tablename__ = 'quarantined_records'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)
+    animal_id = Column(Integer)
+    date = Column(Date)
+    quantity = Column(Float)
+    payload = Column(String, nullable=False)
+    reasons = Column(String, nullable=False)
+    source = Column(String, nullable=False)
+    created_on = Column(Date, nullable=False)
+
+    __table_args__ = (Index('ix_quarantined_records_kind', 'kind', 'created_on'),)
+
 # -----------------------------
 # Database Connection & Setup
 # -----------------------------
+# Each farm (site) lives in its own SQLite file. The default farm keeps the
+# original dairy_farm.db; other farms are stored under FARMS_DIR and their
+# engines are created lazily on first use.
 DATABASE_URL = 'sqlite:///dairy_farm.db'
+DEFAULT_FARM = 'default'
+FARMS_DIR = 'farms'
+_FARM_ID_RE = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+
+def _enable_wal(dbapi_connection, connection_record):
+    # WAL lets readers run alongside a writer instead of blocking it
+    dbapi_connection.execute('PRAGMA journal_mode=WAL')
+    dbapi_connection.execute('PRAGMA synchronous=NORMAL')
+
 engine = create_engine(DATABASE_URL, echo=False)
+event.listen(engine, 'connect', _enable_wal)
 SessionLocal = sessionmaker(bind=engine)
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
+_engines = {DEFAULT_FARM: engine}
+_session_factories = {DEFAULT_FARM: SessionLocal}
+_engines_lock = threading.Lock()
+
+def _farm_path(farm_id):
+    return os.path.join(FARMS_DIR, f'{farm_id}.db')
+
+def list_farms():
+    farms = [DEFAULT_FARM]
+    if os.path.isdir(FARMS_DIR):
+        farms += sorted(f[:-3] for f in os.listdir(FARMS_DIR)
+                        if f.endswith('.db') and _FARM_ID_RE.match(f[:-3]) and f[:-3] != DEFAULT_FARM)
+    return farms
+
+def farm_exists(farm_id):
+    return (farm_id in _engines or farm_id == DEFAULT_FARM
+            or (bool(_FARM_ID_RE.match(farm_id)) and os.path.isfile(_farm_path(farm_id))))
+
+def get_engine(farm_id=None, create=False):
+    """Return the engine for a farm, creating its database file only when `create` is set."""
+    farm_id = farm_id or DEFAULT_FARM
+    bind = _engines.get(farm_id)
+    if bind is not None:
+        return bind
+    if not _FARM_ID_RE.match(farm_id):
+        raise ValueError(f"Invalid farm id: {farm_id!r}")
+    with _engines_lock:
+        if farm_id not in _engines:
+            if not create and not farm_exists(farm_id):
+                raise KeyError(f"Unknown farm: {farm_id!r}")
+            os.makedirs(FARMS_DIR, exist_ok=True)
+            bind = create_engine(f'sqlite:///{_farm_path(farm_id)}', echo=False)
+            event.listen(bind, 'connect', _enable_wal)
+            _init_schema(bind)
+            _session_factories[farm_id] = sessionmaker(bind=bind)
+            _engines[farm_id] = bind
+    return _engines[farm_id]
+
+def create_farm(farm_id):
+    return get_engine(farm_id.strip().lower(), create=True)
+
+def init_db(farm_id=None):
+    _init_schema(get_engine(farm_id))
+
+# Full-Text Search
+# -----------------
+# FTS5 external-content indexes over animals and medicine records, kept in
+# sync by triggers. Prefix indexes make type-ahead queries cheap.
+_SEARCH_INDEXES = {
+    'animals_fts': ('animals', ('name', 'breed', 'notes')),
+    'medicine_fts': ('medicine_records', ('medicine_name', 'reason')),
+}
+
+def _create_search_indexes(bind):
+    with bind.begin() as conn:
+        for fts, (table, columns) in _SEARCH_INDEXES.items():
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"),
+                                  {'n': fts}).first()
+            cols = ', '.join(columns)
+            new_cols = ', '.join(f'new.{c}' for c in columns)
+            old_cols = ', '.join(f'old.{c}' for c in columns)
+            conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                              f"{cols}, content='{table}', content_rowid='id', prefix='2 3')"))
+            conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {table} BEGIN "
+                              f"INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_cols}); END"))
+            conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {table} BEGIN "
+                              f"INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END"))
+            conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS trg_{fts}_update AFTER UPDATE ON {table} BEGIN "
+                              f"INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+                              f"INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_cols}); END"))
+            if not exists:
+                # Index rows written before the search index existed
+                conn.execute(text(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')"))
+
+def _fts_query(query):
+    """Turn free text into an FTS5 query matching every word as a prefix."""
+    words = re.findall(r'\w+', query)
+    return ' AND '.join(f'"{w}"*' for w in words)
+
+# Feed Stock Balances
+# --------------------
+# feed_stock holds one running balance per feed type. Triggers adjust it by
+# the delta of every delivery and feed record write (including bulk inserts
+# and upserts), so reading stock is a primary-key lookup, not a sum. Feed
+# that was recorded as fed has been eaten, so deleting feed records (with
+# their animal, or as orphans) leaves stock alone; delete_feed_record puts
+# the quantity back itself, as the one path that corrects a mistaken entry.
+_STOCK_SOURCES = {'feed_deliveries': '+', 'feed_records': '-'}
+
+def _create_stock_triggers(bind):
+    with bind.begin() as conn:
+        seeded = conn.execute(text('SELECT COUNT(*) FROM feed_stock')).scalar()
+        for table, sign in _STOCK_SOURCES.items():
+            add = ("INSERT INTO feed_stock (feed_type, balance_kg) VALUES ({row}.feed_type, {sign}{row}.quantity_kg) "
+                   "ON CONFLICT (feed_type) DO UPDATE SET balance_kg = balance_kg + excluded.balance_kg;")
+            undo = "UPDATE feed_stock SET balance_kg = balance_kg {inverse} {row}.quantity_kg WHERE feed_type = {row}.feed_type;"
+            inverse = '-' if sign == '+' else '+'
+            conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_stock_insert AFTER INSERT ON {table} BEGIN "
+                              f"{add.format(row='new', sign=sign)} END"))
+            if table == 'feed_records':
+                # Databases created before cascades were excluded still have this trigger
+                conn.execute(text(f"DROP TRIGGER IF EXISTS trg_{table}_stock_delete"))
+            else:
+                conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_stock_delete AFTER DELETE ON {table} "
+                                  f"BEGIN {undo.format(row='old', inverse=inverse)} END"))
+            conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_stock_update AFTER UPDATE ON {table} BEGIN "
+                              f"{undo.format(row='old', inverse=inverse)} {add.format(row='new', sign=sign)} END"))
+        if not seeded:
+            # Seed balances from history written before stock tracking existed
+            conn.execute(text(
+                "INSERT OR REPLACE INTO feed_stock (feed_type, balance_kg) "
+                "SELECT feed_type, SUM(qty) FROM ("
+                "  SELECT feed_type, quantity_kg AS qty FROM feed_deliveries"
+                "  UNION ALL SELECT feed_type, -quantity_kg FROM feed_records"
+                ") GROUP BY feed_type"
+            ))
+
+# Monthly Yields
+# ---------------
+# animal_month_yields keeps each animal's milk total and recorded days per
+# month, adjusted by triggers on every milk write like feed_stock, so an
+# animal's average daily yield for a month is a primary-key lookup. Each
+# write also flags its month in stale_sketch_months, so sketches.py rebuilds
+# that month's yield sketches from these rows once rather than per write.
+_MONTH = "strftime('%Y-%m', {row}.date)"
+# The flag uses ON CONFLICT DO NOTHING rather than INSERT OR IGNORE: inside a
+# trigger, an OR clause gives way to the conflict handling of the outer upsert
+_ADD_YIELD = (
+    "INSERT INTO animal_month_yields (month, animal_id, liters, days) "
+    "VALUES ({month}, new.animal_id, new.quantity_liters, 1) "
+    "ON CONFLICT (month, animal_id) DO UPDATE SET liters = liters + excluded.liters, days = days + "
+    "((SELECT COUNT(*) FROM milk_records WHERE animal_id = new.animal_id AND date = new.date) = 1 AND {moved}); "
+    "INSERT INTO stale_sketch_months (month) VALUES ({month}) ON CONFLICT (month) DO NOTHING;"
+).format(month=_MONTH.format(row='new'), moved='{moved}')
+_REMOVE_YIELD = (
+    "UPDATE animal_month_yields SET liters = liters - old.quantity_liters, days = days - "
+    "NOT EXISTS (SELECT 1 FROM milk_records WHERE animal_id = old.animal_id AND date = old.date) "
+    "WHERE month = {month} AND animal_id = old.animal_id; "
+    "DELETE FROM animal_month_yields WHERE month = {month} AND animal_id = old.animal_id AND days <= 0; "
+    "INSERT INTO stale_sketch_months (month) VALUES ({month}) ON CONFLICT (month) DO NOTHING;"
+).format(month=_MONTH.format(row='old'))
+
+def _create_yield_triggers(bind):
+    with bind.begin() as conn:
+        seeded = conn.execute(text('SELECT COUNT(*) FROM animal_month_yields')).scalar()
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS trg_milk_records_yield_insert AFTER INSERT ON milk_records "
+                          f"BEGIN {_ADD_YIELD.format(moved='1')} END"))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS trg_milk_records_yield_delete AFTER DELETE ON milk_records "
+                          f"BEGIN {_REMOVE_YIELD} END"))
+        # A record that stays on the same animal-day does not add a day
+        moved = 'NOT (old.animal_id = new.animal_id AND old.date = new.date)'
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS trg_milk_records_yield_update "
+                          f"AFTER UPDATE OF animal_id, date, quantity_liters ON milk_records "
+                          f"BEGIN {_REMOVE_YIELD} {_ADD_YIELD.format(moved=moved)} END"))
+        if not seeded:
+            seed_month_yields(conn)
+
+def seed_month_yields(conn):
+    """Recompute animal_month_yields from milk_records and flag every month's sketches as stale."""
+    conn.execute(text('DELETE FROM animal_month_yields'))
+    conn.execute(text("INSERT INTO animal_month_yields (month, animal_id, liters, days) "
+                      "SELECT strftime('%Y-%m', date), animal_id, SUM(quantity_liters), COUNT(DISTINCT date) "
+                      "FROM milk_records GROUP BY 1, 2"))
+    conn.execute(text("INSERT OR IGNORE INTO stale_sketch_months (month) "
+                      "SELECT DISTINCT month FROM animal_month_yields"))
+
+# Read/Write Split
+# -----------------
+# Dashboards and exports read through a separate read-only engine so long
+# analytic queries never hold locks on the primary. When
+# READ_SNAPSHOT_INTERVAL is set (seconds), reads go to a snapshot copy made
+# with the SQLite online backup API and refreshed at most that often.
+READ_SNAPSHOT_INTERVAL = int(os.environ.get('DAIRY_READ_SNAPSHOT_INTERVAL', '0'))
+SNAPSHOTS_DIR = 'snapshots'
+
+_read_engines = {}
+_read_session_factories = {}
+_snapshot_times = {}
+_read_lock = threading.Lock()
+
+def _snapshot_path(farm_id):
+    return os.path.join(SNAPSHOTS_DIR, f'{farm_id}.db')
+
+def _read_only_engine(path):
+    uri = f'file:{os.path.abspath(path)}?mode=ro'
+    return create_engine(f'sqlite:///{path}', echo=False,
+                         creator=lambda: sqlite3.connect(uri, uri=True, check_same_thread=False))
+
+def refresh_snapshot(farm_id=None):
+    """Copy a farm's primary database into its read snapshot using the online backup API."""
+    farm_id = farm_id or DEFAULT_FARM
+    source_path = get_engine(farm_id).url.database
+    target_path = _snapshot_path(farm_id)
+    os.makedirs(SNAPSHOTS_DIR, exist_ok=True)
+    tmp_path = target_path + '.tmp'
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(tmp_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    os.replace(tmp_path, target_path)
+    _snapshot_times[farm_id] = time.monotonic()
+    read_engine = _read_engines.get(farm_id)
+    if read_engine is not None:
+        # Drop pooled connections still pointing at the replaced file
+        read_engine.dispose()
+        _withdrawal_indexes.pop(str(read_engine.url), None)
+
+def get_read_engine(farm_id=None):
+    farm_id = farm_id or DEFAULT_FARM
+    with _read_lock:
+        if READ_SNAPSHOT_INTERVAL > 0:
+            last = _snapshot_times.get(farm_id)
+            if last is None or time.monotonic() - last >= READ_SNAPSHOT_INTERVAL:
+                refresh_snapshot(farm_id)
+        if farm_id not in _read_engines:
+            # Open the primary once so WAL shared-memory files exist for read-only connections
+            with get_engine(farm_id).connect():
+                pass
+            path = _snapshot_path(farm_id) if READ_SNAPSHOT_INTERVAL > 0 else get_engine(farm_id).url.database
+            _read_engines[farm_id] = _read_only_engine(path)
+            _read_session_factories[farm_id] = sessionmaker(bind=_read_engines[farm_id])
+    return _read_engines[farm_id]
+
+# Tables whose changes are counted in table_versions, for ETags and caches
+VERSIONED_TABLES = ('animals', 'milk_records', 'feed_records', 'medicine_records', 'medicine_withdrawals')
+
+def _init_schema(bind):
+    Base.metadata.create_all(bind=bind)
+    _upgrade_schema(bind)
+    _create_version_triggers(bind)
+    _create_stock_triggers(bind)
+    _create_yield_triggers(bind)
+    _create_search_indexes(bind)
+
+def _create_version_triggers(bind):
+    with bind.begin() as conn:
+        for table in VERSIONED_TABLES:
+            conn.execute(text('INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (:t, 0)'),
+                         {'t': table})
+            for op in ('INSERT', 'UPDATE', 'DELETE'):
+                conn.execute(text(
+                    f'CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{op.lower()} AFTER {op} ON {table} '
+                    f"BEGIN UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}'; END"
+                ))
+
+def _upgrade_schema(bind):
+    """Add columns and indexes introduced after a database file was first created."""
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(bind.dialect)}'
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    ddl += f' DEFAULT {getattr(default, "text", default)}'
+                    if not column.nullable:
+                        ddl += ' NOT NULL'
+                conn.execute(text(ddl))
+            existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                if index.unique and table.name in _MERGE_ON_UPGRADE:
+                    _merge_duplicates(conn, table.name, [c.name for c in index.columns],
+                                      *_MERGE_ON_UPGRADE[table.name])
+                index.create(conn)
+
+# Quarantine kind and quantity column of each table whose legacy rows may
+# collide on a new natural key
+_MERGE_ON_UPGRADE = {'milk_records': ('milk', 'quantity_liters'), 'feed_records': ('feed', 'quantity_kg')}
+
+def _merge_duplicates(conn, table, key_columns, kind, quantity_column):
+    """Collapse rows sharing a natural key before its unique index is created.
+
+    Exact repeats (same quantity) look like double submissions, but may be two
+    real equal deliveries, so the extra copies are moved to quarantined_records
+    for review instead of being deleted. Remaining collisions are summed into
+    the oldest row.
+    """
+    keys = ', '.join(key_columns)
+    same_key = ' AND '.join(f't2.{c} = {table}.{c}' for c in key_columns)
+    repeats = f'id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {keys}, {quantity_column})'
+    payload = ', '.join(f"'{c}', {c}" for c in (*key_columns, quantity_column))
+    moved = conn.execute(text(
+        f'INSERT INTO quarantined_records (kind, animal_id, date, quantity, payload, reasons, source, created_on) '
+        f"SELECT :kind, animal_id, date, {quantity_column}, json_object({payload}), :reasons, 'upgrade', :today "
+        f'FROM {table} WHERE {repeats}'),
+        {'kind': kind, 'reasons': f'exact duplicate of an older {table} row', 'today': dt_date.today().isoformat()}).rowcount
+    conn.execute(text(f'DELETE FROM {table} WHERE {repeats}'))
+    if moved:
+        log.warning("Moved %d exact duplicate %s rows to quarantined_records for review", moved, table)
+    conn.execute(text(f'UPDATE {table} SET {quantity_column} = '
+                      f'(SELECT SUM(t2.{quantity_column}) FROM {table} t2 WHERE {same_key}) '
+                      f'WHERE id IN (SELECT MIN(id) FROM {table} GROUP BY {keys} HAVING COUNT(*) > 1)'))
+    conn.execute(text(f'DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {keys})'))
 
 # -----------------------------
 # CRUD Operations
@@ -118,20 +671,66 @@ def update_animal(db_session, animal_id, **kwargs):
 def delete_animal(db_session, animal_id):
     animal = get_animal(db_session, animal_id)
     if animal:
+        # Readings can run to millions of rows, so delete them in bulk rather than through a cascade
+        db_session.query(SensorReading).filter(SensorReading.animal_id == animal_id).delete()
         db_session.delete(animal)
         db_session.commit()
+        invalidate_withdrawal_index(db_session)
     return animal
 
 # MilkRecord CRUD
 # ----------------
 
-def create_milk_record(db_session, animal_id, date, quantity_liters):
-    record = MilkRecord(animal_id=animal_id, date=date, quantity_liters=quantity_liters)
+def create_milk_record(db_session, animal_id, date, quantity_liters, session='Daily'):
+    withheld = get_withdrawal_index(db_session).is_withheld(animal_id, date)
+    record = MilkRecord(animal_id=animal_id, date=date, quantity_liters=quantity_liters,
+                        session=session, withheld=withheld)
     db_session.add(record)
     db_session.commit()
     db_session.refresh(record)
     return record
 
+def create_milk_records(db_session, records):
+    """Bulk insert milk records given as dicts of animal_id, date and quantity_liters."""
+    index = get_withdrawal_index(db_session)
+    rows = [dict(r, withheld=index.is_withheld(r['animal_id'], r['date'])) for r in records]
+    if rows:
+        db_session.execute(MilkRecord.__table__.insert(), rows)
+        db_session.commit()
+    return len(rows)
+
+def _upsert(db_session, model, row_type, rows, key_columns):
+    """
+    Bulk INSERT ... ON CONFLICT DO UPDATE on a natural key, returning the
+    stored row for each input row. RETURNING rows are matched back to the
+    inputs by key: asking SQLAlchemy to return them in parameter order makes
+    it send one INSERT per row. Rows repeating a key in the batch are
+    collapsed first, the last one winning as it would in sequential upserts.
+    """
+    table = model.__table__
+    stmt = sqlite_insert(table)
+    update = {c: stmt.excluded[c] for c in rows[0] if c not in key_columns}
+    stmt = stmt.on_conflict_do_update(index_elements=key_columns, set_=update).returning(
+        *[table.c[f] for f in row_type._fields])
+    positions = [row_type._fields.index(c) for c in key_columns]
+    unique = list({tuple(r[c] for c in key_columns): r for r in rows}.values())
+    stored = {tuple(row[p] for p in positions): row_type._make(row) for row in db_session.execute(stmt, unique)}
+    db_session.commit()
+    return [stored[tuple(r[c] for c in key_columns)] for r in rows]
+
+def upsert_milk_records(db_session, records):
+    """Idempotently store milk records keyed on (animal_id, date, session); returns MilkRows."""
+    index = get_withdrawal_index(db_session)
+    rows = [dict(r, session=r.get('session') or 'Daily', withheld=index.is_withheld(r['animal_id'], r['date']))
+            for r in records]
+    if not rows:
+        return []
+    return _upsert(db_session, MilkRecord, MilkRow, rows, ['animal_id', 'date', 'session'])
+
+def upsert_milk_record(db_session, animal_id, date, quantity_liters, session='Daily'):
+    return upsert_milk_records(db_session, [{'animal_id': animal_id, 'date': date,
+                                             'quantity_liters': quantity_liters, 'session': session}])[0]
+
 def get_milk_record(db_session, record_id):
     return db_session.query(MilkRecord).filter(MilkRecord.id == record_id).first()
 
@@ -144,6 +743,7 @@ def update_milk_record(db_session, record_id, **kwargs):
         return None
     for key, value in kwargs.items():
         setattr(record, key, value)
+    record.withheld = get_withdrawal_index(db_session).is_withheld(record.animal_id, record.date)
     db_session.commit()
     return record
 
@@ -164,6 +764,25 @@ def create_feed_record(db_session, animal_id, date, feed_type, quantity_kg):
     db_session.refresh(record)
     return record
 
+def create_feed_records(db_session, records):
+    """Bulk insert feed records given as dicts of animal_id, date, feed_type and quantity_kg."""
+    rows = list(records)
+    if rows:
+        db_session.execute(FeedRecord.__table__.insert(), rows)
+        db_session.commit()
+    return len(rows)
+
+def upsert_feed_records(db_session, records):
+    """Idempotently store feed records keyed on (animal_id, date, feed_type); returns FeedRows."""
+    rows = [dict(r) for r in records]
+    if not rows:
+        return []
+    return _upsert(db_session, FeedRecord, FeedRow, rows, ['animal_id', 'date', 'feed_type'])
+
+def upsert_feed_record(db_session, animal_id, date, feed_type, quantity_kg):
+    return upsert_feed_records(db_session, [{'animal_id': animal_id, 'date': date,
+                                             'feed_type': feed_type, 'quantity_kg': quantity_kg}])[0]
+
 def get_feed_record(db_session, record_id):
     return db_session.query(FeedRecord).filter(FeedRecord.id == record_id).first()
 
@@ -180,8 +799,11 @@ def update_feed_record(db_session, record_id, **kwargs):
     return record
 
 def delete_feed_record(db_session, record_id):
+    """Delete a mistaken feed entry and return its quantity to stock."""
     record = get_feed_record(db_session, record_id)
     if record:
+        db_session.query(FeedStock).filter(FeedStock.feed_type == record.feed_type).update(
+            {FeedStock.balance_kg: FeedStock.balance_kg + record.quantity_kg})
         db_session.delete(record)
         db_session.commit()
     return record
@@ -195,6 +817,7 @@ def create_medicine_record(db_session, animal_id, date, medicine_name, dosage, r
     db_session.add(record)
     db_session.commit()
     db_session.refresh(record)
+    refresh_withheld_milk(db_session, animal_id)
     return record
 
 def get_medicine_record(db_session, record_id):
@@ -207,36 +830,608 @@ def update_medicine_record(db_session, record_id, **kwargs):
     record = get_medicine_record(db_session, record_id)
     if not record:
         return None
+    previous_animal_id = record.animal_id
     for key, value in kwargs.items():
         setattr(record, key, value)
     db_session.commit()
+    refresh_withheld_milk(db_session, previous_animal_id)
+    if record.animal_id != previous_animal_id:
+        refresh_withheld_milk(db_session, record.animal_id)
     return record
 
 def delete_medicine_record(db_session, record_id):
     record = get_medicine_record(db_session, record_id)
     if record:
+        animal_id = record.animal_id
         db_session.delete(record)
         db_session.commit()
+        refresh_withheld_milk(db_session, animal_id)
     return record
 
+# Medicine Withdrawal Periods
+# ----------------------------
+# Milk from a treated animal is withheld for `milk_withdrawal_days` days
+# starting on the treatment date. Active windows are kept in an in-memory
+# interval index per database so new milk records are flagged in O(log n).
+# The index is tagged with the table_versions counters of medicine_records and
+# medicine_withdrawals, so treatments written by another process (the API, the
+# journal replay CLI) are picked up on the next lookup.
+
+class WithdrawalIndex:
+    """Sorted, merged withdrawal windows per animal, queried with bisect."""
+
+    def __init__(self, windows):
+        self._starts = {}
+        self._ends = {}
+        for animal_id, start, end in sorted(windows):
+            starts = self._starts.setdefault(animal_id, [])
+            ends = self._ends.setdefault(animal_id, [])
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+    def is_withheld(self, animal_id, day):
+        starts = self._starts.get(animal_id)
+        if not starts:
+            return False
+        i = bisect_right(starts, day) - 1
+        return i >= 0 and day < self._ends[animal_id][i]
+
+    def withheld_until(self, animal_id, day):
+        """Return the first day milk is saleable again, or None if not withheld on `day`."""
+        starts = self._starts.get(animal_id)
+        if not starts:
+            return None
+        i = bisect_right(starts, day) - 1
+        if i >= 0 and day < self._ends[animal_id][i]:
+            return self._ends[animal_id][i]
+        return None
+
+    def active_on(self, day):
+        """Return {animal_id: end_date} for every animal withheld on `day`."""
+        active = {}
+        for animal_id in self._starts:
+            end = self.withheld_until(animal_id, day)
+            if end is not None:
+                active[animal_id] = end
+        return active
+
+_withdrawal_indexes = {}
+
+def _withdrawal_key(db_session):
+    return str(db_session.get_bind().url)
+
+def _withdrawal_versions(db_session):
+    return tuple(tuple(row) for row in db_session.query(TableVersion.table_name, TableVersion.version)
+                 .filter(TableVersion.table_name.in_(('medicine_records', 'medicine_withdrawals')))
+                 .order_by(TableVersion.table_name).all())
+
+def get_withdrawal_index(db_session):
+    key = _withdrawal_key(db_session)
+    versions = _withdrawal_versions(db_session)
+    cached = _withdrawal_indexes.get(key)
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    rows = db_session.query(
+        MedicineRecord.animal_id, MedicineRecord.date, MedicineWithdrawal.milk_withdrawal_days
+    ).join(
+        MedicineWithdrawal, func.lower(MedicineRecord.medicine_name) == func.lower(MedicineWithdrawal.medicine_name)
+    ).filter(MedicineWithdrawal.milk_withdrawal_days > 0).all()
+    index = WithdrawalIndex((a, d, d + timedelta(days=n)) for a, d, n in rows)
+    _withdrawal_indexes[key] = (versions, index)
+    return index
+
+def invalidate_withdrawal_index(db_session):
+    _withdrawal_indexes.pop(_withdrawal_key(db_session), None)
+
+_REFRESH_WITHHELD_SQL = """
+UPDATE milk_records SET withheld = EXISTS (
+    SELECT 1 FROM medicine_records m
+    JOIN medicine_withdrawals w ON lower(m.medicine_name) = lower(w.medicine_name)
+    WHERE m.animal_id = milk_records.animal_id
+      AND w.milk_withdrawal_days > 0
+      AND milk_records.date >= m.date
+      AND milk_records.date < date(m.date, '+' || w.milk_withdrawal_days || ' days')
+)
+"""
+
+def refresh_withheld_milk(db_session, animal_id=None):
+    """Recompute `MilkRecord.withheld` in one statement, for one animal or the whole herd."""
+    invalidate_withdrawal_index(db_session)
+    if animal_id is None:
+        db_session.execute(text(_REFRESH_WITHHELD_SQL))
+    else:
+        db_session.execute(text(_REFRESH_WITHHELD_SQL + ' WHERE animal_id = :animal_id'),
+                           {'animal_id': animal_id})
+    db_session.commit()
+
+def get_withdrawal_periods(db_session):
+    return db_session.query(MedicineWithdrawal).order_by(MedicineWithdrawal.medicine_name).all()
+
+def set_withdrawal_period(db_session, medicine_name, milk_withdrawal_days):
+    period = db_session.query(MedicineWithdrawal).filter(
+        func.lower(MedicineWithdrawal.medicine_name) == medicine_name.strip().lower()
+    ).first()
+    if period:
+        period.milk_withdrawal_days = milk_withdrawal_days
+    else:
+        period = MedicineWithdrawal(medicine_name=medicine_name.strip(), milk_withdrawal_days=milk_withdrawal_days)
+        db_session.add(period)
+    db_session.commit()
+    refresh_withheld_milk(db_session)
+    return period
+
+def get_milk_totals(db_session, start_date=None, end_date=None):
+    """Return (total_liters, withheld_liters) for an optional date range."""
+    query = db_session.query(
+        func.coalesce(func.sum(MilkRecord.quantity_liters), 0.0),
+        func.coalesce(func.sum(MilkRecord.quantity_liters).filter(MilkRecord.withheld), 0.0),
+    )
+    if start_date is not None:
+        query = query.filter(MilkRecord.date >= start_date)
+    if end_date is not None:
+        query = query.filter(MilkRecord.date <= end_date)
+    return query.one()
+
+def get_milk_average(db_session):
+    """Average quantity of a single milk record, or 0 when there are none."""
+    return db_session.query(func.coalesce(func.avg(MilkRecord.quantity_liters), 0.0)).scalar()
+
+# LactationFit CRUD
+# ------------------
+
+def get_lactation_fits(db_session):
+    return db_session.query(LactationFit).all()
+
+# Lifecycle Events
+# -----------------
+# Calving, dry-off, insemination, pregnancy check and cull events. Each
+# animal's derived state (lactation number, expected calving, dry-off due)
+# is recomputed from that animal's events alone whenever one changes, and
+# stored in animal_lifecycle so calendar queries are index range scans.
+
+class CalendarRow(NamedTuple):
+    animal_id: int
+    name: str
+    date: Any
+    lactation_number: int
+
+def _derive_lifecycle(events):
+    """Fold an animal's events (sorted by date) into its animal_lifecycle column values."""
+    state = {'status': 'Heifer', 'lactation_number': 0, 'last_calving': None, 'dry_off_date': None,
+             'last_insemination': None, 'pregnant': None, 'expected_calving': None, 'dry_off_due': None}
+    for event in events:
+        kind = event.event_type
+        if kind == 'Calving':
+            state.update(status='Lactating', lactation_number=state['lactation_number'] + 1,
+                         last_calving=event.date, dry_off_date=None, last_insemination=None, pregnant=None)
+        elif kind == 'Dry-off' and state['status'] == 'Lactating':
+            state.update(status='Dry', dry_off_date=event.date)
+        elif kind == 'Insemination':
+            state.update(last_insemination=event.date, pregnant=None)
+        elif kind == 'Pregnancy check' and state['last_insemination'] is not None:
+            state['pregnant'] = event.pregnant
+        elif kind == 'Cull':
+            state['status'] = 'Culled'
+    if state['last_insemination'] is not None and state['pregnant'] is not False and state['status'] != 'Culled':
+        state['expected_calving'] = state['last_insemination'] + timedelta(days=GESTATION_DAYS)
+        if state['status'] == 'Lactating':
+            state['dry_off_due'] = state['expected_calving'] - timedelta(days=DRY_PERIOD_DAYS)
+    return state
+
+def refresh_lifecycle(db_session, animal_id):
+    """Recompute one animal's derived lifecycle row from its events."""
+    events = (db_session.query(LifecycleEvent).filter(LifecycleEvent.animal_id == animal_id)
+              .order_by(LifecycleEvent.date, LifecycleEvent.id).all())
+    state = _derive_lifecycle(events)
+    stmt = sqlite_insert(AnimalLifecycle).values(animal_id=animal_id, **state)
+    db_session.execute(stmt.on_conflict_do_update(index_elements=['animal_id'], set_=state))
+    db_session.commit()
+
+def create_lifecycle_event(db_session, animal_id, date, event_type, pregnant=None, notes=None):
+    if event_type not in LIFECYCLE_EVENTS:
+        raise ValueError(f"Unknown lifecycle event: {event_type}")
+    event = LifecycleEvent(animal_id=animal_id, date=date, event_type=event_type,
+                           pregnant=pregnant if event_type == 'Pregnancy check' else None, notes=notes)
+    db_session.add(event)
+    db_session.commit()
+    db_session.refresh(event)
+    refresh_lifecycle(db_session, animal_id)
+    return event
+
+def delete_lifecycle_event(db_session, event_id):
+    event = db_session.query(LifecycleEvent).filter(LifecycleEvent.id == event_id).first()
+    if event:
+        animal_id = event.animal_id
+        db_session.delete(event)
+        db_session.commit()
+        refresh_lifecycle(db_session, animal_id)
+    return event
+
+def list_lifecycle_events(db_session, animal_id):
+    return (db_session.query(LifecycleEvent).filter(LifecycleEvent.animal_id == animal_id)
+            .order_by(LifecycleEvent.date.desc(), LifecycleEvent.id.desc()).all())
+
+def get_lifecycle(db_session, animal_id):
+    return db_session.query(AnimalLifecycle).filter(AnimalLifecycle.animal_id == animal_id).first()
+
+def get_days_in_milk(db_session, today=None):
+    """Return {animal_id: days in milk} for every animal currently lactating."""
+    today = today or dt_date.today()
+    rows = db_session.query(AnimalLifecycle.animal_id, AnimalLifecycle.last_calving).filter(
+        AnimalLifecycle.status == 'Lactating')
+    return {animal_id: (today - calved).days for animal_id, calved in rows}
+
+def _calendar(db_session, column, start, end):
+    rows = (db_session.query(AnimalLifecycle.animal_id, Animal.name, column, AnimalLifecycle.lactation_number)
+            .join(Animal, Animal.id == AnimalLifecycle.animal_id)
+            .filter(column.isnot(None), column <= end, *([column >= start] if start else []))
+            .order_by(column))
+    return [CalendarRow._make(r) for r in rows]
+
+def due_to_calve(db_session, days=30, today=None):
+    """Animals expected to calve within the next `days` days."""
+    today = today or dt_date.today()
+    return _calendar(db_session, AnimalLifecycle.expected_calving, today, today + timedelta(days=days))
+
+def dry_off_due(db_session, days=14, today=None):
+    """Lactating animals to dry off within `days` days, including any overdue."""
+    today = today or dt_date.today()
+    return _calendar(db_session, AnimalLifecycle.dry_off_due, None, today + timedelta(days=days))
+
+# Animal Groups
+# --------------
+# Pens are fed and treated as a unit. Batch operations write one record per
+# member with a single INSERT ... SELECT over group_members, so logging a
+# whole pen is one statement however many animals it holds.
+
+class GroupRow(NamedTuple):
+    id: int
+    name: str
+    notes: Optional[str]
+    members: int
+
+def create_group(db_session, name, notes=None, animal_ids=()):
+    group = AnimalGroup(name=name, notes=notes)
+    db_session.add(group)
+    db_session.flush()
+    db_session.add_all(GroupMember(group_id=group.id, animal_id=a) for a in set(animal_ids))
+    db_session.commit()
+    db_session.refresh(group)
+    return group
+
+def list_groups(db_session):
+    rows = (db_session.query(AnimalGroup.id, AnimalGroup.name, AnimalGroup.notes, func.count(GroupMember.animal_id))
+            .outerjoin(GroupMember, GroupMember.group_id == AnimalGroup.id)
+            .group_by(AnimalGroup.id).order_by(AnimalGroup.name))
+    return [GroupRow._make(r) for r in rows]
+
+def get_group_member_ids(db_session, group_id):
+    return [a for (a,) in db_session.query(GroupMember.animal_id)
+            .filter(GroupMember.group_id == group_id).order_by(GroupMember.animal_id)]
+
+def set_group_members(db_session, group_id, animal_ids):
+    """Replace a group's membership with `animal_ids`."""
+    db_session.query(GroupMember).filter(GroupMember.group_id == group_id).delete()
+    db_session.add_all(GroupMember(group_id=group_id, animal_id=a) for a in set(animal_ids))
+    db_session.commit()
+
+def delete_group(db_session, group_id):
+    group = db_session.query(AnimalGroup).filter(AnimalGroup.id == group_id).first()
+    if group:
+        db_session.delete(group)
+        db_session.commit()
+    return group
+
+def _members_of(group_id):
+    return select(GroupMember.animal_id).where(GroupMember.group_id == group_id)
+
+def feed_group(db_session, group_id, date, feed_type, quantity_kg, split=False):
+    """
+    Log a feeding for every member of a group in one INSERT ... SELECT.
+    With `split`, `quantity_kg` is the pen total and is divided evenly among
+    members; otherwise each member gets `quantity_kg`. Upserts on the feed
+    natural key like upsert_feed_records. Returns the number of records written.
+    """
+    per_animal = literal(quantity_kg, Float)
+    if split:
+        per_animal = per_animal / select(func.count()).select_from(GroupMember) \
+            .where(GroupMember.group_id == group_id).scalar_subquery()
+    stmt = sqlite_insert(FeedRecord).from_select(
+        ['animal_id', 'date', 'feed_type', 'quantity_kg'],
+        select(GroupMember.animal_id, literal(date, Date), literal(feed_type, String), per_animal)
+        .where(GroupMember.group_id == group_id),
+    )
+    stmt = stmt.on_conflict_do_update(index_elements=['animal_id', 'date', 'feed_type'],
+                                      set_={'quantity_kg': stmt.excluded.quantity_kg})
+    written = db_session.execute(stmt).rowcount
+    db_session.commit()
+    return written
+
+def treat_group(db_session, group_id, date, medicine_name, dosage, reason):
+    """Log a treatment for every member of a group in one INSERT ... SELECT and flag withheld milk."""
+    stmt = MedicineRecord.__table__.insert().from_select(
+        ['animal_id', 'date', 'medicine_name', 'dosage', 'reason'],
+        select(GroupMember.animal_id, literal(date, Date), literal(medicine_name, String),
+               literal(dosage, String), literal(reason, String))
+        .where(GroupMember.group_id == group_id),
+    )
+    written = db_session.execute(stmt).rowcount
+    db_session.execute(text(_REFRESH_WITHHELD_SQL + ' WHERE animal_id IN '
+                            '(SELECT animal_id FROM group_members WHERE group_id = :group_id)'),
+                       {'group_id': group_id})
+    db_session.commit()
+    invalidate_withdrawal_index(db_session)
+    return written
+
+# Lightweight Read API
+# ---------------------
+# Listing and history pages only read a handful of attributes after the
+# session is closed, so these return plain named tuples built from Core
+# column selects instead of identity-mapped ORM instances.
+
+class AnimalRow(NamedTuple):
+    id: int
+    name: str
+    breed: str
+    date_of_birth: Any
+    notes: Optional[str]
+
+class MilkRow(NamedTuple):
+    id: int
+    animal_id: int
+    date: Any
+    quantity_liters: float
+    withheld: bool
+    session: str
+
+class FeedRow(NamedTuple):
+    id: int
+    animal_id: int
+    date: Any
+    feed_type: str
+    quantity_kg: float
+
+class MedicineRow(NamedTuple):
+    id: int
+    animal_id: int
+    date: Any
+    medicine_name: str
+    dosage: str
+    reason: str
+
+def _rows(db_session, row_type, model, *criteria, order_by=None, limit=None, offset=None):
+    columns = [getattr(model, field) for field in row_type._fields]
+    stmt = select(*columns).where(*criteria)
+    if order_by is not None:
+        stmt = stmt.order_by(order_by, model.id)
+    if limit is not None:
+        stmt = stmt.limit(limit).offset(offset or 0)
+    return [row_type._make(row) for row in db_session.execute(stmt)]
+
+def _date_criteria(model, start_date, end_date):
+    criteria = []
+    if start_date is not None:
+        criteria.append(model.date >= start_date)
+    if end_date is not None:
+        criteria.append(model.date <= end_date)
+    return criteria
+
+def list_animals(db_session):
+    return _rows(db_session, AnimalRow, Animal, order_by=Animal.id)
+
+def list_milk_records(db_session, start_date=None, end_date=None):
+    return _rows(db_session, MilkRow, MilkRecord, *_date_criteria(MilkRecord, start_date, end_date),
+                 order_by=MilkRecord.date)
+
+def list_milk_by_animal(db_session, animal_id, start_date=None, end_date=None, limit=None, offset=None):
+    return _rows(db_session, MilkRow, MilkRecord, MilkRecord.animal_id == animal_id,
+                 *_date_criteria(MilkRecord, start_date, end_date), order_by=MilkRecord.date, limit=limit, offset=offset)
+
+def list_feed_by_animal(db_session, animal_id, start_date=None, end_date=None, limit=None, offset=None):
+    return _rows(db_session, FeedRow, FeedRecord, FeedRecord.animal_id == animal_id,
+                 *_date_criteria(FeedRecord, start_date, end_date), order_by=FeedRecord.date, limit=limit, offset=offset)
+
+def list_medicine_by_animal(db_session, animal_id, start_date=None, end_date=None, limit=None, offset=None):
+    return _rows(db_session, MedicineRow, MedicineRecord, MedicineRecord.animal_id == animal_id,
+                 *_date_criteria(MedicineRecord, start_date, end_date), order_by=MedicineRecord.date, limit=limit, offset=offset)
+
+class AnimalProfile(NamedTuple):
+    animal: AnimalRow
+    milk: list
+    feed: list
+    medicine: list
+    events: list
+    lifecycle: Any
+    lactation_fit: Any
+
+def _as_rows(row_type, records):
+    return sorted((row_type._make(getattr(r, f) for f in row_type._fields) for r in records),
+                  key=lambda r: (r.date, r.id))
+
+def get_animal_profile(db_session, animal_id, start_date=None, end_date=None):
+    """
+    Load one animal with its date-bounded milk, feed, medicine and lifecycle records.
+    Collections are selectin-loaded and the one-to-one rows joined, so a profile
+    costs five queries however many records the animal has. None if unknown.
+    """
+    def bounded(relation, model):
+        criteria = _date_criteria(model, start_date, end_date)
+        return selectinload(relation.and_(*criteria) if criteria else relation)
+
+    animal = (db_session.query(Animal).filter(Animal.id == animal_id)
+              .options(bounded(Animal.milk_records, MilkRecord), bounded(Animal.feed_records, FeedRecord),
+                       bounded(Animal.medicine_records, MedicineRecord),
+                       bounded(Animal.lifecycle_events, LifecycleEvent),
+                       joinedload(Animal.lifecycle), joinedload(Animal.lactation_fit))
+              .populate_existing().first())
+    if animal is None:
+        return None
+    return AnimalProfile(
+        animal=AnimalRow._make(getattr(animal, f) for f in AnimalRow._fields),
+        milk=_as_rows(MilkRow, animal.milk_records),
+        feed=_as_rows(FeedRow, animal.feed_records),
+        medicine=_as_rows(MedicineRow, animal.medicine_records),
+        events=sorted(animal.lifecycle_events, key=lambda e: (e.date, e.id)),
+        lifecycle=animal.lifecycle,
+        lactation_fit=animal.lactation_fit,
+    )
+
+# Feed Inventory
+# ---------------
+
+def create_feed_delivery(db_session, date, feed_type, quantity_kg, supplier=None):
+    delivery = FeedDelivery(date=date, feed_type=feed_type, quantity_kg=quantity_kg, supplier=supplier)
+    db_session.add(delivery)
+    db_session.commit()
+    db_session.refresh(delivery)
+    return delivery
+
+def get_feed_deliveries(db_session, limit=50):
+    return db_session.query(FeedDelivery).order_by(FeedDelivery.date.desc(), FeedDelivery.id.desc()).limit(limit).all()
+
+def delete_feed_delivery(db_session, delivery_id):
+    delivery = db_session.query(FeedDelivery).filter(FeedDelivery.id == delivery_id).first()
+    if delivery:
+        db_session.delete(delivery)
+        db_session.commit()
+    return delivery
+
+def record_stock_count(db_session, date, feed_type, counted_kg):
+    """Reconcile a physical stock count by logging the difference as an adjustment delivery."""
+    current = db_session.query(FeedStock.balance_kg).filter(FeedStock.feed_type == feed_type).scalar() or 0.0
+    return create_feed_delivery(db_session, date, feed_type, counted_kg - current, supplier='Stock count adjustment')
+
+def get_feed_stock(db_session):
+    """Return {feed_type: balance_kg} straight from the running balances."""
+    return dict(db_session.query(FeedStock.feed_type, FeedStock.balance_kg).order_by(FeedStock.feed_type).all())
+
+def forecast_feed_cover(db_session, window_days=14, today=None):
+    """
+    Days of cover per feed type from the average daily use over the last
+    `window_days`. Returns a list of dicts with feed_type, balance_kg,
+    daily_use_kg, days_of_cover and run_out_date (None when not being used).
+    """
+    today = today or dt_date.today()
+    stock = get_feed_stock(db_session)
+    used = dict(db_session.query(FeedRecord.feed_type, func.sum(FeedRecord.quantity_kg))
+                .filter(FeedRecord.date > today - timedelta(days=window_days), FeedRecord.date <= today)
+                .group_by(FeedRecord.feed_type).all())
+    feed_types = sorted(set(stock) | set(used))
+    balance = np.array([stock.get(f, 0.0) for f in feed_types], dtype=float)
+    daily_use = np.array([used.get(f, 0.0) for f in feed_types], dtype=float) / window_days
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(daily_use > 0, np.maximum(balance, 0.0) / daily_use, np.inf)
+    return [{
+        'feed_type': f,
+        'balance_kg': float(b),
+        'daily_use_kg': float(u),
+        'days_of_cover': None if np.isinf(c) else float(c),
+        'run_out_date': None if np.isinf(c) else today + timedelta(days=int(c)),
+    } for f, b, u, c in zip(feed_types, balance, daily_use, cover)]
+
+# Table Versions
+# ---------------
+
+def get_table_version(db_session, table_name):
+    return db_session.query(TableVersion.version).filter(TableVersion.table_name == table_name).scalar() or 0
+
 # Miscellenous CRUD
 # --------------------
 
-def get_all_animal_names(db: Session):
-    return db.query(Animal.id, Animal.name).all()
+def get_all_animal_names(db: Session, limit=None):
+    query = db.query(Animal.id, Animal.name).order_by(Animal.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+# Search
+# -------
+
+def search_animal_names(db_session, query, limit=50):
+    """Type-ahead lookup of (id, name) by name/breed/notes prefix, or by id for numeric tags."""
+    tag = query.strip().lstrip('#')
+    by_id = db_session.query(Animal.id, Animal.name).filter(Animal.id == int(tag)).all() if tag.isdigit() else []
+    match = _fts_query(query)
+    if not match:
+        return by_id
+    rows = db_session.execute(text(
+        'SELECT a.id, a.name FROM animals_fts JOIN animals a ON a.id = animals_fts.rowid '
+        'WHERE animals_fts MATCH :q ORDER BY rank LIMIT :limit'
+    ), {'q': match, 'limit': limit}).all()
+    return by_id + [r for r in rows if not by_id or r[0] != by_id[0][0]]
+
+def search_treatments(db_session, query, limit=200):
+    """Medicine records whose medicine name or reason match every word of `query`, best first."""
+    match = _fts_query(query)
+    if not match:
+        return []
+    fields = ', '.join(f'm.{f}' for f in MedicineRow._fields)
+    stmt = text(
+        f'SELECT {fields} FROM medicine_fts JOIN medicine_records m ON m.id = medicine_fts.rowid '
+        'WHERE medicine_fts MATCH :q ORDER BY rank LIMIT :limit'
+    ).columns(*[getattr(MedicineRecord, f) for f in MedicineRow._fields])
+    rows = db_session.execute(stmt, {'q': match, 'limit': limit})
+    return [MedicineRow._make(r) for r in rows]
+
+# Cross-Farm Aggregates
+# ----------------------
+
+def get_farm_summary(db_session, days=30):
+    since = dt_date.today() - timedelta(days=days)
+    total, withheld = get_milk_totals(db_session, start_date=since)
+    return {
+        'animals': db_session.query(func.count(Animal.id)).scalar(),
+        'breeds': db_session.query(func.count(func.distinct(Animal.breed))).scalar(),
+        'milk_liters': total,
+        'withheld_liters': withheld,
+        'feed_kg': db_session.query(func.coalesce(func.sum(FeedRecord.quantity_kg), 0.0))
+                             .filter(FeedRecord.date >= since).scalar(),
+        'treatments': db_session.query(func.count(MedicineRecord.id))
+                                .filter(MedicineRecord.date >= since).scalar(),
+    }
+
+def get_all_farm_summaries(days=30, max_workers=8):
+    """Query every farm's database in parallel and return {farm_id: summary}."""
+    def summarize(farm_id):
+        with get_read_session(farm_id) as db:
+            return farm_id, get_farm_summary(db, days)
+
+    farms = list_farms()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(farms))) as pool:
+        return dict(pool.map(summarize, farms))
 
 # -----------------------------
 # Utility: Session Context
 # -----------------------------
 @contextmanager
-def get_db_session() -> Generator[Session, Any, None]:
+def get_db_session(farm_id=None) -> Generator[Session, Any, None]:
     """
     Context manager to provide a transactional session and ensure closure.
+    Sessions are bound to the given farm's database (the default farm if omitted).
     Usage:
-        with get_db_session() as db:
+        with get_db_session(farm_id) as db:
             # use db
     """
-    session = SessionLocal()
+    get_engine(farm_id)
+    session = _session_factories[farm_id or DEFAULT_FARM]()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@contextmanager
+def get_read_session(farm_id=None) -> Generator[Session, Any, None]:
+    """
+    Context manager for read-only sessions used by dashboards and exports.
+    Usage:
+        with get_read_session(farm_id) as db:
+            # query db, never commit
+    """
+    get_read_engine(farm_id)
+    session = _read_session_factories[farm_id or DEFAULT_FARM]()
     try:
         yield session
     finally:
@@ -0,0 +1,79 @@
+"""
+Process-wide cache of rendered plotly figure specs.
+
+Figures are keyed by (chart id, parameters, data version), where the data
+version is the table_versions counters of the tables behind the chart, so
+any write produces a new key and stale entries simply age out. Entries are
+stored as JSON specs and evicted least-recently-used once their total size
+passes FIGURE_CACHE_BYTES. The cache lives at module level, so every
+Streamlit session in the server process shares it; a repeat view skips the
+pandas aggregation, the plotly build (including lowess trendlines) and the
+JSON serialization.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+FIGURE_CACHE_BYTES = int(os.environ.get('DAIRY_FIGURE_CACHE_MB', '64')) * 1024 * 1024
+
+
+class FigureCache:
+    def __init__(self, max_bytes=FIGURE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._specs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is None:
+                self.misses += 1
+                return None
+            self._specs.move_to_end(key)
+            self.hits += 1
+            return spec
+
+    def put(self, key, spec):
+        if len(spec) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._specs:
+                self.size -= len(self._specs.pop(key))
+            self._specs[key] = spec
+            self.size += len(spec)
+            while self.size > self.max_bytes:
+                _, evicted = self._specs.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._specs.clear()
+            self.size = 0
+
+    def stats(self):
+        return {'entries': len(self._specs), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = FigureCache()
+
+
+def cached_figure(chart_id, params, version, build):
+    """
+    Return the figure spec (a dict st.plotly_chart accepts) for a chart,
+    calling `build()` to make the plotly figure only on a cache miss.
+    `params` and `version` must be hashable.
+    """
+    key = (chart_id, params, version)
+    spec = _cache.get(key)
+    if spec is None:
+        spec = build().to_json()
+        _cache.put(key, spec)
+    return json.loads(spec)
+
+
+def figure_cache_stats():
+    return _cache.stats()
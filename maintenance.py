@@ -0,0 +1,164 @@
+"""
+Database integrity and maintenance toolkit.
+
+Runs against one farm's database (see crud.get_engine) after crud.init_db
+has brought its schema up to date:
+
+    - PRAGMA quick_check
+    - ANALYZE and PRAGMA optimize to refresh query planner statistics
+    - incremental vacuum, converting the file to auto_vacuum=INCREMENTAL once
+    - orphan detection for records whose animal_id has no matching animal
+    - EXPLAIN QUERY PLAN checks that the key queries use an index
+    - rebuilding the yield sketches of months changed by milk writes (sketches.py)
+    - table and index sizes
+
+Usage:
+    python maintenance.py [--farm FARM | --all-farms] [--delete-orphans] [--json]
+"""
+import argparse
+import json
+
+from sqlalchemy import text
+
+from crud import Base, DEFAULT_FARM, get_db_session, get_engine, init_db, list_farms
+from sketches import update_yield_sketches
+
+# Pages released per incremental vacuum run (0 releases every free page)
+VACUUM_PAGES = 0
+
+# Queries behind the pages and API, checked with EXPLAIN QUERY PLAN
+KEY_QUERIES = {
+    'milk history by animal': ("SELECT * FROM milk_records WHERE animal_id = 1 "
+                               "AND date BETWEEN '2024-01-01' AND '2024-12-31' ORDER BY date"),
+    'milk totals by date': ("SELECT SUM(quantity_liters) FROM milk_records "
+                            "WHERE date BETWEEN '2024-01-01' AND '2024-12-31'"),
+    'feed history by animal': "SELECT * FROM feed_records WHERE animal_id = 1 ORDER BY date",
+    'feed totals by date': "SELECT SUM(quantity_kg) FROM feed_records WHERE date >= '2024-01-01'",
+    'medicine history by animal': "SELECT * FROM medicine_records WHERE animal_id = 1 ORDER BY date",
+    'animal lookup': "SELECT * FROM animals WHERE id = 1",
+    'due to calve': ("SELECT animal_id FROM animal_lifecycle "
+                     "WHERE expected_calving BETWEEN '2024-01-01' AND '2024-01-31'"),
+    'dry-off due': "SELECT animal_id FROM animal_lifecycle WHERE dry_off_due <= '2024-01-31'",
+    'lifecycle events by animal': "SELECT * FROM lifecycle_events WHERE animal_id = 1 ORDER BY date",
+    'sensor readings by animal': ("SELECT * FROM sensor_readings WHERE animal_id = 1 "
+                                  "AND ts >= 1700000000 AND ts < 1700086400 ORDER BY ts"),
+}
+
+
+def _animal_tables():
+    # Only tables whose animal_id references animals: quarantined_records
+    # deliberately keeps records for unknown animals until they are reviewed
+    return [t.name for t in Base.metadata.sorted_tables if 'animal_id' in t.columns
+            and any(fk.column.table.name == 'animals' for fk in t.c.animal_id.foreign_keys)]
+
+
+def find_orphans(conn):
+    """Return {table: count} of rows whose animal_id has no matching animal."""
+    orphans = {}
+    for table in _animal_tables():
+        count = conn.execute(text(
+            f'SELECT COUNT(*) FROM {table} WHERE animal_id NOT IN (SELECT id FROM animals)'
+        )).scalar()
+        if count:
+            orphans[table] = count
+    return orphans
+
+
+def delete_orphans(conn):
+    for table in _animal_tables():
+        conn.execute(text(f'DELETE FROM {table} WHERE animal_id NOT IN (SELECT id FROM animals)'))
+
+
+def check_query_plans(conn):
+    """Return {query name: [plan lines]} for key queries that scan a whole table or index instead of searching it."""
+    full_scans = {}
+    for name, sql in KEY_QUERIES.items():
+        plan = [row[3] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+        scans = [line for line in plan if line.startswith('SCAN')]
+        if scans:
+            full_scans[name] = plan
+    return full_scans
+
+
+def object_sizes(conn):
+    """Return {table or index name: bytes}, using the dbstat table when SQLite provides it."""
+    try:
+        rows = conn.execute(text('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC')).all()
+        return {name: size for name, size in rows}
+    except Exception:
+        page_size = conn.execute(text('PRAGMA page_size')).scalar()
+        page_count = conn.execute(text('PRAGMA page_count')).scalar()
+        return {'(database)': page_size * page_count}
+
+
+def incremental_vacuum(conn):
+    """Release free pages; the first run converts the file to incremental auto-vacuum."""
+    if conn.execute(text('PRAGMA auto_vacuum')).scalar() != 2:
+        conn.execute(text('PRAGMA auto_vacuum = INCREMENTAL'))
+        conn.execute(text('VACUUM'))
+        return 'converted to incremental auto-vacuum (full VACUUM)'
+    freed = conn.execute(text('PRAGMA freelist_count')).scalar()
+    conn.execute(text(f'PRAGMA incremental_vacuum({VACUUM_PAGES})'))
+    return f'released {freed} free pages'
+
+
+def run_maintenance(farm_id=None, remove_orphans=False):
+    """Run every maintenance step on one farm and return a report dict."""
+    farm_id = farm_id or DEFAULT_FARM
+    init_db(farm_id)
+    bind = get_engine(farm_id)
+    report = {'farm': farm_id}
+    # VACUUM and PRAGMA optimize cannot run inside a transaction
+    with bind.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        report['quick_check'] = conn.execute(text('PRAGMA quick_check')).scalar()
+        report['orphans'] = find_orphans(conn)
+        if remove_orphans and report['orphans']:
+            delete_orphans(conn)
+            report['orphans_deleted'] = report['orphans']
+            report['orphans'] = find_orphans(conn)
+        conn.execute(text('ANALYZE'))
+        conn.execute(text('PRAGMA optimize'))
+        report['vacuum'] = incremental_vacuum(conn)
+        report['full_scans'] = check_query_plans(conn)
+        report['sizes'] = object_sizes(conn)
+    with get_db_session(farm_id) as db:
+        report['sketch_months'] = update_yield_sketches(db)
+    return report
+
+
+def format_report(report):
+    lines = [f"== Farm: {report['farm']} ==",
+             f"Integrity: {report['quick_check']}",
+             f"Vacuum: {report['vacuum']}",
+             f"Yield sketches rebuilt: {report['sketch_months']} months"]
+    if report.get('orphans_deleted'):
+        lines.append(f"Orphans deleted: {report['orphans_deleted']}")
+    lines.append(f"Orphans: {report['orphans'] or 'none'}")
+    if report['full_scans']:
+        lines.append("Full table scans:")
+        for name, plan in report['full_scans'].items():
+            lines.append(f"  {name}: {' | '.join(plan)}")
+    else:
+        lines.append("Full table scans: none")
+    lines.append("Sizes:")
+    for name, size in report['sizes'].items():
+        lines.append(f"  {name:<45} {size / 1024:>10.1f} KiB")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Analyze, vacuum and check farm databases")
+    parser.add_argument('--farm', default=None, help="Farm id (default farm if omitted)")
+    parser.add_argument('--all-farms', action='store_true', help="Run on every farm")
+    parser.add_argument('--delete-orphans', action='store_true', help="Delete records with no matching animal")
+    parser.add_argument('--json', action='store_true', help="Print the reports as JSON")
+    args = parser.parse_args()
+
+    farms = list_farms() if args.all_farms else [args.farm or DEFAULT_FARM]
+    reports = [run_maintenance(farm_id, args.delete_orphans) for farm_id in farms]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print('\n\n'.join(format_report(r) for r in reports))
+    if any(r['quick_check'] != 'ok' or r['full_scans'] for r in reports):
+        raise SystemExit(1)
@@ -0,0 +1,280 @@
+"""
+On-disk columnar cache of milk_records for cold-start analytics.
+
+The dashboard's performance and production views only need each record's
+animal, date and quantity, but a fresh process used to pull the whole
+milk_records table through SQLAlchemy before anything rendered. This cache
+keeps those three columns as fixed-width NumPy files under
+COLUMNAR_DIR/<farm>/ (DAIRY_COLUMNAR_DIR, default 'columnar') and opens
+them with numpy.memmap, so a cold start pages in only the columns and
+ranges a query touches, with no parsing:
+
+    animal_id.i4, day.i4, liters.f8   records sorted by (animal_id, date);
+                                      day is date.toordinal()
+    animals.i4, offsets.i8            per-animal index: animal animals[k] owns
+                                      rows offsets[k]:offsets[k + 1]
+    tail_*.i4/.f8                     records inserted since the last
+                                      rebuild, appended in id order
+    meta.json                         row counts, the milk_records id
+                                      high-water mark and table version
+
+`sync_milk_columns` compares the stored high-water mark and table_versions
+counter with the database. If the only changes since are new rows above
+the mark, it appends them to the tail. Any update or delete (including
+an upsert that overwrote a quantity), or a tail larger than
+COMPACT_FRACTION of the base, rebuilds the files into a new generation
+directory. meta.json then switches over atomically, so open memmaps of the
+old generation stay valid. The API batch endpoint appends after each milk
+batch; every other write is picked up by the next `open_milk_columns`.
+
+The app, the API and cron jobs can sync the same farm from separate
+processes, so syncs hold a flock on COLUMNAR_DIR/<farm>/.lock, and
+`open_milk_columns` maps the files before releasing it. Older generations
+are only removed under the lock, so no process can be between reading
+meta.json and opening the files it names. If meta.json names files that
+are missing (the directory was cleared by hand, say), the sync rebuilds.
+
+Usage:
+    python milk_columns.py [--farm FARM] [--rebuild]
+"""
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+
+from crud import DEFAULT_FARM, MilkRecord, get_read_session, get_table_version, init_db
+
+COLUMNAR_DIR = os.environ.get('DAIRY_COLUMNAR_DIR', 'columnar')
+COLUMNS = (('animal_id', np.int32, 'i4'), ('day', np.int32, 'i4'), ('liters', np.float64, 'f8'))
+FETCH_CHUNK = 50000
+# Rebuild once the unsorted tail passes this fraction of the sorted base
+COMPACT_FRACTION = 0.1
+
+# date.toordinal() from SQLite's julian day number (julianday('0001-01-01') = 1721425.5)
+_SELECT_SQL = ("SELECT animal_id, CAST(julianday(date) - 1721424.5 AS INTEGER), quantity_liters "
+               "FROM milk_records {where} ORDER BY {order}")
+
+
+def _farm_dir(farm_id):
+    return os.path.join(COLUMNAR_DIR, farm_id or DEFAULT_FARM)
+
+
+@contextmanager
+def _farm_lock(farm_id):
+    """Exclusive lock on the farm's column files across threads and processes."""
+    farm_dir = _farm_dir(farm_id)
+    os.makedirs(farm_dir, exist_ok=True)
+    with open(os.path.join(farm_dir, '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_meta(farm_id):
+    try:
+        with open(os.path.join(_farm_dir(farm_id), 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _generation_files(farm_id, meta):
+    generation_dir = os.path.join(_farm_dir(farm_id), meta['generation'])
+    names = [f'{prefix}{name}.{ext}' for name, _, ext in COLUMNS for prefix in ('', 'tail_')]
+    return [os.path.join(generation_dir, name) for name in names + ['animals.i4', 'offsets.i8']]
+
+
+def _is_complete(farm_id, meta):
+    return all(os.path.exists(path) for path in _generation_files(farm_id, meta))
+
+
+def _write_meta(farm_id, meta):
+    path = os.path.join(_farm_dir(farm_id), 'meta.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+
+
+def _append_rows(generation_dir, cursor, prefix=''):
+    """Append cursor rows to the column files in chunks; returns (rows written, {animal_id: rows})."""
+    files = {name: open(os.path.join(generation_dir, f'{prefix}{name}.{ext}'), 'ab') for name, _, ext in COLUMNS}
+    written = 0
+    animal_counts = {}
+    try:
+        while True:
+            rows = cursor.fetchmany(FETCH_CHUNK)
+            if not rows:
+                break
+            # Transposing the rows first is far faster than np.array over Row objects
+            columns = [np.array(values, dtype=dtype) for values, (_, dtype, _) in zip(zip(*rows), COLUMNS)]
+            for column, (name, _, _) in zip(columns, COLUMNS):
+                column.tofile(files[name])
+            ids, counts = np.unique(columns[0], return_counts=True)
+            for animal_id, count in zip(ids.tolist(), counts.tolist()):
+                animal_counts[animal_id] = animal_counts.get(animal_id, 0) + count
+            written += len(rows)
+    finally:
+        for f in files.values():
+            f.close()
+    return written, animal_counts
+
+
+def _rebuild(farm_id, db_session, max_id, version):
+    farm_dir = _farm_dir(farm_id)
+    generation = f'g{time.time_ns()}'
+    generation_dir = os.path.join(farm_dir, generation)
+    os.makedirs(generation_dir)
+    cursor = db_session.connection().exec_driver_sql(
+        _SELECT_SQL.format(where='WHERE id <= ?', order='animal_id, date'), (max_id,))
+    rows, animal_counts = _append_rows(generation_dir, cursor)
+    animals = np.array(sorted(animal_counts), dtype=np.int32)
+    offsets = np.zeros(len(animals) + 1, dtype=np.int64)
+    np.cumsum([animal_counts[a] for a in animals.tolist()], out=offsets[1:])
+    animals.tofile(os.path.join(generation_dir, 'animals.i4'))
+    offsets.tofile(os.path.join(generation_dir, 'offsets.i8'))
+    for name, _, ext in COLUMNS:
+        open(os.path.join(generation_dir, f'tail_{name}.{ext}'), 'wb').close()
+    meta = {'generation': generation, 'rows': rows, 'animals': len(animals), 'tail_rows': 0,
+            'max_id': max_id, 'version': version}
+    _write_meta(farm_id, meta)
+    # Readers map under the lock, so none is between reading meta.json and opening
+    # its files; open memmaps keep the unlinked files alive until they are closed
+    for name in os.listdir(farm_dir):
+        if name != generation and os.path.isdir(os.path.join(farm_dir, name)):
+            shutil.rmtree(os.path.join(farm_dir, name), ignore_errors=True)
+    return meta
+
+
+def _append_tail(farm_id, db_session, meta, max_id, version):
+    generation_dir = os.path.join(_farm_dir(farm_id), meta['generation'])
+    cursor = db_session.connection().exec_driver_sql(
+        _SELECT_SQL.format(where='WHERE id > ? AND id <= ?', order='id'), (meta['max_id'], max_id))
+    appended, _ = _append_rows(generation_dir, cursor, 'tail_')
+    meta = dict(meta, tail_rows=meta['tail_rows'] + appended, max_id=max_id, version=version)
+    _write_meta(farm_id, meta)
+    return meta
+
+
+def sync_milk_columns(farm_id=None, rebuild=False, append_only=False):
+    """
+    Bring the farm's column files up to date with milk_records and return the
+    meta dict. With append_only, a sync that would need a rebuild is left for
+    the next reader, so write paths never pay for a full table scan.
+    """
+    farm_id = farm_id or DEFAULT_FARM
+    with _farm_lock(farm_id):
+        return _sync(farm_id, rebuild, append_only)
+
+
+def _sync(farm_id, rebuild=False, append_only=False):
+    # Callers hold the farm lock
+    with get_read_session(farm_id) as db:
+        # One read transaction, so the counts, mark and rows all come from the same snapshot
+        version = get_table_version(db, 'milk_records')
+        max_id, count = db.query(func.coalesce(func.max(MilkRecord.id), 0), func.count(MilkRecord.id)).one()
+        meta = None if rebuild else _read_meta(farm_id)
+        if meta and not _is_complete(farm_id, meta):
+            meta = None
+        if meta and meta['version'] == version:
+            return meta
+        new_rows = count - meta['rows'] - meta['tail_rows'] if meta else 0
+        inserts_only = (meta is not None and max_id >= meta['max_id'] and new_rows == version - meta['version']
+                        and db.query(func.count(MilkRecord.id)).filter(MilkRecord.id > meta['max_id']).scalar()
+                        == new_rows)
+        if inserts_only and meta['tail_rows'] + new_rows <= COMPACT_FRACTION * max(meta['rows'], FETCH_CHUNK):
+            return _append_tail(farm_id, db, meta, max_id, version)
+        if append_only:
+            return meta
+        return _rebuild(farm_id, db, max_id, version)
+
+
+def _memmap(path, dtype, length):
+    # numpy cannot map an empty file
+    return np.memmap(path, dtype=dtype, mode='r', shape=(length,)) if length else np.empty(0, dtype=dtype)
+
+
+class MilkColumns:
+    """Read-only view of one generation of the column files."""
+
+    def __init__(self, farm_id, meta):
+        generation_dir = os.path.join(_farm_dir(farm_id), meta['generation'])
+        self.meta = meta
+        for name, dtype, ext in COLUMNS:
+            setattr(self, name, _memmap(os.path.join(generation_dir, f'{name}.{ext}'), dtype, meta['rows']))
+            setattr(self, f'tail_{name}', _memmap(os.path.join(generation_dir, f'tail_{name}.{ext}'), dtype,
+                                                  meta['tail_rows']))
+        self.animals = _memmap(os.path.join(generation_dir, 'animals.i4'), np.int32, meta['animals'])
+        self.offsets = _memmap(os.path.join(generation_dir, 'offsets.i8'), np.int64, meta['animals'] + 1) \
+            if meta['animals'] else np.zeros(1, dtype=np.int64)
+
+    def __len__(self):
+        return self.meta['rows'] + self.meta['tail_rows']
+
+    def for_animal(self, animal_id):
+        """(day ordinals, liters) of one animal, reading only its slice of the base."""
+        k = np.searchsorted(self.animals, animal_id)
+        if k < len(self.animals) and self.animals[k] == animal_id:
+            start, end = self.offsets[k], self.offsets[k + 1]
+            days, liters = self.day[start:end], self.liters[start:end]
+        else:
+            days, liters = self.day[:0], self.liters[:0]
+        in_tail = self.tail_animal_id == animal_id
+        return np.concatenate([days, self.tail_day[in_tail]]), np.concatenate([liters, self.tail_liters[in_tail]])
+
+    def totals_by_animal(self):
+        """{animal_id: total liters}; reads only the liters column and the index."""
+        totals = pd.Series(np.add.reduceat(self.liters, self.offsets[:-1]) if len(self.animals) else [],
+                           index=np.asarray(self.animals), dtype=float)
+        if self.meta['tail_rows']:
+            tail = pd.Series(self.tail_liters).groupby(np.asarray(self.tail_animal_id)).sum()
+            totals = totals.add(tail, fill_value=0.0)
+        return totals
+
+    def frame(self, start_date=None, end_date=None):
+        """DataFrame of animal_id/Date/Liters in date order, like list_milk_records(start, end) would give."""
+        parts = []
+        for animal_id, day, liters in ((self.animal_id, self.day, self.liters),
+                                       (self.tail_animal_id, self.tail_day, self.tail_liters)):
+            mask = np.ones(len(day), dtype=bool)
+            if start_date is not None:
+                mask &= day >= start_date.toordinal()
+            if end_date is not None:
+                mask &= day <= end_date.toordinal()
+            parts.append((animal_id[mask], day[mask], liters[mask]))
+        animal_id, day, liters = (np.concatenate(column) for column in zip(*parts))
+        order = np.argsort(day, kind='stable')
+        days = day[order]
+        # Convert each distinct day once rather than every record
+        unique_days, positions = np.unique(days, return_inverse=True)
+        dates = np.array([date.fromordinal(int(d)) for d in unique_days], dtype=object)
+        return pd.DataFrame({'animal_id': animal_id[order], 'Date': dates[positions], 'Liters': liters[order]})
+
+
+def open_milk_columns(farm_id=None):
+    """Sync and open the farm's milk columns."""
+    farm_id = farm_id or DEFAULT_FARM
+    # Map the files before releasing the lock, so another process cannot remove them in between
+    with _farm_lock(farm_id):
+        return MilkColumns(farm_id, _sync(farm_id))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or refresh the columnar milk cache")
+    parser.add_argument('--farm', default=DEFAULT_FARM)
+    parser.add_argument('--rebuild', action='store_true', help="Rewrite the files even if they are current")
+    args = parser.parse_args()
+    init_db(args.farm)
+    started = time.perf_counter()
+    meta = sync_milk_columns(args.farm, rebuild=args.rebuild)
+    print(f"{meta['rows']} sorted + {meta['tail_rows']} tail rows for {meta['animals']} animals "
+          f"(high-water id {meta['max_id']}) in {time.perf_counter() - started:.2f}s")
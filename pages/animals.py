@@ -1,8 +1,12 @@
 import streamlit as st
-from crud import get_db_session, create_animal, get_all_animals, delete_animal
+from crud import (get_db_session, get_read_session, DEFAULT_FARM, create_animal, list_animals, delete_animal,
+                  create_lifecycle_event, due_to_calve, dry_off_due, LIFECYCLE_EVENTS)
+from components import animal_picker_options
+from sketches import get_percentile_ranks, percentile_badge, refresh_yield_sketches
 from datetime import date
 
 def show_animals():
+    farm = st.query_params.get("farm", DEFAULT_FARM)
     st.markdown("## 🐄 Animal Management", unsafe_allow_html=True)
     st.markdown("---")
 
@@ -20,29 +24,81 @@ def show_animals():
                     st.warning("Please fill out both Name and Breed fields.")
                 else:
                     try:
-                        with get_db_session() as db:
+                        with get_db_session(farm) as db:
                             animal = create_animal(db, name, breed, dob, notes)
                             st.success(f"✅ Successfully added animal **{animal.name}** (ID: {animal.id})")
                     except Exception as e:
                         st.error(f"🚨 Failed to add animal. Error: {e}")
 
+    st.markdown("### 🗓️ Breeding & Lifecycle")
+    try:
+        with st.expander("➕ Record Lifecycle Event", expanded=False):
+            animal_dict, search = animal_picker_options(farm, "lifecycle_animal_search")
+            if animal_dict:
+                with st.form("lifecycle_form", clear_on_submit=True):
+                    cols = st.columns(3)
+                    with cols[0]:
+                        selected_animal = st.selectbox("Select Animal", options=list(animal_dict.keys()))
+                    with cols[1]:
+                        event_type = st.selectbox("Event", options=LIFECYCLE_EVENTS)
+                    with cols[2]:
+                        event_date = st.date_input("Date", value=date.today(), max_value=date.today())
+                    pregnant = st.checkbox("Confirmed pregnant", help="Only used for pregnancy checks")
+                    event_notes = st.text_input("📝 Notes (optional)")
+                    if st.form_submit_button("📩 Save Event"):
+                        with get_db_session(farm) as db:
+                            create_lifecycle_event(db, animal_dict[selected_animal], event_date, event_type,
+                                                   pregnant, event_notes.strip() or None)
+                        st.success(f"✅ {event_type} recorded for {selected_animal}")
+            else:
+                st.warning("No animals match your search." if search else "No animals registered yet.")
+
+        with get_read_session(farm) as db:
+            calving = due_to_calve(db, days=30)
+            drying = dry_off_due(db, days=14)
+        cols = st.columns(2)
+        with cols[0]:
+            st.markdown("##### 🍼 Due to Calve (next 30 days)")
+            if calving:
+                st.dataframe({"Name": [r.name for r in calving],
+                              "Expected": [r.date.strftime("%Y-%m-%d") for r in calving],
+                              "Lactation": [r.lactation_number + 1 for r in calving]},
+                             use_container_width=True)
+            else:
+                st.caption("No calvings expected")
+        with cols[1]:
+            st.markdown("##### 🌾 Dry-off Due (next 14 days)")
+            if drying:
+                st.dataframe({"Name": [r.name for r in drying],
+                              "Dry-off By": [r.date.strftime("%Y-%m-%d") for r in drying],
+                              "Overdue": ["Yes" if r.date < date.today() else "" for r in drying]},
+                             use_container_width=True)
+            else:
+                st.caption("No dry-offs due")
+    except Exception as e:
+        st.error(f"❌ Failed to load lifecycle data: {e}")
+
     st.markdown("### 📋 Existing Animals")
     st.markdown("View or delete registered animals below:")
     st.write("")
 
-    with get_db_session() as db:
+    with get_db_session(farm) as db:
         try:
-            animals = get_all_animals(db)
+            animals = list_animals(db)
             if not animals:
                 st.info("No animals found in the database.")
                 return
+            refresh_yield_sketches(farm)
+            with get_read_session(farm) as read_db:
+                _, ranks = get_percentile_ranks(read_db)
 
             for a in animals:
                 with st.container():
                     cols = st.columns([1, 3, 3, 2])
                     cols[0].markdown(f"**#{a.id}**")
-                    cols[1].markdown(f"**Name:** {a.name}")
-                    cols[2].markdown(f"**Breed:** {a.breed}")
+                    cols[1].markdown(f"**Name:** [{a.name}](/?page=Profile&farm={farm}&animal={a.id})")
+                    badge = percentile_badge(ranks[a.id].breed_rank) if a.id in ranks else ""
+                    cols[2].markdown(f"**Breed:** {a.breed} {badge}")
                     if cols[3].button("🗑️ Delete", key=f"del_{a.id}"):
                         try:
                             delete_animal(db, a.id)
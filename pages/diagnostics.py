@@ -0,0 +1,81 @@
+import streamlit as st
+import pandas as pd
+import tracemalloc
+from datetime import datetime
+from figure_cache import figure_cache_stats
+from session_memory import (SESSION_BUDGET_BYTES, page_profiles, session_usage, session_state_sizes, set_tracing,
+                            clear_session_cache)
+
+def _mb(size):
+    return round(size / 1024 / 1024, 2) if size is not None else None
+
+def show_diagnostics():
+    st.markdown("## 🩺 Diagnostics", unsafe_allow_html=True)
+    st.markdown("---")
+
+    # ----- Process Memory -----
+    traced, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+    figures = figure_cache_stats()
+    cols = st.columns(4)
+    cols[0].metric("🧠 Traced Now", f"{_mb(traced)} MB" if traced is not None else "Off")
+    cols[1].metric("📈 Traced Peak", f"{_mb(peak)} MB" if peak is not None else "Off")
+    cols[2].metric("👥 Active Sessions", len(session_usage()))
+    cols[3].metric("🖼️ Figure Cache", f"{_mb(figures['bytes'])} MB", help=f"{figures['entries']} figures")
+
+    tracing = st.toggle("Trace allocations with tracemalloc", value=tracemalloc.is_tracing(),
+                        help="Snapshots around every page run; slows pages down while on")
+    if tracing != tracemalloc.is_tracing():
+        set_tracing(tracing)
+        st.rerun()
+
+    # ----- Sessions -----
+    st.markdown(f"### 👥 Session Memory (budget {_mb(SESSION_BUDGET_BYTES):.0f} MB per session)")
+    usage = session_usage()
+    if usage:
+        st.dataframe(pd.DataFrame([{
+            "Session": u.session_id[:8],
+            "Last Page": u.page,
+            "Cached (MB)": _mb(u.cached_bytes),
+            "Entries": u.entries,
+            "Evictions": u.evictions,
+            "Last Seen": datetime.fromtimestamp(u.last_seen).strftime("%H:%M:%S"),
+        } for u in usage]), use_container_width=True, hide_index=True)
+
+    with st.expander("🔎 This Session's State"):
+        sizes = session_state_sizes()
+        if sizes:
+            st.dataframe(pd.DataFrame(sizes, columns=["Key", "Bytes"]), use_container_width=True, hide_index=True)
+        else:
+            st.caption("Nothing stored in this session")
+        if st.button("🧹 Clear This Session's Cache"):
+            clear_session_cache()
+            st.rerun()
+
+    # ----- Page Runs -----
+    st.markdown("### ⏱️ Recent Page Runs")
+    st.caption("Allocations are traced for the whole process, so runs that overlap with other sessions "
+               "include their allocations too")
+    profiles = page_profiles()
+    if not profiles:
+        st.info("No page runs recorded yet")
+        return
+    st.dataframe(pd.DataFrame([{
+        "Time": datetime.fromtimestamp(p.started).strftime("%H:%M:%S"),
+        "Page": p.page,
+        "Session": p.session_id[:8],
+        "Seconds": round(p.seconds, 3),
+        "Process Net Alloc (MB)": _mb(p.net_bytes),
+        "Process Peak (MB)": _mb(p.peak_bytes),
+    } for p in profiles]), use_container_width=True, hide_index=True)
+
+    traced_runs = [p for p in profiles if p.top]
+    if traced_runs:
+        labels = {f"{datetime.fromtimestamp(p.started):%H:%M:%S} · {p.page} · {p.session_id[:8]}": p
+                  for p in traced_runs}
+        run = labels[st.selectbox("Top allocations for run", options=list(labels))]
+        st.dataframe(pd.DataFrame([{"Line": line, "KB": round(size / 1024, 1), "Blocks": count}
+                                   for line, size, count in run.top]),
+                     use_container_width=True, hide_index=True)
+
+if __name__ == "__main__":
+    show_diagnostics()
@@ -0,0 +1,59 @@
+import streamlit as st
+import pandas as pd
+from crud import DEFAULT_FARM, list_farms, create_farm, get_all_farm_summaries
+
+def show_farms():
+    farm = st.query_params.get("farm", DEFAULT_FARM)
+    st.markdown("## 🏡 Farm Management", unsafe_allow_html=True)
+    st.markdown("---")
+
+    # ----- Farm Selection -----
+    farms = list_farms()
+    selected = st.selectbox(
+        "Active Farm",
+        options=farms,
+        index=farms.index(farm) if farm in farms else 0,
+        help="All pages show and record data for the active farm"
+    )
+    if selected != farm:
+        st.query_params["farm"] = selected
+        st.rerun()
+
+    with st.expander("➕ Add New Farm", expanded=False):
+        with st.form("add_farm_form", clear_on_submit=True):
+            farm_id = st.text_input("🏷️ Farm ID", placeholder="e.g. north-site",
+                                    help="Lowercase letters, digits, '-' and '_'")
+            if st.form_submit_button("✅ Add Farm"):
+                try:
+                    create_farm(farm_id)
+                    st.success(f"✅ Farm **{farm_id.strip().lower()}** created")
+                except ValueError as e:
+                    st.error(f"🚨 {e}")
+
+    # ----- Cross-Farm Overview -----
+    st.markdown("### 📊 All Farms (last 30 days)")
+    try:
+        summaries = get_all_farm_summaries(days=30)
+        overview = pd.DataFrame([{
+            "Farm": farm_id,
+            "Animals": s["animals"],
+            "Breeds": s["breeds"],
+            "Milk (L)": round(s["milk_liters"], 1),
+            "Saleable (L)": round(s["milk_liters"] - s["withheld_liters"], 1),
+            "Feed (kg)": round(s["feed_kg"], 1),
+            "Treatments": s["treatments"],
+        } for farm_id, s in summaries.items()])
+        st.dataframe(overview, use_container_width=True, hide_index=True)
+
+        totals = overview.drop(columns="Farm").sum()
+        cols = st.columns(3)
+        cols[0].metric("🐄 Total Animals", int(totals["Animals"]))
+        cols[1].metric("🥛 Total Milk", f"{totals['Milk (L)']:.1f} L")
+        cols[2].metric("💰 Total Saleable", f"{totals['Saleable (L)']:.1f} L")
+    except Exception as e:
+        st.error(f"❌ Failed to load farm summaries: {e}")
+
+    st.caption(f"🩺 [Server diagnostics](/?page=Diagnostics&farm={farm}) - memory per session and page timings")
+
+if __name__ == "__main__":
+    show_farms()
@@ -1,5 +1,9 @@
 import streamlit as st
-from crud import get_db_session, create_feed_record, get_feed_by_animal, get_all_animal_names
+from crud import (get_db_session, get_read_session, DEFAULT_FARM, list_feed_by_animal,
+                  create_feed_delivery, record_stock_count, get_feed_deliveries, forecast_feed_cover)
+from components import animal_picker_options, journal_sync_panel, quarantine_review_panel
+from write_journal import save_or_journal
+from validation import RecordRejected
 from datetime import date
 
 # Custom CSS for professional styling
@@ -38,6 +42,7 @@ def inject_css():
 
 def show_feed():
     inject_css()
+    farm = st.query_params.get("farm", DEFAULT_FARM)
     
     # Header Section
     # st.markdown('<div class="section-title">Feed Management System</div>', unsafe_allow_html=True)
@@ -48,14 +53,10 @@ def show_feed():
         st.markdown("---")
         
         try:
-            with get_db_session() as db:
-                animal_options = get_all_animal_names(db)
-                
-            if not animal_options:
-                st.warning("No animals registered. Please add animals first.")
+            animal_dict, search = animal_picker_options(farm, "feed_animal_search")
+            if not animal_dict:
+                st.warning("No animals match your search." if search else "No animals registered. Please add animals first.")
                 return
-                
-            animal_dict = {name: id for id, name in animal_options}
             
             with st.form("feed_form", clear_on_submit=True):
                 cols = st.columns(2)
@@ -100,14 +101,22 @@ def show_feed():
                         
                     try:
                         with st.spinner("Saving feed record..."):
-                            with get_db_session() as db:
-                                create_feed_record(db, animal_dict[selected_animal], rec_date, feed_type, qty)
-                        st.success("✅ Feed record saved successfully")
+                            record = save_or_journal(farm, 'feed', {'animal_id': animal_dict[selected_animal],
+                                                                    'date': rec_date, 'feed_type': feed_type.strip(),
+                                                                    'quantity_kg': qty})
+                        if record is None:
+                            st.warning("📴 Central database unreachable - entry kept on this terminal and will sync later")
+                        else:
+                            st.success("✅ Feed record saved successfully")
+                    except RecordRejected as e:
+                        st.warning(f"🚧 Entry quarantined for review: {e}")
                     except Exception as e:
                         st.error(f"Database error: {str(e)}")
         
         except Exception as e:
             st.error(f"System error: {str(e)}")
+        journal_sync_panel(farm)
+        quarantine_review_panel(farm, 'feed')
     
     # Feed History Section
     st.markdown("---")
@@ -130,52 +139,106 @@ def show_feed():
             if st.button("🔍 Load Feed History"):
                 try:
                     with st.spinner("Fetching records..."):
-                        with get_db_session() as db:
-                            records = get_feed_by_animal(db, animal_dict[selected_animal])
+                        with get_read_session(farm) as db:
+                            filtered = list_feed_by_animal(db, animal_dict[selected_animal], start_date, end_date)
                         
-                        if records:
-                            filtered = [
-                                r for r in records
-                                if start_date <= r.date <= end_date
-                            ]
-                            
-                            if filtered:
-                                with st.container():
-                                    st.markdown('<div class="data-table">', unsafe_allow_html=True)
-                                    st.dataframe(
-                                        data=[(
-                                            r.date.strftime("%Y-%m-%d"),
-                                            r.feed_type,
-                                            f"{r.quantity_kg} kg",
-                                            selected_animal
-                                        ) for r in filtered],
-                                        column_names=["Date", "Feed Type", "Quantity", "Animal"],
-                                        use_container_width=True,
-                                        height=400
-                                    )
-                                    st.markdown('</div>', unsafe_allow_html=True)
-                                    
-                                    # Export option
-                                    st.download_button(
-                                        label="📥 Export as CSV",
-                                        data="\n".join([",".join(map(str, row)) for row in [
-                                            ["Date", "Feed Type", "Quantity", "Animal"]
-                                        ] + [
-                                            [r.date, r.feed_type, r.quantity_kg, selected_animal] 
-                                            for r in filtered
-                                        ]]),
-                                        file_name=f"feed_history_{selected_animal}.csv",
-                                        mime="text/csv"
-                                    )
-                            else:
-                                st.info("No records found for selected period")
+                        if filtered:
+                            with st.container():
+                                st.markdown('<div class="data-table">', unsafe_allow_html=True)
+                                st.dataframe(
+                                    data={
+                                        "Date": [r.date.strftime("%Y-%m-%d") for r in filtered],
+                                        "Feed Type": [r.feed_type for r in filtered],
+                                        "Quantity": [f"{r.quantity_kg} kg" for r in filtered],
+                                        "Animal": [selected_animal] * len(filtered)
+                                    },
+                                    use_container_width=True,
+                                    height=400
+                                )
+                                st.markdown('</div>', unsafe_allow_html=True)
+                                
+                                # Export option
+                                st.download_button(
+                                    label="📥 Export as CSV",
+                                    data="\n".join([",".join(map(str, row)) for row in [
+                                        ["Date", "Feed Type", "Quantity", "Animal"]
+                                    ] + [
+                                        [r.date, r.feed_type, r.quantity_kg, selected_animal] 
+                                        for r in filtered
+                                    ]]),
+                                    file_name=f"feed_history_{selected_animal}.csv",
+                                    mime="text/csv"
+                                )
                         else:
-                            st.info("No feed records available")
+                            st.info("No records found for selected period")
                 except Exception as e:
                     st.error(f"Error loading history: {str(e)}")
                     
     except Exception as e:
         st.error(f"Filter error: {str(e)}")
 
+    # Feed Inventory Section
+    st.markdown("---")
+    st.markdown('### 📦 Feed Inventory')
+
+    try:
+        cols = st.columns(2)
+        with cols[0]:
+            with st.form("delivery_form", clear_on_submit=True):
+                st.markdown("##### 🚚 Record Delivery or Stock Count")
+                inv_type = st.text_input("Feed Type", placeholder="e.g. Corn Silage")
+                inv_qty = st.number_input("Quantity (kg)", min_value=0.0, step=10.0, value=1000.0, format="%.1f")
+                inv_date = st.date_input("Date", value=date.today(), max_value=date.today())
+                supplier = st.text_input("Supplier (optional)")
+                is_count = st.checkbox("This is a physical stock count",
+                                       help="Sets the balance to the counted quantity instead of adding to it")
+                if st.form_submit_button("📩 Save"):
+                    if not inv_type.strip():
+                        st.error("Please specify a valid feed type")
+                    else:
+                        with get_db_session(farm) as db:
+                            if is_count:
+                                record_stock_count(db, inv_date, inv_type.strip(), inv_qty)
+                            else:
+                                create_feed_delivery(db, inv_date, inv_type.strip(), inv_qty, supplier.strip() or None)
+                        st.success("✅ Inventory updated")
+
+        with get_read_session(farm) as db:
+            cover = forecast_feed_cover(db)
+            deliveries = get_feed_deliveries(db, limit=10)
+
+        with cols[1]:
+            st.markdown("##### 📊 Stock & Days of Cover")
+            if cover:
+                for c in cover:
+                    if c["days_of_cover"] is not None and c["days_of_cover"] < 7:
+                        st.warning(f"⚠️ {c['feed_type']} runs out around {c['run_out_date']:%b %d}")
+                st.dataframe(
+                    {
+                        "Feed Type": [c["feed_type"] for c in cover],
+                        "Balance (kg)": [round(c["balance_kg"], 1) for c in cover],
+                        "Daily Use (kg)": [round(c["daily_use_kg"], 1) for c in cover],
+                        "Days of Cover": [round(c["days_of_cover"], 1) if c["days_of_cover"] is not None else None
+                                          for c in cover],
+                    },
+                    use_container_width=True
+                )
+            else:
+                st.info("No feed stock recorded yet")
+
+        if deliveries:
+            with st.expander("🚚 Recent Deliveries"):
+                st.dataframe(
+                    {
+                        "Date": [d.date.strftime("%Y-%m-%d") for d in deliveries],
+                        "Feed Type": [d.feed_type for d in deliveries],
+                        "Quantity (kg)": [d.quantity_kg for d in deliveries],
+                        "Supplier": [d.supplier or "" for d in deliveries],
+                    },
+                    use_container_width=True
+                )
+    except Exception as e:
+        st.error(f"Inventory error: {str(e)}")
+
 if __name__ == "__main__":
     show_feed()
\ No newline at end of file
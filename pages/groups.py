@@ -0,0 +1,98 @@
+import streamlit as st
+from crud import (get_db_session, get_read_session, DEFAULT_FARM, get_all_animal_names, list_groups, create_group,
+                  get_group_member_ids, set_group_members, delete_group, feed_group, treat_group)
+from datetime import date
+
+def show_groups():
+    farm = st.query_params.get("farm", DEFAULT_FARM)
+    st.markdown("## 🏘️ Groups & Pens", unsafe_allow_html=True)
+    st.markdown("---")
+
+    with get_read_session(farm) as db:
+        animals = dict(get_all_animal_names(db))
+        groups = list_groups(db)
+
+    with st.expander("➕ Add New Group", expanded=not groups):
+        with st.form("add_group_form", clear_on_submit=True):
+            name = st.text_input("🏷️ Group Name", placeholder="e.g. Pen A - High Yielders")
+            members = st.multiselect("🐄 Members", options=list(animals), format_func=lambda a: animals[a])
+            notes = st.text_input("📝 Notes (optional)")
+            if st.form_submit_button("✅ Add Group"):
+                if not name.strip():
+                    st.warning("Please enter a group name.")
+                else:
+                    try:
+                        with get_db_session(farm) as db:
+                            create_group(db, name.strip(), notes.strip() or None, members)
+                        st.success(f"✅ Group **{name.strip()}** created with {len(members)} animals")
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"🚨 Failed to add group. Error: {e}")
+
+    if not groups:
+        st.info("No groups yet. Create one to feed or treat a whole pen at once.")
+        return
+
+    group_options = {f"{g.name} ({g.members} animals)": g for g in groups}
+    group = group_options[st.selectbox("Select Group", options=list(group_options))]
+
+    cols = st.columns(2)
+    # ----- Batch Feeding -----
+    with cols[0]:
+        with st.form("group_feed_form", clear_on_submit=True):
+            st.markdown("##### 🌾 Feed Group")
+            feed_type = st.text_input("Feed Type", placeholder="e.g. TMR")
+            qty = st.number_input("Quantity (kg)", min_value=0.1, step=1.0, value=10.0, format="%.1f")
+            split = st.radio("Quantity is", ["Per animal", "Total for the group (split evenly)"], horizontal=True)
+            feed_date = st.date_input("Feeding Date", value=date.today(), max_value=date.today())
+            if st.form_submit_button("📩 Log Group Feeding"):
+                if not feed_type.strip():
+                    st.error("Please specify a valid feed type")
+                else:
+                    try:
+                        with get_db_session(farm) as db:
+                            written = feed_group(db, group.id, feed_date, feed_type.strip(), qty,
+                                                 split=split != "Per animal")
+                        st.success(f"✅ Logged feeding for {written} animals")
+                    except Exception as e:
+                        st.error(f"Database error: {str(e)}")
+
+    # ----- Batch Treatment -----
+    with cols[1]:
+        with st.form("group_treat_form", clear_on_submit=True):
+            st.markdown("##### 💊 Treat Group")
+            medicine_name = st.text_input("Medicine Name", placeholder="e.g. Ivermectin")
+            dosage = st.text_input("Dosage per Animal", placeholder="e.g. 10 ml")
+            reason = st.text_input("Reason", placeholder="e.g. Routine deworming")
+            treat_date = st.date_input("Treatment Date", value=date.today(), max_value=date.today())
+            if st.form_submit_button("📩 Log Group Treatment"):
+                if not (medicine_name.strip() and dosage.strip() and reason.strip()):
+                    st.error("Please fill in medicine, dosage and reason")
+                else:
+                    try:
+                        with get_db_session(farm) as db:
+                            written = treat_group(db, group.id, treat_date, medicine_name.strip(),
+                                                  dosage.strip(), reason.strip())
+                        st.success(f"✅ Logged treatment for {written} animals")
+                    except Exception as e:
+                        st.error(f"Database error: {str(e)}")
+
+    # ----- Membership -----
+    with st.expander("👥 Edit Members"):
+        with get_read_session(farm) as db:
+            current = [a for a in get_group_member_ids(db, group.id) if a in animals]
+        with st.form("group_members_form"):
+            members = st.multiselect("Members", options=list(animals), default=current,
+                                     format_func=lambda a: animals[a])
+            if st.form_submit_button("💾 Save Members"):
+                with get_db_session(farm) as db:
+                    set_group_members(db, group.id, members)
+                st.success(f"✅ {group.name} now has {len(members)} animals")
+                st.rerun()
+        if st.button("🗑️ Delete Group", key=f"del_group_{group.id}"):
+            with get_db_session(farm) as db:
+                delete_group(db, group.id)
+            st.rerun()
+
+if __name__ == "__main__":
+    show_groups()
@@ -1,5 +1,7 @@
 import streamlit as st
-from crud import get_db_session, create_medicine_record, get_medicine_by_animal, get_all_animal_names
+from crud import (get_db_session, get_read_session, DEFAULT_FARM, create_medicine_record, list_medicine_by_animal,
+                  get_withdrawal_periods, set_withdrawal_period, get_withdrawal_index, search_treatments, get_all_animal_names)
+from components import animal_picker_options
 from datetime import date
 
 # Custom CSS for professional styling
@@ -34,6 +36,7 @@ def inject_css():
 
 def show_medicine():
     inject_css()
+    farm = st.query_params.get("farm", DEFAULT_FARM)
     
     # Page Title
     st.markdown('<div class="section-title">💊 Medicine Management System</div>', unsafe_allow_html=True)
@@ -43,15 +46,11 @@ def show_medicine():
         st.markdown('### 📥 New Medicine Entry')
         st.markdown("---")
         try:
-            with get_db_session() as db:
-                animal_options = get_all_animal_names(db)
-            
-            if not animal_options:
-                st.warning("No animals registered. Please add animals first.")
+            animal_dict, search = animal_picker_options(farm, "medicine_animal_search")
+            if not animal_dict:
+                st.warning("No animals match your search." if search else "No animals registered. Please add animals first.")
                 return
             
-            animal_dict = {name: id for id, name in animal_options}
-            
             with st.form("medicine_form", clear_on_submit=True):
                 cols = st.columns(2)
                 with cols[0]:
@@ -91,7 +90,7 @@ def show_medicine():
                         return
                     try:
                         with st.spinner("Saving medicine record..."):
-                            with get_db_session() as db:
+                            with get_db_session(farm) as db:
                                 create_medicine_record(db, animal_dict[selected_animal], rec_date, med_name, dosage, reason)
                         st.success("✅ Medicine record saved successfully")
                     except Exception as e:
@@ -119,21 +118,19 @@ def show_medicine():
             if st.button("🔍 Load Medicine History"):
                 try:
                     with st.spinner("Fetching records..."):
-                        with get_db_session() as db:
-                            records = get_medicine_by_animal(db, animal_dict[selected_animal])
-                        filtered = [r for r in records if start_date <= r.date <= end_date]
+                        with get_read_session(farm) as db:
+                            filtered = list_medicine_by_animal(db, animal_dict[selected_animal], start_date, end_date)
                         
                         if filtered:
                             st.markdown('<div class="data-table">', unsafe_allow_html=True)
                             st.dataframe(
-                                data=[(
-                                    r.date.strftime("%Y-%m-%d"),
-                                    r.medicine_name,
-                                    r.dosage,
-                                    r.reason,
-                                    selected_animal
-                                ) for r in filtered],
-                                column_names=["Date","Medicine","Dosage","Reason","Animal"],
+                                data={
+                                    "Date": [r.date.strftime("%Y-%m-%d") for r in filtered],
+                                    "Medicine": [r.medicine_name for r in filtered],
+                                    "Dosage": [r.dosage for r in filtered],
+                                    "Reason": [r.reason for r in filtered],
+                                    "Animal": [selected_animal] * len(filtered)
+                                },
                                 use_container_width=True,
                                 height=400
                             )
@@ -156,5 +153,83 @@ def show_medicine():
     except Exception as e:
         st.error(f"Filter error: {str(e)}")
 
+    # ----- Treatment Search Section -----
+    st.markdown("---")
+    st.markdown('### 🔎 Treatment Search')
+    try:
+        treatment_query = st.text_input(
+            "Search treatments",
+            placeholder="e.g. mastitis, ivermectin",
+            help="Matches medicine names and reasons across the whole herd"
+        )
+        if treatment_query.strip():
+            with get_read_session(farm) as db:
+                matches = search_treatments(db, treatment_query)
+                names = dict(get_all_animal_names(db))
+            if matches:
+                st.dataframe(
+                    {
+                        "Date": [r.date.strftime("%Y-%m-%d") for r in matches],
+                        "Animal": [names.get(r.animal_id, f"#{r.animal_id}") for r in matches],
+                        "Medicine": [r.medicine_name for r in matches],
+                        "Dosage": [r.dosage for r in matches],
+                        "Reason": [r.reason for r in matches],
+                    },
+                    use_container_width=True
+                )
+            else:
+                st.info("No treatments match your search")
+    except Exception as e:
+        st.error(f"Search error: {str(e)}")
+
+    # ----- Withdrawal Periods Section -----
+    st.markdown("---")
+    st.markdown('### ⏳ Milk Withdrawal Periods')
+    try:
+        with st.form("withdrawal_form", clear_on_submit=True):
+            cols = st.columns(2)
+            with cols[0]:
+                wd_medicine = st.text_input(
+                    "Medicine Name",
+                    placeholder="e.g. Penicillin",
+                    help="Medicine the withdrawal period applies to"
+                )
+            with cols[1]:
+                wd_days = st.number_input(
+                    "Milk Withdrawal (days)",
+                    min_value=0,
+                    max_value=365,
+                    step=1,
+                    value=3,
+                    help="Days milk must be withheld, starting on the treatment date"
+                )
+            if st.form_submit_button("📩 Save Withdrawal Period"):
+                if not wd_medicine.strip():
+                    st.error("Please specify a medicine name.")
+                else:
+                    with get_db_session(farm) as db:
+                        set_withdrawal_period(db, wd_medicine, int(wd_days))
+                    st.success("✅ Withdrawal period saved")
+
+        with get_db_session(farm) as db:
+            periods = get_withdrawal_periods(db)
+            active = get_withdrawal_index(db).active_on(date.today())
+            names = dict(get_all_animal_names(db))
+
+        if periods:
+            st.dataframe(
+                {
+                    "Medicine": [p.medicine_name for p in periods],
+                    "Withdrawal Days": [p.milk_withdrawal_days for p in periods],
+                },
+                use_container_width=True
+            )
+        if active:
+            st.warning("🚫 Milk currently withheld for: " + ", ".join(
+                f"{names.get(animal_id, animal_id)} (until {end:%b %d})" for animal_id, end in sorted(active.items())
+            ))
+    except Exception as e:
+        st.error(f"Withdrawal period error: {str(e)}")
+
 if __name__ == "__main__":
     show_medicine()
\ No newline at end of file
@@ -1,5 +1,9 @@
 import streamlit as st
-from crud import get_db_session, create_milk_record, get_milk_by_animal, get_all_animal_names
+from crud import get_read_session, DEFAULT_FARM, list_milk_by_animal, get_table_version, MILK_SESSIONS
+from components import animal_picker_options, journal_sync_panel, quarantine_review_panel
+from write_journal import save_or_journal
+from validation import RecordRejected
+from session_memory import session_cached
 from datetime import date
 
 # Custom CSS for professional styling
@@ -37,8 +41,17 @@ def inject_css():
     """, unsafe_allow_html=True)
 
 
+def _load_history(farm, animal_id, animal_name, start_date, end_date):
+    with get_read_session(farm) as db:
+        records = list_milk_by_animal(db, animal_id, start_date, end_date)
+    csv_data = "Date,Session,Quantity,Animal\n" + "\n".join([
+        f"{r.date},{r.session},{r.quantity_liters},{animal_name}" for r in records
+    ])
+    return records, csv_data
+
 def show_milk():
     inject_css()
+    farm = st.query_params.get("farm", DEFAULT_FARM)
     
     # Page Title
     st.markdown('<div class="section-title">🥛 Milk Management System</div>', unsafe_allow_html=True)
@@ -48,15 +61,11 @@ def show_milk():
         st.markdown('### 📥 New Milk Entry')
         st.markdown("---")
         try:
-            with get_db_session() as db:
-                animal_options = get_all_animal_names(db)
-            
-            if not animal_options:
-                st.warning("No animals registered. Please add animals first.")
+            animal_dict, search = animal_picker_options(farm, "milk_animal_search")
+            if not animal_dict:
+                st.warning("No animals match your search." if search else "No animals registered. Please add animals first.")
                 return
             
-            animal_dict = {name: id for id, name in animal_options}
-            
             with st.form("milk_form", clear_on_submit=True):
                 cols = st.columns(2)
                 with cols[0]:
@@ -73,6 +82,12 @@ def show_milk():
                         max_value=date.today(),
                         help="Select record date"
                     )
+                session = st.selectbox(
+                    "Milking Session",
+                    options=MILK_SESSIONS,
+                    index=0,
+                    help="Saving the same animal, date and session again replaces the earlier entry"
+                )
                 qty = st.number_input(
                     "Quantity (liters)",
                     min_value=0.1,
@@ -90,13 +105,23 @@ def show_milk():
                         return
                     try:
                         with st.spinner("Saving milk record..."):
-                            with get_db_session() as db:
-                                create_milk_record(db, animal_dict[selected_animal], rec_date, qty)
-                        st.success("✅ Milk record saved successfully")
+                            record = save_or_journal(farm, 'milk', {'animal_id': animal_dict[selected_animal],
+                                                                    'date': rec_date, 'quantity_liters': qty,
+                                                                    'session': session})
+                        if record is None:
+                            st.warning("📴 Central database unreachable - entry kept on this terminal and will sync later")
+                        else:
+                            st.success("✅ Milk record saved successfully")
+                        if record is not None and record.withheld:
+                            st.warning("🚫 Animal is within a medicine withdrawal period - milk must be withheld")
+                    except RecordRejected as e:
+                        st.warning(f"🚧 Entry quarantined for review: {e}")
                     except Exception as e:
                         st.error(f"Database error: {str(e)}")
         except Exception as e:
             st.error(f"System error: {str(e)}")
+        journal_sync_panel(farm)
+        quarantine_review_panel(farm, 'milk')
 
     # ----- Milk History Section -----
     st.markdown("---")
@@ -115,31 +140,36 @@ def show_milk():
             with filter_cols[2]:
                 end_date = st.date_input("End Date", value=date.today())
             
+            history_key = (farm, animal_dict[selected_animal], start_date, end_date)
             if st.button("🔍 Load Milk History"):
+                st.session_state["milk_history_filter"] = history_key
+            # Loaded history stays on screen across reruns, held in the session's memory budget
+            if st.session_state.get("milk_history_filter") == history_key:
                 try:
                     with st.spinner("Fetching records..."):
-                        with get_db_session() as db:
-                            records = get_milk_by_animal(db, animal_dict[selected_animal])
-                        filtered = [r for r in records if start_date <= r.date <= end_date]
-                        
+                        with get_read_session(farm) as db:
+                            version = get_table_version(db, "milk_records")
+                        filtered, csv_data = session_cached(
+                            ("milk_history", *history_key, version),
+                            lambda: _load_history(farm, animal_dict[selected_animal], selected_animal,
+                                                  start_date, end_date))
+
                         if filtered:
                             st.markdown('<div class="data-table">', unsafe_allow_html=True)
                             st.dataframe(
-                                data=[(
-                                    r.date.strftime("%Y-%m-%d"),
-                                    f"{r.quantity_liters} L",
-                                    selected_animal
-                                ) for r in filtered],
-                                column_names=["Date","Quantity","Animal"],
+                                data={
+                                    "Date": [r.date.strftime("%Y-%m-%d") for r in filtered],
+                                    "Session": [r.session for r in filtered],
+                                    "Quantity": [f"{r.quantity_liters} L" for r in filtered],
+                                    "Status": ["Withheld" if r.withheld else "" for r in filtered],
+                                    "Animal": [selected_animal] * len(filtered)
+                                },
                                 use_container_width=True,
                                 height=400
                             )
                             st.markdown('</div>', unsafe_allow_html=True)
                             
                             # Export
-                            csv_data = "Date,Quantity,Animal\n" + "\n".join([
-                                f"{r.date},{r.quantity_liters},{selected_animal}" for r in filtered
-                            ])
                             st.download_button(
                                 label="📥 Export as CSV",
                                 data=csv_data,
@@ -0,0 +1,103 @@
+import streamlit as st
+from crud import get_read_session, DEFAULT_FARM, get_animal, get_animal_profile
+from components import animal_picker_options
+from charts import animal_milk_timeline_figure, animal_feed_timeline_figure
+from datetime import date, timedelta
+
+def show_profile():
+    farm = st.query_params.get("farm", DEFAULT_FARM)
+    st.markdown("## 🐮 Animal Profile", unsafe_allow_html=True)
+    st.markdown("---")
+
+    try:
+        animal_dict, search = animal_picker_options(farm, "profile_animal_search")
+        linked = st.query_params.get("animal")
+        if linked and not search:
+            # Animals page links here with ?animal=<id>; put that animal first
+            with get_read_session(farm) as db:
+                linked_animal = get_animal(db, int(linked))
+                if linked_animal:
+                    animal_dict = {linked_animal.name: linked_animal.id, **animal_dict}
+        if not animal_dict:
+            st.warning("No animals match your search." if search else "No animals registered. Please add animals first.")
+            return
+
+        cols = st.columns(3)
+        with cols[0]:
+            selected_animal = st.selectbox("Select Animal", options=list(animal_dict.keys()))
+        with cols[1]:
+            start_date = st.date_input("Start Date", value=date.today() - timedelta(days=90))
+        with cols[2]:
+            end_date = st.date_input("End Date", value=date.today())
+
+        with get_read_session(farm) as db:
+            profile = get_animal_profile(db, animal_dict[selected_animal], start_date, end_date)
+        if profile is None:
+            st.error("Animal not found")
+            return
+    except Exception as e:
+        st.error(f"System error: {str(e)}")
+        return
+
+    animal = profile.animal
+    lifecycle = profile.lifecycle
+    st.markdown(f"### {animal.name} <small style='color: #7f8c8d;'>#{animal.id} · {animal.breed}</small>",
+                unsafe_allow_html=True)
+    if animal.notes:
+        st.caption(animal.notes)
+
+    # ----- Key Figures -----
+    total_milk = sum(r.quantity_liters for r in profile.milk)
+    milk_days = len({r.date for r in profile.milk})
+    metrics = st.columns(5)
+    metrics[0].metric("🎂 Age", f"{(date.today() - animal.date_of_birth).days // 365} yrs")
+    metrics[1].metric("🥛 Milk in Period", f"{total_milk:.1f} L")
+    metrics[2].metric("📦 Avg per Day", f"{total_milk / milk_days:.1f} L" if milk_days else "N/A")
+    metrics[3].metric("🔁 Lactation", lifecycle.lactation_number if lifecycle else 0,
+                      help=lifecycle.status if lifecycle else "Heifer")
+    metrics[4].metric("📅 Days in Milk",
+                      (date.today() - lifecycle.last_calving).days
+                      if lifecycle and lifecycle.status == "Lactating" else "N/A")
+    if lifecycle and lifecycle.expected_calving:
+        st.info(f"🍼 Expected to calve on {lifecycle.expected_calving:%b %d, %Y}"
+                + (f" · dry off by {lifecycle.dry_off_due:%b %d}" if lifecycle.dry_off_due else ""))
+    if profile.lactation_fit:
+        fit = profile.lactation_fit
+        st.caption(f"📉 Wood's curve: peak {fit.peak_yield or 0:.1f} L around day {fit.peak_day or 0:.0f} "
+                   f"(R² {fit.r_squared or 0:.2f}, fitted {fit.fitted_on})")
+
+    # ----- Timelines -----
+    if profile.milk or profile.medicine or profile.events:
+        st.plotly_chart(animal_milk_timeline_figure(profile), use_container_width=True)
+    else:
+        st.info("No milk, treatment or lifecycle records in the selected period")
+    if profile.feed:
+        st.plotly_chart(animal_feed_timeline_figure(profile), use_container_width=True)
+
+    # ----- Record Tables -----
+    tabs = st.tabs(["🥛 Milk", "🌾 Feed", "💊 Medicine", "🗓️ Events"])
+    with tabs[0]:
+        st.dataframe({"Date": [r.date for r in profile.milk],
+                      "Session": [r.session for r in profile.milk],
+                      "Liters": [r.quantity_liters for r in profile.milk],
+                      "Status": ["Withheld" if r.withheld else "" for r in profile.milk]},
+                     use_container_width=True)
+    with tabs[1]:
+        st.dataframe({"Date": [r.date for r in profile.feed],
+                      "Feed Type": [r.feed_type for r in profile.feed],
+                      "Kg": [r.quantity_kg for r in profile.feed]},
+                     use_container_width=True)
+    with tabs[2]:
+        st.dataframe({"Date": [r.date for r in profile.medicine],
+                      "Medicine": [r.medicine_name for r in profile.medicine],
+                      "Dosage": [r.dosage for r in profile.medicine],
+                      "Reason": [r.reason for r in profile.medicine]},
+                     use_container_width=True)
+    with tabs[3]:
+        st.dataframe({"Date": [e.date for e in profile.events],
+                      "Event": [e.event_type for e in profile.events],
+                      "Notes": [e.notes or "" for e in profile.events]},
+                     use_container_width=True)
+
+if __name__ == "__main__":
+    show_profile()
@@ -0,0 +1,65 @@
+import os
+import json
+import streamlit as st
+import streamlit.components.v1 as components
+from crud import DEFAULT_FARM
+from report_scheduler import REPORTS_DIR, load_manifest, run_scheduled_reports
+
+MIME_TYPES = {
+    ".csv": "text/csv",
+    ".html": "text/html",
+    ".json": "application/json",
+    ".png": "image/png",
+    ".pdf": "application/pdf",
+}
+
+def show_report_library():
+    farm = st.query_params.get("farm", DEFAULT_FARM)
+    st.markdown("## 🗂️ Report Library", unsafe_allow_html=True)
+    st.markdown("Prebuilt monthly reports. They are generated offline by `report_scheduler.py`, "
+                "so opening one never recomputes the analytics.")
+    st.markdown("---")
+
+    if st.button("🔄 Build Missing Reports", help="Build this farm's reports for the last 3 months now"):
+        with st.spinner("Building reports..."):
+            built = run_scheduled_reports([farm], months=3)
+        st.success(f"✅ Built {len(built)} report(s)")
+
+    reports = [r for r in load_manifest()["reports"] if r["farm"] == farm]
+    if not reports:
+        st.info("No reports have been built for this farm yet.")
+        return
+
+    labels = {f"{r['period']} (generated {r['generated_at'].replace('T', ' ')})": r for r in reports}
+    report = labels[st.selectbox("Period", options=list(labels.keys()))]
+    report_dir = os.path.join(REPORTS_DIR, report["path"])
+
+    try:
+        with open(os.path.join(report_dir, "metrics.json")) as f:
+            metrics = json.load(f)
+        cols = st.columns(4)
+        cols[0].metric("🐄 Animals", metrics["total_animals"])
+        cols[1].metric("🥛 Milk", f"{metrics['milk_liters']} L")
+        cols[2].metric("💰 Saleable", f"{metrics['saleable_liters']} L")
+        cols[3].metric("📦 Avg Daily", f"{metrics['avg_daily_liters']} L")
+
+        st.markdown("### 📥 Downloads")
+        download_cols = st.columns(4)
+        for i, name in enumerate(report["files"]):
+            with open(os.path.join(report_dir, name), "rb") as f:
+                download_cols[i % 4].download_button(
+                    f"💾 {name}",
+                    f.read(),
+                    file_name=f"{farm}_{report['period']}_{name}",
+                    mime=MIME_TYPES.get(os.path.splitext(name)[1], "application/octet-stream"),
+                    key=f"download_{report['path']}_{name}"
+                )
+
+        with st.expander("📊 View Report", expanded=False):
+            with open(os.path.join(report_dir, "report.html")) as f:
+                components.html(f.read(), height=900, scrolling=True)
+    except FileNotFoundError:
+        st.error("❌ Report files are missing. Rebuild the reports to restore them.")
+
+if __name__ == "__main__":
+    show_report_library()
@@ -1,8 +1,14 @@
 import streamlit as st
-from crud import get_db_session, get_all_animals, MilkRecord, Animal
+from crud import (get_read_session, DEFAULT_FARM, list_animals, get_milk_totals, get_milk_average,
+                  get_lactation_fits, get_table_version)
+from analytics import run_lactation_fits
+from sketches import get_percentile_ranks, percentile_badge, refresh_yield_sketches
+from figure_cache import cached_figure
+from milk_columns import open_milk_columns
+from charts import (daily_production_figure, animal_performance_frame, top_producers_figure,
+                    breed_productivity_figure, age_production_figure)
 from datetime import date, timedelta
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 from streamlit_extras.metric_cards import style_metric_cards
 
@@ -28,8 +34,186 @@ def inject_dashboard_css():
     </style>
     """, unsafe_allow_html=True)
 
+# Each loader is cached on its own inputs plus the table_versions counters of
+# the tables it reads, so a write anywhere invalidates exactly the loaders
+# that depend on it and a widget change only reruns its own fragment.
+
+def _versions(farm):
+    with get_read_session(farm) as db:
+        return get_table_version(db, "animals"), get_table_version(db, "milk_records")
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _load_overview(farm, animals_version, milk_version, today):
+    with get_read_session(farm) as db:
+        animals = list_animals(db)
+        return {
+            "animals": animals,
+            "totals": tuple(get_milk_totals(db, today, today)),
+            "average": get_milk_average(db),
+        }
+
+# Milk history comes from the memory-mapped column files (milk_columns.py),
+# which sync themselves with milk_records, instead of ORM rows
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _load_production(farm, milk_version, start_date, end_date):
+    return open_milk_columns(farm).frame(start_date, end_date)[["Date", "Liters"]]
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _load_animal_performance(farm, animals_version, milk_version, today):
+    totals = open_milk_columns(farm).totals_by_animal()
+    with get_read_session(farm) as db:
+        return animal_performance_frame(list_animals(db), None, today, totals=totals)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _load_percentiles(farm, animals_version, milk_version):
+    # Stores the sketches of months changed since the last call, so later reads load them
+    refresh_yield_sketches(farm)
+    with get_read_session(farm) as db:
+        return get_percentile_ranks(db)
+
+def _milk_export_csv(farm, animals):
+    names = {a.id: a.name for a in animals}
+    milk = open_milk_columns(farm).frame()
+    return pd.DataFrame({
+        "Animal ID": milk["animal_id"],
+        "Animal Name": milk["animal_id"].map(names).fillna("Unknown"),
+        "Date": milk["Date"],
+        "Liters": milk["Liters"]
+    }).to_csv(index=False)
+
+@st.fragment
+def _production_tab(farm, milk_version, today):
+    # Date Range Selector
+    col1, col2 = st.columns(2)
+    with col1:
+        start_date = st.date_input("Start Date", value=today - timedelta(days=30))
+    with col2:
+        end_date = st.date_input("End Date", value=today)
+
+    # Production Trends
+    st.subheader("Milk Production Trends", divider="blue")
+    df_milk = _load_production(farm, milk_version, start_date, end_date)
+
+    if not df_milk.empty:
+        st.plotly_chart(cached_figure("daily_production", (farm, start_date, end_date), milk_version,
+                                      lambda: daily_production_figure(df_milk)), use_container_width=True)
+
+        # Productivity Comparison
+        st.subheader("📆 Productivity Comparison", divider="blue")
+        cols = st.columns(2)
+        with cols[0]:
+            current_week = df_milk[df_milk["Date"] > today - timedelta(days=7)]
+            last_week = df_milk[df_milk["Date"].between(today - timedelta(days=14), today - timedelta(days=7))]
+            if not last_week.empty and not current_week.empty:
+                change = (current_week["Liters"].sum()/last_week["Liters"].sum() - 1) * 100
+                st.metric("Weekly Change", f"{change:.1f}%", 
+                        delta_color="inverse" if change < 0 else "normal")
+        
+        with cols[1]:
+            st.metric("Best Day", 
+                    df_milk.loc[df_milk["Liters"].idxmax(), "Date"].strftime("%b %d") if not df_milk.empty else "N/A",
+                    f"{df_milk['Liters'].max():.1f} L")
+    else:
+        st.info("No production data in selected period")
+
+@st.fragment
+def _animal_tab(farm, versions, today):
+    # Animal Performance
+    st.subheader("Animal Performance", divider="green")
+    animal_df = _load_animal_performance(farm, *versions, today)
+    if not animal_df.empty and animal_df["Total Milk"].any():
+        # Top Performers
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("##### 🏆 Top 5 Producers")
+            st.plotly_chart(cached_figure("top_producers", (farm, today), versions,
+                                          lambda: top_producers_figure(animal_df)), use_container_width=True)
+
+        # Breed Analysis
+        with col2:
+            st.markdown("##### 🧬 Breed Productivity")
+            st.plotly_chart(cached_figure("breed_productivity", (farm, today), versions,
+                                          lambda: breed_productivity_figure(animal_df)), use_container_width=True)
+
+        # Age vs Productivity
+        st.markdown("##### 📅 Age vs Milk Production")
+        st.plotly_chart(cached_figure("age_production", (farm, today), versions,
+                                      lambda: age_production_figure(animal_df)), use_container_width=True)
+
+        # Percentile Rankings
+        month, ranks = _load_percentiles(farm, *versions)
+        if ranks:
+            st.markdown(f"##### 🎖️ Yield Percentiles ({month})")
+            names = dict(zip(animal_df["ID"], animal_df["Name"]))
+            ranked = sorted(ranks.values(), key=lambda r: r.herd_rank or 0, reverse=True)
+            st.dataframe(pd.DataFrame([{
+                "Name": names.get(r.animal_id, "Unknown"),
+                "Breed": r.breed,
+                "Avg per Day (L)": round(r.average_liters, 1),
+                "Breed Percentile": round(r.breed_rank * 100) if r.breed_rank is not None else None,
+                "Herd Percentile": round(r.herd_rank * 100) if r.herd_rank is not None else None,
+                "Badge": percentile_badge(r.breed_rank),
+            } for r in ranked]), use_container_width=True, hide_index=True)
+
+        # Lactation Curves
+        st.markdown("##### 📉 Lactation Curves (Wood's model)")
+        if st.button("🔄 Refit Lactation Curves", help="Fit every animal in parallel worker processes"):
+            with st.spinner("Fitting lactation curves..."):
+                fitted = run_lactation_fits(farm)
+            st.success(f"✅ Fitted {fitted} animals")
+        with get_read_session(farm) as db:
+            fits = get_lactation_fits(db)
+        if fits:
+            names = dict(zip(animal_df["ID"], animal_df["Name"]))
+            st.dataframe(pd.DataFrame([{
+                "Name": names.get(f.animal_id, "Unknown"),
+                "a": round(f.a, 3),
+                "b": round(f.b, 3),
+                "c": round(f.c, 4),
+                "Peak Day": round(f.peak_day) if f.peak_day is not None else None,
+                "Peak Yield (L)": round(f.peak_yield, 1) if f.peak_yield is not None else None,
+                "R²": round(f.r_squared, 2) if f.r_squared is not None else None,
+                "Records": f.n_records,
+                "Fitted": f.fitted_on,
+            } for f in fits]), use_container_width=True, hide_index=True)
+        else:
+            st.caption("No lactation curves fitted yet")
+    else:
+        st.info("No animal data available")
+
+@st.fragment
+def _data_tab(farm, animals, today):
+    # Data Export
+    st.subheader("Data Export", divider="orange")
+    
+    # Animal Data
+    with st.expander("📦 Animal Records"):
+        animal_export = pd.DataFrame([{
+            "ID": a.id, 
+            "Name": a.name, 
+            "Breed": a.breed,
+            "Date of Birth": a.date_of_birth,
+            "Age": (today - a.date_of_birth).days // 365
+        } for a in animals])
+        
+        st.dataframe(animal_export, use_container_width=True)
+        st.download_button("💾 Export Animal Data", 
+                         lambda: animal_export.to_csv(index=False),
+                         "animal_records.csv",
+                         help="Download complete animal registry")
+
+    # Milk Records
+    with st.expander("🥛 Milk Production Data"):
+        st.caption("The full milking history is built when you click export")
+        st.download_button("💾 Export Milk Data", 
+                         lambda: _milk_export_csv(farm, animals),
+                         "milk_records.csv",
+                         help="Download complete milking history")
+
 def show_dashboard():
     inject_dashboard_css()
+    farm = st.query_params.get("farm", DEFAULT_FARM)
     
     # Page Header
     st.markdown("""
@@ -39,25 +223,27 @@ def show_dashboard():
     </div>
     """, unsafe_allow_html=True)
 
-    with get_db_session() as db:
-        animals = get_all_animals(db)
-        milk_records = db.query(MilkRecord).all()
+    today = date.today()
+    versions = _versions(farm)
+    overview = _load_overview(farm, *versions, today)
+    animals = overview["animals"]
+    today_total, today_withheld = overview["totals"]
     
     # ========== Key Metrics ==========
-    col1, col2, col3, col4 = st.columns(4)
-    today = date.today()
+    col1, col2, col3, col4, col5 = st.columns(5)
     
     with col1:
         st.metric("🐄 Total Animals", len(animals), help="Registered animals in system")
     with col2:
-        today_milk = sum(r.quantity_liters for r in milk_records if r.date == today)
-        st.metric("🥛 Today's Milk", f"{today_milk} L", delta="vs yesterday")
+        st.metric("🥛 Today's Milk", f"{today_total} L", delta="vs yesterday")
     with col3:
-        avg_milk = round(sum(r.quantity_liters for r in milk_records)/len(milk_records), 1) if milk_records else 0
-        st.metric("📦 Avg Daily", f"{avg_milk} L", help="Average daily production")
+        st.metric("📦 Avg Daily", f"{round(overview['average'], 1)} L", help="Average daily production")
     with col4:
         unique_breeds = len(set(a.breed for a in animals)) if animals else 0
         st.metric("🏷️ Unique Breeds", unique_breeds)
+    with col5:
+        st.metric("💰 Saleable Today", f"{today_total - today_withheld:.1f} L",
+                  help=f"Excludes {today_withheld:.1f} L withheld for medicine withdrawal")
     
     style_metric_cards(border_left_color="#3498db", box_shadow=True)
 
@@ -65,122 +251,13 @@ def show_dashboard():
     tab1, tab2, tab3 = st.tabs(["📈 Production Analytics", "🐄 Animal Insights", "📁 Data Management"])
 
     with tab1:
-        # Date Range Selector
-        col1, col2 = st.columns(2)
-        with col1:
-            start_date = st.date_input("Start Date", value=today - timedelta(days=30))
-        with col2:
-            end_date = st.date_input("End Date", value=today)
-
-        # Production Trends
-        st.subheader("Milk Production Trends", divider="blue")
-        df_milk = pd.DataFrame([
-            {"Date": r.date, "Liters": r.quantity_liters} 
-            for r in milk_records if start_date <= r.date <= end_date
-        ])
-        
-        if not df_milk.empty:
-            fig = px.line(df_milk.groupby("Date").sum().reset_index(), 
-                        x="Date", y="Liters",
-                        title="Daily Milk Production",
-                        height=400)
-            fig.update_layout(hovermode="x unified",
-                            xaxis=dict(rangeslider=dict(visible=True)))
-            st.plotly_chart(fig, use_container_width=True)
-
-            # Productivity Comparison
-            st.subheader("📆 Productivity Comparison", divider="blue")
-            cols = st.columns(2)
-            with cols[0]:
-                current_week = df_milk[df_milk["Date"] > today - timedelta(days=7)]
-                last_week = df_milk[df_milk["Date"].between(today - timedelta(days=14), today - timedelta(days=7))]
-                if not last_week.empty and not current_week.empty:
-                    change = (current_week["Liters"].sum()/last_week["Liters"].sum() - 1) * 100
-                    st.metric("Weekly Change", f"{change:.1f}%", 
-                            delta_color="inverse" if change < 0 else "normal")
-            
-            with cols[1]:
-                st.metric("Best Day", 
-                        df_milk.loc[df_milk["Liters"].idxmax(), "Date"].strftime("%b %d") if not df_milk.empty else "N/A",
-                        f"{df_milk['Liters'].max():.1f} L")
-        else:
-            st.info("No production data in selected period")
+        _production_tab(farm, versions[1], today)
 
     with tab2:
-        # Animal Performance
-        st.subheader("Animal Performance", divider="green")
-        if animals and milk_records:
-            animal_df = pd.DataFrame([{
-                "ID": a.id,
-                "Name": a.name,
-                "Breed": a.breed,
-                "Age": (today - a.date_of_birth).days // 365,
-                "Total Milk": sum(r.quantity_liters for r in milk_records if r.animal_id == a.id)
-            } for a in animals])
-
-            # Top Performers
-            col1, col2 = st.columns(2)
-            with col1:
-                st.markdown("##### 🏆 Top 5 Producers")
-                top_5 = animal_df.sort_values("Total Milk", ascending=False).head(5)
-                fig = px.bar(top_5, x="Name", y="Total Milk", color="Breed",
-                            text_auto=".1f", height=300)
-                st.plotly_chart(fig, use_container_width=True)
-
-            # Breed Analysis
-            with col2:
-                st.markdown("##### 🧬 Breed Productivity")
-                breed_stats = animal_df.groupby("Breed").agg(
-                    Total_Milk=("Total Milk", "sum"),
-                    Avg_Milk=("Total Milk", "mean"),
-                    Count=("Breed", "count")
-                ).reset_index()
-                fig = px.scatter(breed_stats, x="Count", y="Avg_Milk", size="Total_Milk",
-                                color="Breed", hover_name="Breed", size_max=40)
-                st.plotly_chart(fig, use_container_width=True)
-
-            # Age vs Productivity
-            st.markdown("##### 📅 Age vs Milk Production")
-            fig = px.scatter(animal_df, x="Age", y="Total Milk", color="Breed",
-                            hover_data=["Name"], trendline="lowess")
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("No animal data available")
+        _animal_tab(farm, versions, today)
 
     with tab3:
-        # Data Export
-        st.subheader("Data Export", divider="orange")
-        
-        # Animal Data
-        with st.expander("📦 Animal Records"):
-            animal_export = pd.DataFrame([{
-                "ID": a.id, 
-                "Name": a.name, 
-                "Breed": a.breed,
-                "Date of Birth": a.date_of_birth,
-                "Age": (today - a.date_of_birth).days // 365
-            } for a in animals])
-            
-            st.dataframe(animal_export, use_container_width=True)
-            st.download_button("💾 Export Animal Data", 
-                             animal_export.to_csv(index=False), 
-                             "animal_records.csv",
-                             help="Download complete animal registry")
-
-        # Milk Records
-        with st.expander("🥛 Milk Production Data"):
-            milk_export = pd.DataFrame([{
-                "Animal ID": r.animal_id,
-                "Animal Name": next((a.name for a in animals if a.id == r.animal_id), "Unknown"),
-                "Date": r.date,
-                "Liters": r.quantity_liters
-            } for r in milk_records])
-            
-            st.dataframe(milk_export, use_container_width=True)
-            st.download_button("💾 Export Milk Data", 
-                             milk_export.to_csv(index=False), 
-                             "milk_records.csv",
-                             help="Download complete milking history")
+        _data_tab(farm, animals, today)
 
     # ========== Footer ==========
     st.markdown("---")
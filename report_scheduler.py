@@ -0,0 +1,217 @@
+"""
+Offline report generation.
+
+Renders the dashboard's metrics, charts and CSV extracts for fixed monthly
+periods into REPORTS_DIR/<farm>/<YYYY-MM>/ and records every report in
+REPORTS_DIR/manifest.json, so the Reports page can serve prebuilt files
+instead of recomputing them on every view. Closed months are only built
+once; the current month is rebuilt on every run.
+
+Each report contains:
+    metrics.json              headline metrics for the period
+    report.html               metrics and interactive charts
+    <chart>.png, <chart>.pdf  static chart exports (needs kaleido; skipped with a
+                              warning when it is missing)
+    animals.csv, milk.csv, feed.csv, medicine.csv
+
+Usage:
+    python report_scheduler.py [--farm FARM | --all-farms] [--months 3] [--every SECONDS]
+"""
+import argparse
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from charts import (milk_frame, daily_production_figure, animal_performance_frame, top_producers_figure,
+                    breed_productivity_figure, age_production_figure)
+from crud import (DEFAULT_FARM, FeedRecord, MedicineRecord, get_milk_totals, get_read_session, list_animals,
+                  list_farms, list_milk_records)
+
+REPORTS_DIR = 'reports'
+MANIFEST = 'manifest.json'
+
+log = logging.getLogger(__name__)
+
+
+def month_periods(months, today=None):
+    """The current month and the `months - 1` before it, as (label, start, end) tuples."""
+    today = today or date.today()
+    periods = []
+    start = today.replace(day=1)
+    for _ in range(months):
+        next_month = (start + timedelta(days=32)).replace(day=1)
+        periods.append((start.strftime('%Y-%m'), start, min(next_month - timedelta(days=1), today)))
+        start = (start - timedelta(days=1)).replace(day=1)
+    return periods
+
+
+def load_manifest(reports_dir=REPORTS_DIR):
+    path = os.path.join(reports_dir, MANIFEST)
+    if not os.path.isfile(path):
+        return {'reports': []}
+    with open(path) as f:
+        return json.load(f)
+
+
+@contextmanager
+def _manifest_lock(reports_dir):
+    """Exclusive lock on the manifest across threads and processes (the app and a cron run, say)."""
+    os.makedirs(reports_dir, exist_ok=True)
+    with open(os.path.join(reports_dir, MANIFEST + '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _save_manifest(manifest, reports_dir):
+    path = os.path.join(reports_dir, MANIFEST)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _export_static(figures, out_dir):
+    """Write PNG and PDF exports when kaleido is installed; return the files written."""
+    written = []
+    try:
+        for name, fig in figures.items():
+            for fmt in ('png', 'pdf'):
+                fig.write_image(os.path.join(out_dir, f'{name}.{fmt}'))
+                written.append(f'{name}.{fmt}')
+    except (ImportError, ValueError, RuntimeError) as e:
+        log.warning("Skipped PNG/PDF chart exports in %s (is kaleido installed?): %s", out_dir, e)
+    return written
+
+
+def build_report(farm_id, label, start, end, reports_dir=REPORTS_DIR):
+    """Render one farm/period report and return its manifest entry."""
+    out_dir = os.path.join(reports_dir, farm_id, label)
+    os.makedirs(out_dir, exist_ok=True)
+
+    with get_read_session(farm_id) as db:
+        animals = list_animals(db)
+        milk_records = list_milk_records(db, start, end)
+        total, withheld = get_milk_totals(db, start, end)
+        feed = pd.read_sql(db.query(FeedRecord).filter(FeedRecord.date.between(start, end)).statement, db.bind)
+        medicine = pd.read_sql(db.query(MedicineRecord).filter(MedicineRecord.date.between(start, end)).statement,
+                               db.bind)
+
+    df_milk = milk_frame(milk_records)
+    animal_df = animal_performance_frame(animals, milk_records, end)
+    days = (end - start).days + 1
+    metrics = {
+        'farm': farm_id,
+        'period': label,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'total_animals': len(animals),
+        'unique_breeds': len({a.breed for a in animals}),
+        'milk_liters': round(total, 2),
+        'saleable_liters': round(total - withheld, 2),
+        'avg_daily_liters': round(total / days, 2),
+        'feed_kg': round(float(feed['quantity_kg'].sum()), 2) if not feed.empty else 0.0,
+        'treatments': len(medicine),
+    }
+    files = ['metrics.json']
+    with open(os.path.join(out_dir, 'metrics.json'), 'w') as f:
+        json.dump(metrics, f, indent=2)
+
+    figures = {}
+    if not df_milk.empty:
+        figures['daily_production'] = daily_production_figure(df_milk)
+    if not animal_df.empty and milk_records:
+        figures['top_producers'] = top_producers_figure(animal_df)
+        figures['breed_productivity'] = breed_productivity_figure(animal_df)
+        figures['age_vs_production'] = age_production_figure(animal_df)
+
+    rows = ''.join(f'<tr><th>{k.replace("_", " ").title()}</th><td>{v}</td></tr>' for k, v in metrics.items())
+    charts = ''.join(fig.to_html(full_html=False, include_plotlyjs='cdn' if i == 0 else False)
+                     for i, fig in enumerate(figures.values()))
+    with open(os.path.join(out_dir, 'report.html'), 'w') as f:
+        f.write(f'<html><head><meta charset="utf-8"><title>{farm_id} {label}</title></head><body>'
+                f'<h1>DairyFarm Report: {farm_id} {label}</h1><table>{rows}</table>{charts}</body></html>')
+    files.append('report.html')
+    files += _export_static(figures, out_dir)
+
+    extracts = {
+        'animals.csv': pd.DataFrame(animals),
+        'milk.csv': pd.DataFrame(milk_records),
+        'feed.csv': feed,
+        'medicine.csv': medicine,
+    }
+    for name, df in extracts.items():
+        df.to_csv(os.path.join(out_dir, name), index=False)
+        files.append(name)
+
+    return {
+        'farm': farm_id,
+        'period': label,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'path': os.path.relpath(out_dir, reports_dir),
+        'files': files,
+    }
+
+
+def run_scheduled_reports(farms=None, months=3, reports_dir=REPORTS_DIR):
+    """Build missing or still-open monthly reports for the given farms. Returns the entries built."""
+    farms = farms or [DEFAULT_FARM]
+    today = date.today()
+    built = []
+    with _manifest_lock(reports_dir):
+        manifest = load_manifest(reports_dir)
+        existing = {(r['farm'], r['period']): r for r in manifest['reports']}
+        for farm_id in farms:
+            for label, start, end in month_periods(months, today):
+                previous = existing.get((farm_id, label))
+                # Closed months never change once built after their last day
+                if previous and previous['end'] == end.isoformat() and previous['generated_at'][:10] > previous['end']:
+                    continue
+                entry = build_report(farm_id, label, start, end, reports_dir)
+                existing[(farm_id, label)] = entry
+                built.append(entry)
+        manifest['reports'] = sorted(existing.values(), key=lambda r: (r['farm'], r['period']), reverse=True)
+        _save_manifest(manifest, reports_dir)
+    return built
+
+
+def start_background_scheduler(interval_seconds=3600, farms=None, months=3):
+    """Rebuild reports every `interval_seconds` in a daemon thread."""
+    def loop():
+        while True:
+            run_scheduled_reports(farms or list_farms(), months)
+            time.sleep(interval_seconds)
+
+    thread = threading.Thread(target=loop, name='report-scheduler', daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prebuild monthly farm reports")
+    parser.add_argument('--farm', default=None, help="Farm id (default farm if omitted)")
+    parser.add_argument('--all-farms', action='store_true', help="Build reports for every farm")
+    parser.add_argument('--months', type=int, default=3, help="Number of monthly periods, including the current one")
+    parser.add_argument('--every', type=int, default=None, help="Keep running and rebuild every N seconds")
+    args = parser.parse_args()
+
+    def selected_farms():
+        return list_farms() if args.all_farms else [args.farm or DEFAULT_FARM]
+
+    while True:
+        for entry in run_scheduled_reports(selected_farms(), args.months):
+            print(f"Built {entry['farm']} {entry['period']} -> {os.path.join(REPORTS_DIR, entry['path'])}")
+        if not args.every:
+            break
+        time.sleep(args.every)
@@ -0,0 +1,150 @@
+"""
+Parlour sensor ingestion.
+
+Milk meters report one reading per milking (yield, conductivity, flow rate,
+duration). Readings are stored in sensor_readings, a WITHOUT ROWID table
+clustered on (animal_id, ts) with ts in unix seconds, so a reading costs a
+few dozen bytes and one animal's history is a contiguous range of the
+primary key.
+
+`ingest_readings` consumes any iterable in fixed-size batches, so a meter
+export can be streamed without loading it into memory. Each batch is
+written in one transaction together with the rollup of the animal-days it
+touched into MilkRecords of session METER_SESSION ('Meter'), so daily
+totals and withheld flags always match the raw readings while manual
+entries are left alone. The rollups go through validation.py like any
+other milk write: a total that fails a rule, including one for an
+animal-day that already has manual records, is quarantined rather than
+counted twice. Totals that did not change are not written again, and a
+recomputed total replaces the one already quarantined for its animal-day,
+so repeated batches do not pile up duplicates for review. Re-sending a
+reading (same animal and timestamp) replaces it.
+
+Usage:
+    python sensors.py [--farm FARM] [--batch 5000] < readings.csv
+    (CSV columns: animal_id,ts,yield_liters[,conductivity,flow_rate,duration_s];
+     ts as unix seconds or ISO 8601)
+"""
+import argparse
+import csv
+import sys
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+from sqlalchemy import func, tuple_
+
+from crud import (DEFAULT_FARM, METER_SESSION, MilkRecord, QuarantinedRecord, SensorReading, get_db_session,
+                  init_db)
+from validation import upsert_validated
+
+INGEST_BATCH = 5000
+FIELDS = ('animal_id', 'ts', 'yield_liters', 'conductivity', 'flow_rate', 'duration_s')
+
+_INSERT_SQL = (f"INSERT OR REPLACE INTO sensor_readings ({', '.join(FIELDS)}) "
+               f"VALUES ({', '.join('?' * len(FIELDS))})")
+
+# Daily totals for local calendar days; the IN list and ts range make this a
+# primary-key range search per animal
+_ROLLUP_SQL = """
+SELECT animal_id, date(ts, 'unixepoch', 'localtime') AS day, SUM(yield_liters)
+FROM sensor_readings
+WHERE animal_id IN ({animals}) AND ts >= ? AND ts < ?
+GROUP BY animal_id, day
+"""
+
+
+def _epoch(value):
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = str(value).strip()
+    return int(value) if value.isdigit() else int(datetime.fromisoformat(value).timestamp())
+
+
+def _optional(value, cast):
+    return None if value in (None, '') else cast(value)
+
+
+def _row(reading):
+    return (int(reading['animal_id']), _epoch(reading['ts']), float(reading['yield_liters']),
+            _optional(reading.get('conductivity'), float), _optional(reading.get('flow_rate'), float),
+            _optional(reading.get('duration_s'), int))
+
+
+def _day_bounds(days):
+    """Unix second range covering a set of local calendar days."""
+    start = datetime.combine(min(days), datetime.min.time())
+    end = datetime.combine(max(days) + timedelta(days=1), datetime.min.time())
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def _rollup(db, touched):
+    """Recompute the meter total of every (animal_id, day) in `touched`; returns the rejections."""
+    animal_ids = sorted({animal_id for animal_id, _ in touched})
+    start, end = _day_bounds({day for _, day in touched})
+    sql = _ROLLUP_SQL.format(animals=', '.join('?' * len(animal_ids)))
+    stored = dict(((animal_id, day), liters) for animal_id, day, liters in
+                  db.query(MilkRecord.animal_id, MilkRecord.date, MilkRecord.quantity_liters)
+                  .filter(MilkRecord.animal_id.in_(animal_ids), MilkRecord.session == METER_SESSION,
+                          MilkRecord.date >= min(day for _, day in touched),
+                          MilkRecord.date <= max(day for _, day in touched)))
+    totals = []
+    for animal_id, day, liters in db.connection().exec_driver_sql(sql, (*animal_ids, start, end)):
+        day = date.fromisoformat(day)
+        # Re-sent readings often leave a total as it was; only changed totals are written
+        if (animal_id, day) in touched and stored.get((animal_id, day)) != liters:
+            totals.append({'animal_id': animal_id, 'date': day, 'quantity_liters': liters,
+                           'session': METER_SESSION})
+    if totals:
+        # A recomputed total supersedes the one held for review, so each animal-day has one at most
+        db.query(QuarantinedRecord).filter(
+            QuarantinedRecord.kind == 'milk', QuarantinedRecord.source == 'sensors',
+            tuple_(QuarantinedRecord.animal_id, QuarantinedRecord.date).in_(
+                [(t['animal_id'], t['date']) for t in totals])).delete(synchronize_session=False)
+    # Commits the readings, the totals and any quarantined totals together
+    _, rejected = upsert_validated(db, 'milk', totals, 'sensors')
+    return rejected
+
+
+def ingest_readings(farm_id, readings, batch_size=INGEST_BATCH):
+    """Stream readings (dicts with FIELDS) into a farm database. Returns the number stored."""
+    readings = iter(readings)
+    stored = 0
+    with get_db_session(farm_id) as db:
+        while True:
+            batch = [_row(r) for r in islice(readings, batch_size)]
+            if not batch:
+                break
+            db.connection().exec_driver_sql(_INSERT_SQL, batch)
+            touched = {(animal_id, datetime.fromtimestamp(ts).date()) for animal_id, ts, *_ in batch}
+            _rollup(db, touched)
+            stored += len(batch)
+    return stored
+
+
+def get_sensor_readings(db_session, animal_id, start=None, end=None):
+    """Readings for one animal between two datetimes, as a range scan of the primary key."""
+    query = db_session.query(SensorReading).filter(SensorReading.animal_id == animal_id)
+    if start is not None:
+        query = query.filter(SensorReading.ts >= _epoch(start))
+    if end is not None:
+        query = query.filter(SensorReading.ts < _epoch(end))
+    return query.order_by(SensorReading.ts).all()
+
+
+def get_sensor_stats(db_session):
+    return db_session.query(func.count(), func.min(SensorReading.ts), func.max(SensorReading.ts)).one()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingest parlour sensor readings from CSV on stdin")
+    parser.add_argument('--farm', default=DEFAULT_FARM)
+    parser.add_argument('--batch', type=int, default=INGEST_BATCH)
+    args = parser.parse_args()
+    init_db(args.farm)
+    started = time.perf_counter()
+    count = ingest_readings(args.farm, csv.DictReader(sys.stdin), args.batch)
+    elapsed = time.perf_counter() - started
+    print(f"Stored {count} readings in {elapsed:.1f}s ({count / elapsed if elapsed else 0:,.0f}/s)")
@@ -0,0 +1,243 @@
+"""
+Memory instrumentation and per-session memory budgets.
+
+Three pieces, all shown on the Diagnostics page (?page=Diagnostics):
+
+* `profile_page(name)` wraps each page run in app.py. It always records the
+  wall time and, while tracemalloc is tracing (DAIRY_TRACEMALLOC=1 at start
+  up, or switched on from the Diagnostics page), takes a snapshot before and
+  after the page and keeps the net allocation and the top allocating lines.
+  tracemalloc traces the whole process, not one session: while other
+  sessions run at the same time, their allocations land in the same
+  snapshots. These figures are per-process and only indicative for the
+  named session, so nothing is enforced from them.
+* `session_cached(key, build)` keeps a page's working set (loaded history,
+  built exports) in the current session, sized with `deep_sizeof`. Once the
+  session's cached data passes SESSION_BUDGET_BYTES (DAIRY_SESSION_MEMORY_MB,
+  default 128) the least recently used entries are evicted, and a value
+  bigger than the whole budget is returned without being kept, so one big
+  export cannot pin memory for the rest of the session. Budgets are
+  enforced only from these per-session `deep_sizeof` figures.
+* A process-wide registry of every session's accounted bytes, so the
+  Diagnostics page can show which sessions hold the most.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+SESSION_BUDGET_BYTES = int(os.environ.get('DAIRY_SESSION_MEMORY_MB', '128')) * 1024 * 1024
+TRACE_FRAMES = 10
+PROFILE_HISTORY = 200
+TOP_LINES = 10
+# Sessions not seen for this long are dropped from the registry
+SESSION_IDLE_SECONDS = 3600
+
+_CACHE_KEY = '_session_cache'
+
+if os.environ.get('DAIRY_TRACEMALLOC') == '1' and not tracemalloc.is_tracing():
+    tracemalloc.start(TRACE_FRAMES)
+
+
+def deep_sizeof(obj, _seen=None):
+    """Approximate bytes held by obj, following containers; DataFrames and arrays count their buffers."""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True, index=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True, index=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, _seen) + deep_sizeof(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_sizeof(item, _seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), _seen)
+    return size
+
+
+# Page profiles
+# -------------
+
+class PageProfile(NamedTuple):
+    page: str
+    session_id: str
+    started: float
+    seconds: float
+    net_bytes: Optional[int]
+    peak_bytes: Optional[int]
+    top: tuple
+
+
+_profiles = deque(maxlen=PROFILE_HISTORY)
+_trace_lock = threading.Lock()
+
+
+def set_tracing(enabled):
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else 'no-session'
+
+
+@contextmanager
+def profile_page(name):
+    """
+    Record wall time and, while tracemalloc is tracing, the process-wide
+    allocations made during one page run (including other sessions' work).
+    """
+    tracing = tracemalloc.is_tracing()
+    before = None
+    if tracing:
+        # One snapshot at a time: each copies every live trace
+        with _trace_lock:
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+    started = time.time()
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - began
+        net = peak = None
+        top = ()
+        if tracing and tracemalloc.is_tracing():
+            with _trace_lock:
+                peak = tracemalloc.get_traced_memory()[1]
+                stats = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+            net = sum(s.size_diff for s in stats)
+            top = tuple((str(s.traceback[0]), s.size_diff, s.count_diff)
+                        for s in sorted(stats, key=lambda s: -s.size_diff)[:TOP_LINES])
+        _profiles.append(PageProfile(name, _session_id(), started, seconds, net, peak, top))
+        _note_session(name)
+
+
+def page_profiles():
+    """Recorded page runs, newest first."""
+    return list(reversed(_profiles))
+
+
+# Session accounting
+# ------------------
+
+class SessionUsage(NamedTuple):
+    session_id: str
+    page: str
+    cached_bytes: int
+    entries: int
+    evictions: int
+    last_seen: float
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class _SessionCache:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, value, size, budget):
+        self.discard(key)
+        if size > budget:
+            self.evictions += 1
+            return
+        self.entries[key] = (value, size)
+        self.size += size
+        while self.size > budget:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= evicted
+            self.evictions += 1
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+def _cache():
+    if _CACHE_KEY not in st.session_state:
+        st.session_state[_CACHE_KEY] = _SessionCache()
+    return st.session_state[_CACHE_KEY]
+
+
+def session_cached(key, build, budget=None):
+    """
+    Return the value cached under `key` in this session, calling `build()`
+    on a miss. `key` should include whatever the value depends on (filters,
+    table versions) since entries are only dropped by eviction.
+    """
+    cache = _cache()
+    entry = cache.get(key)
+    if entry is not None:
+        return entry[0]
+    value = build()
+    cache.put(key, value, deep_sizeof(value), budget or SESSION_BUDGET_BYTES)
+    return value
+
+
+def clear_session_cache():
+    _cache().clear()
+
+
+def session_state_sizes():
+    """(key, bytes) for every st.session_state entry of the current session, largest first."""
+    sizes = []
+    for key, value in st.session_state.to_dict().items():
+        if key == _CACHE_KEY:
+            sizes.extend((f"{_CACHE_KEY}[{entry_key!r}]", size) for entry_key, (_, size) in value.entries.items())
+        else:
+            sizes.append((key, deep_sizeof(value)))
+    return sorted(sizes, key=lambda item: -item[1])
+
+
+def _note_session(page):
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    cache = st.session_state.get(_CACHE_KEY)
+    now = time.time()
+    with _sessions_lock:
+        _sessions[ctx.session_id] = SessionUsage(ctx.session_id, page, cache.size if cache else 0,
+                                                 len(cache.entries) if cache else 0,
+                                                 cache.evictions if cache else 0, now)
+        for session_id in [s for s, usage in _sessions.items() if now - usage.last_seen > SESSION_IDLE_SECONDS]:
+            del _sessions[session_id]
+
+
+def session_usage():
+    """Accounted cache bytes of every recently seen session, largest first."""
+    with _sessions_lock:
+        return sorted(_sessions.values(), key=lambda usage: -usage.cached_bytes)
@@ -0,0 +1,236 @@
+"""
+Herd and breed yield percentiles from mergeable quantile sketches.
+
+The statistic ranked is an animal's average daily yield for a month: its
+milk total over the days it has milk records. crud keeps those totals in
+animal_month_yields with triggers on milk_records, so every write path
+(forms, API, journal replay, sensor rollups) is covered and an animal's
+value is a primary-key lookup.
+
+Each (month, breed) keeps a KLL sketch of its animals' average daily
+yields in yield_sketches, plus one herd-wide sketch per month under breed
+'*'. A milk write only flags its month in stale_sketch_months (a primary
+key insert), since a changed average cannot be taken back out of a
+sketch. `update_yield_sketches` rebuilds the flagged months once from
+animal_month_yields and stores them; the pages call it through
+`refresh_yield_sketches` before reading, which costs one lookup when
+nothing is stale, and maintenance.py runs it too. A lookup that meets a
+stale month (on a read snapshot that is behind, say) builds it in memory.
+Sketches for several months merge into one for longer periods, and a
+percentile lookup reads a few hundred retained items whatever the herd
+size (rank error is around 1% with the default k).
+
+Usage:
+    python sketches.py [--farm FARM] [--rebuild]
+"""
+import argparse
+import json
+import random
+from bisect import bisect_right
+from typing import NamedTuple, Optional
+
+from sqlalchemy import func
+
+from crud import (Animal, AnimalMonthYield, DEFAULT_FARM, StaleSketchMonth, YieldSketch, get_db_session, init_db,
+                  seed_month_yields)
+
+HERD = '*'
+SKETCH_K = 200
+
+
+class KLLSketch:
+    """KLL quantile sketch: level h holds items standing for 2**h observations each."""
+
+    def __init__(self, k=SKETCH_K, levels=None, n=0):
+        self.k = k
+        self.levels = levels or [[]]
+        self.n = n
+        self._cdf = None
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(self.k * (2 / 3) ** depth))
+
+    def _compress(self):
+        while sum(len(items) for items in self.levels) > sum(self._capacity(h) for h in range(len(self.levels))):
+            for h, items in enumerate(self.levels):
+                if len(items) >= self._capacity(h):
+                    if h + 1 == len(self.levels):
+                        self.levels.append([])
+                    items.sort()
+                    # Keep an odd leftover at this level so no weight is lost
+                    leftover = [items.pop()] if len(items) % 2 else []
+                    self.levels[h + 1].extend(items[random.getrandbits(1)::2])
+                    self.levels[h] = leftover
+                    break
+
+    def update(self, value):
+        self.levels[0].append(float(value))
+        self.n += 1
+        self._cdf = None
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, items in enumerate(other.levels):
+            self.levels[h].extend(items)
+        self.n += other.n
+        self._cdf = None
+        self._compress()
+        return self
+
+    def _sorted_cdf(self):
+        # Retained items in value order with cumulative weights, built once per change
+        if self._cdf is None:
+            values, cumulative, total = [], [], 0
+            for value, weight in sorted((v, 2 ** h) for h, items in enumerate(self.levels) for v in items):
+                total += weight
+                values.append(value)
+                cumulative.append(total)
+            self._cdf = values, cumulative
+        return self._cdf
+
+    def rank(self, value):
+        """Approximate fraction of observations <= value."""
+        if not self.n:
+            return None
+        values, cumulative = self._sorted_cdf()
+        i = bisect_right(values, value)
+        return cumulative[i - 1] / self.n if i else 0.0
+
+    def quantile(self, q):
+        values, cumulative = self._sorted_cdf()
+        if not values:
+            return None
+        return values[min(bisect_right(cumulative, q * self.n), len(values) - 1)]
+
+    def to_json(self):
+        return json.dumps({'k': self.k, 'n': self.n, 'levels': self.levels})
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        return cls(data['k'], data['levels'], data['n'])
+
+
+def _average_daily():
+    return AnimalMonthYield.liters / AnimalMonthYield.days
+
+
+def _build_month_sketches(db_session, month):
+    """{breed: sketch} of the animals' average daily yields in one month, including the HERD sketch."""
+    sketches = {}
+    for breed, average in (db_session.query(Animal.breed, _average_daily())
+                           .join(Animal, Animal.id == AnimalMonthYield.animal_id)
+                           .filter(AnimalMonthYield.month == month)):
+        for key in (breed, HERD):
+            sketches.setdefault(key, KLLSketch()).update(average)
+    return sketches
+
+
+def update_yield_sketches(db_session):
+    """Rebuild and store the sketches of every month flagged stale by a milk write; returns the month count."""
+    months = [m for (m,) in db_session.query(StaleSketchMonth.month)]
+    for month in months:
+        db_session.query(YieldSketch).filter(YieldSketch.month == month).delete()
+        db_session.add_all(YieldSketch(month=month, breed=breed, sketch=sketch.to_json())
+                           for breed, sketch in _build_month_sketches(db_session, month).items())
+        db_session.query(StaleSketchMonth).filter(StaleSketchMonth.month == month).delete()
+    db_session.commit()
+    return len(months)
+
+
+def refresh_yield_sketches(farm_id=None):
+    """Store fresh sketches for any stale months of a farm; a single lookup when none are stale."""
+    with get_db_session(farm_id) as db:
+        if db.query(StaleSketchMonth.month).first() is None:
+            return 0
+        return update_yield_sketches(db)
+
+
+def rebuild_yield_sketches(db_session):
+    """Recompute the monthly totals from milk_records and every sketch from them."""
+    seed_month_yields(db_session.connection())
+    db_session.query(YieldSketch).delete()
+    return update_yield_sketches(db_session)
+
+
+def get_yield_sketch(db_session, breed, months):
+    """One sketch for a breed (or HERD) merged over the given YYYY-MM months; None if there is no data."""
+    merged = None
+    for month in months:
+        sketch = get_month_sketches(db_session, month).get(breed)
+        if sketch is not None:
+            merged = sketch if merged is None else merged.merge(sketch)
+    return merged
+
+
+def get_month_sketches(db_session, month):
+    """{breed: sketch} for one month, including the HERD sketch; built in memory if stale or not stored yet."""
+    if db_session.get(StaleSketchMonth, month) is None:
+        stored = {breed: KLLSketch.from_json(text) for breed, text in
+                  db_session.query(YieldSketch.breed, YieldSketch.sketch).filter(YieldSketch.month == month)}
+        if stored:
+            return stored
+    return _build_month_sketches(db_session, month)
+
+
+def latest_yield_month(db_session):
+    return db_session.query(func.max(AnimalMonthYield.month)).scalar()
+
+
+class PercentileRow(NamedTuple):
+    animal_id: int
+    breed: str
+    average_liters: float
+    breed_rank: Optional[float]
+    herd_rank: Optional[float]
+
+
+def get_percentile_ranks(db_session, month=None):
+    """
+    Rank every animal's average daily yield in `month` (the latest month with
+    milk by default) against its breed's and the herd's sketches. Only reads,
+    so it can run on a read session. Returns (month, {animal_id: PercentileRow}).
+    """
+    month = month or latest_yield_month(db_session)
+    if month is None:
+        return None, {}
+    sketches = get_month_sketches(db_session, month)
+    averages = (db_session.query(AnimalMonthYield.animal_id, Animal.breed, _average_daily())
+                .join(Animal, Animal.id == AnimalMonthYield.animal_id)
+                .filter(AnimalMonthYield.month == month))
+    ranks = {}
+    for animal_id, breed, average in averages:
+        breed_sketch, herd_sketch = sketches.get(breed), sketches.get(HERD)
+        ranks[animal_id] = PercentileRow(animal_id, breed, average,
+                                         breed_sketch.rank(average) if breed_sketch else None,
+                                         herd_sketch.rank(average) if herd_sketch else None)
+    return month, ranks
+
+
+def percentile_badge(rank):
+    if rank is None:
+        return ""
+    if rank >= 0.9:
+        return "🏅 Top 10%"
+    if rank >= 0.75:
+        return "⬆️ Top 25%"
+    if rank <= 0.1:
+        return "⚠️ Bottom 10%"
+    if rank <= 0.25:
+        return "⬇️ Bottom 25%"
+    return ""
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Update herd and breed yield sketches")
+    parser.add_argument('--farm', default=DEFAULT_FARM)
+    parser.add_argument('--rebuild', action='store_true', help="Discard and rebuild every sketch")
+    args = parser.parse_args()
+    init_db(args.farm)
+    with get_db_session(args.farm) as db:
+        updated = rebuild_yield_sketches(db) if args.rebuild else update_yield_sketches(db)
+    print(f"Updated {updated} sketches.")
@@ -0,0 +1,268 @@
+"""
+Multi-user load and soak test for the Streamlit app.
+
+Simulates N concurrent users, each on its own thread and Streamlit session,
+picking flows at random with think time in between:
+
+    milk      a burst of single milk entries on one session, one transaction
+              each, through upsert_milk_record. This is the Milk page form's
+              write without its validation and offline-journal fallback, so
+              "database is locked" errors surface here instead of being
+              journaled
+    dashboard a full run of the Analytics page in a headless AppTest session;
+              the session is kept for the whole test like a browser tab
+    export    one animal's milk history as CSV (Milk page) and the full milk
+              export from the dashboard
+
+For every flow it records latency percentiles, "database is locked" errors
+and other failures (counted by exception type and message), and samples the process RSS every few seconds so memory
+growth over a long soak is visible. The JSON report can be compared with
+one from an earlier release. Use a scratch farm so real data is untouched:
+
+    python soak_test.py --farm soaktest --users 8 --seconds 600 --label v1.4
+    python soak_test.py --farm soaktest --users 8 --seconds 600 --compare soak_reports/v1.4-....json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from streamlit.testing.v1 import AppTest
+
+from crud import (MilkRecord, create_animal, create_farm, create_milk_records, get_db_session, get_read_session,
+                  list_animals, list_milk_by_animal, upsert_milk_record)
+from pages.reports import _milk_export_csv
+
+REPORT_DIR = 'soak_reports'
+FLOWS = ('milk', 'dashboard', 'export')
+LOCK_MESSAGES = ('database is locked', 'database table is locked', 'database is busy')
+# Distinct failures kept per flow in the report, most frequent first
+TOP_FAILURES = 10
+
+
+def _is_lock_error(message):
+    return any(text in message for text in LOCK_MESSAGES)
+
+
+def _rss_mb():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak rather than current RSS, but still shows growth where /proc is missing
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _release():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _seed(farm, animals, history_days):
+    """Make sure the scratch farm has `animals` animals with `history_days` of daily milk."""
+    create_farm(farm)
+    with get_db_session(farm) as db:
+        ids = [a.id for a in list_animals(db)]
+        for i in range(len(ids), animals):
+            ids.append(create_animal(db, f"Soak Cow {i + 1}", random.choice(['Holstein', 'Jersey', 'Sahiwal']),
+                                     date(2020, 1, 1)).id)
+        ids = ids[:animals]
+        if db.query(MilkRecord.id).first() is None:
+            first = date.today() - timedelta(days=history_days)
+            create_milk_records(db, [{'animal_id': a, 'date': first + timedelta(days=d),
+                                      'quantity_liters': round(random.uniform(8, 30), 2)}
+                                     for d in range(history_days) for a in ids])
+    return ids
+
+
+class _User:
+    def __init__(self, farm, animal_ids, burst, history_days):
+        self.farm = farm
+        self.animal_ids = animal_ids
+        self.burst = burst
+        self.history_days = history_days
+        self.app = None
+
+    def milk(self):
+        day = date.today() - timedelta(days=random.randrange(self.history_days))
+        with get_db_session(self.farm) as db:
+            for _ in range(self.burst):
+                upsert_milk_record(db, random.choice(self.animal_ids), day, round(random.uniform(5, 35), 2),
+                                   random.choice(['Morning', 'Evening']))
+
+    def dashboard(self):
+        if self.app is None:
+            self.app = AppTest.from_file('app.py', default_timeout=120)
+            self.app.query_params['page'] = 'Dashboard'
+            self.app.query_params['farm'] = self.farm
+        self.app.run()
+        if self.app.exception:
+            raise RuntimeError(self.app.exception[0].message)
+        failures = [e.value for e in self.app.error]
+        if failures:
+            raise RuntimeError(failures[0])
+
+    def export(self):
+        animal_id = random.choice(self.animal_ids)
+        with get_read_session(self.farm) as db:
+            history = list_milk_by_animal(db, animal_id, date.today() - timedelta(days=90), date.today())
+            animals = list_animals(db)
+        history_csv = "Date,Session,Quantity,Animal\n" + "\n".join(
+            f"{r.date},{r.session},{r.quantity_liters},{animal_id}" for r in history)
+        return len(history_csv) + len(_milk_export_csv(self.farm, animals))
+
+
+def _run_user(user, weights, think, deadline, results):
+    flows, cumulative = zip(*weights.items())
+    while time.monotonic() < deadline:
+        flow = random.choices(flows, cumulative)[0]
+        began = time.perf_counter()
+        outcome, failure = 'ok', None
+        try:
+            getattr(user, flow)()
+        except Exception as e:
+            # OperationalError from crud, or the page's own error box for the dashboard
+            outcome = 'locked' if _is_lock_error(str(e)) else 'error'
+            # First line only: SQLAlchemy appends the statement and parameters
+            failure = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"[:200]
+        results.append((flow, time.perf_counter() - began, outcome, failure))
+        time.sleep(random.expovariate(1 / think) if think else 0)
+
+
+def _sample_rss(interval, stop, began, results, samples):
+    while not stop.wait(interval):
+        samples.append((round(time.monotonic() - began, 1), round(_rss_mb(), 1), len(results)))
+
+
+def _summarise(results, flow):
+    latencies = [latency for name, latency, _, _ in results if name == flow]
+    outcomes = [outcome for name, _, outcome, _ in results if name == flow]
+    failures = Counter(failure for name, _, _, failure in results if name == flow and failure)
+    summary = {'count': len(latencies), 'lock_errors': outcomes.count('locked'), 'errors': outcomes.count('error'),
+               'failures': dict(failures.most_common(TOP_FAILURES))}
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100)
+        summary.update(p50_ms=round(cuts[49] * 1000, 1), p95_ms=round(cuts[94] * 1000, 1),
+                       p99_ms=round(cuts[98] * 1000, 1), max_ms=round(max(latencies) * 1000, 1))
+    return summary
+
+
+def _rss_growth(samples):
+    """RSS growth in MB/minute over the second half of the run, after caches have warmed up."""
+    settled = samples[len(samples) // 2:]
+    if len(settled) < 2:
+        return None
+    slope = statistics.linear_regression([s[0] for s in settled], [s[1] for s in settled]).slope
+    return round(slope * 60, 2)
+
+
+def run(farm, users, seconds, weights, think, burst, animals, history_days, sample_interval, label):
+    animal_ids = _seed(farm, animals, history_days)
+    results, samples = [], []
+    began = time.monotonic()
+    samples.append((0.0, round(_rss_mb(), 1), 0))
+    stop = threading.Event()
+    sampler = threading.Thread(target=_sample_rss, args=(sample_interval, stop, began, results, samples), daemon=True)
+    sampler.start()
+    deadline = began + seconds
+    threads = [threading.Thread(target=_run_user, args=(_User(farm, animal_ids, burst, history_days), weights,
+                                                          think, deadline, results))
+               for _ in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stop.set()
+    sampler.join()
+    elapsed = time.monotonic() - began
+    samples.append((round(elapsed, 1), round(_rss_mb(), 1), len(results)))
+
+    return {
+        'label': label or _release(),
+        'release': _release(),
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'config': {'farm': farm, 'users': users, 'seconds': seconds, 'weights': weights, 'think': think,
+                   'burst': burst, 'animals': animals, 'history_days': history_days},
+        'elapsed_s': round(elapsed, 1),
+        'flows': {flow: _summarise(results, flow) for flow in weights},
+        'rss': {'start_mb': samples[0][1], 'end_mb': samples[-1][1], 'peak_mb': max(s[1] for s in samples),
+                'growth_mb_per_min': _rss_growth(samples), 'samples': samples},
+    }
+
+
+def print_report(report, baseline=None):
+    def delta(value, old):
+        if value is None or old is None:
+            return ''
+        return f" ({value - old:+.1f})"
+
+    print(f"Release: {report['label']}  Users: {report['config']['users']}  Duration: {report['elapsed_s']}s")
+    if baseline:
+        print(f"Compared with: {baseline['label']} ({baseline['started']})")
+    print(f"{'Flow':<10} {'Count':>7} {'Locked':>7} {'Errors':>7} {'p50 ms':>16} {'p95 ms':>16} {'p99 ms':>16}")
+    for flow, s in report['flows'].items():
+        old = (baseline or {}).get('flows', {}).get(flow, {})
+        cells = [f"{s.get(k, float('nan')):.1f}{delta(s.get(k), old.get(k))}" for k in ('p50_ms', 'p95_ms', 'p99_ms')]
+        print(f"{flow:<10} {s['count']:>7} {s['lock_errors']:>7} {s['errors']:>7} "
+              + " ".join(f"{c:>16}" for c in cells))
+        for failure, count in s.get('failures', {}).items():
+            print(f"{'':<10} {count:>7}x {failure}")
+    rss, old_rss = report['rss'], (baseline or {}).get('rss', {})
+    print(f"RSS start {rss['start_mb']:.0f} MB  end {rss['end_mb']:.0f} MB{delta(rss['end_mb'], old_rss.get('end_mb'))}"
+          f"  peak {rss['peak_mb']:.0f} MB{delta(rss['peak_mb'], old_rss.get('peak_mb'))}"
+          f"  growth {rss['growth_mb_per_min']} MB/min"
+          f"{delta(rss['growth_mb_per_min'], old_rss.get('growth_mb_per_min'))}")
+
+
+def _weights(text):
+    weights = {}
+    for part in text.split(','):
+        flow, _, weight = part.partition('=')
+        if flow not in FLOWS:
+            raise argparse.ArgumentTypeError(f"unknown flow {flow!r}; choose from {', '.join(FLOWS)}")
+        weights[flow] = float(weight or 1)
+    return weights
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Soak test the app with concurrent simulated users")
+    parser.add_argument('--farm', default='soaktest', help="Scratch farm to run against")
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=300)
+    parser.add_argument('--mix', type=_weights, default='milk=6,dashboard=2,export=1',
+                        help="Relative weight of each flow, e.g. milk=6,dashboard=2,export=1")
+    parser.add_argument('--think', type=float, default=1.0, help="Mean seconds between a user's actions")
+    parser.add_argument('--burst', type=int, default=20, help="Milk entries per milk burst")
+    parser.add_argument('--animals', type=int, default=200)
+    parser.add_argument('--history-days', type=int, default=365)
+    parser.add_argument('--sample-interval', type=float, default=5, help="Seconds between RSS samples")
+    parser.add_argument('--label', help="Name for this run in the report (default: git describe)")
+    parser.add_argument('--compare', help="Earlier report JSON to show deltas against")
+    parser.add_argument('--out', help=f"Report path (default: {REPORT_DIR}/<label>-<time>.json)")
+    args = parser.parse_args()
+
+    report = run(args.farm, args.users, args.seconds, args.mix, args.think, args.burst, args.animals,
+                 args.history_days, args.sample_interval, args.label)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    out = args.out or os.path.join(REPORT_DIR, f"{report['label']}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {out}")
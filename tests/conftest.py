@@ -0,0 +1,47 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crud
+
+
+def _dispose_farm(farm_id):
+    bind = crud._engines.pop(farm_id, None)
+    crud._session_factories.pop(farm_id, None)
+    read_bind = crud._read_engines.pop(farm_id, None)
+    crud._read_session_factories.pop(farm_id, None)
+    for engine in (bind, read_bind):
+        if engine is not None:
+            engine.dispose()
+
+
+@pytest.fixture
+def new_farm(tmp_path, monkeypatch):
+    """Factory for fresh farm databases under a temporary FARMS_DIR."""
+    monkeypatch.setattr(crud, 'FARMS_DIR', str(tmp_path / 'farms'))
+    created = []
+
+    def make():
+        farm_id = f'test-{uuid.uuid4().hex[:12]}'
+        crud.create_farm(farm_id)
+        created.append(farm_id)
+        return farm_id
+
+    yield make
+    for farm_id in created:
+        _dispose_farm(farm_id)
+
+
+@pytest.fixture
+def farm(new_farm):
+    return new_farm()
+
+
+@pytest.fixture
+def db(farm):
+    with crud.get_db_session(farm) as session:
+        yield session
@@ -0,0 +1,33 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+import crud
+from analytics import _fit_shard
+
+START = date(2024, 1, 1)
+DAYS = 199
+
+
+def _wood(t):
+    return 20.0 * t ** 0.2 * np.exp(-0.004 * t)
+
+
+def _cow(db, name, sessions):
+    animal = crud.create_animal(db, name, "Holstein", date(2020, 1, 1))
+    crud.create_milk_records(db, [{'animal_id': animal.id, 'date': START + timedelta(days=t - 1),
+                                   'quantity_liters': round(_wood(t) * share, 3), 'session': session}
+                                  for t in range(1, DAYS + 1) for session, share in sessions])
+    return animal.id
+
+
+def test_sessions_are_summed_per_day_before_fitting(farm, db):
+    daily = _cow(db, "Daily", [('Daily', 1.0)])
+    twice = _cow(db, "Twice", [('Morning', 0.5), ('Evening', 0.5)])
+    # A meter total released from quarantine next to manual entries counts once
+    metered = _cow(db, "Metered", [('Meter', 1.0), ('Morning', 0.5)])
+    fits = {f['animal_id']: f for f in _fit_shard(str(crud.get_engine(farm).url), [daily, twice, metered])}
+    for animal_id in (twice, metered):
+        assert fits[animal_id]['n_records'] == DAYS
+        assert fits[animal_id]['peak_yield'] == pytest.approx(fits[daily]['peak_yield'], rel=1e-3)
@@ -0,0 +1,75 @@
+import http.client
+import json
+import threading
+from datetime import date
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import api as api_module
+import crud
+from api import ApiRequestHandler
+
+
+@pytest.fixture
+def api(farm):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ApiRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def request(method, path, body=None):
+        conn = http.client.HTTPConnection(*server.server_address)
+        conn.request(method, path, json.dumps(body) if body is not None else None,
+                     {'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        status, payload = response.status, json.loads(response.read() or 'null')
+        conn.close()
+        return status, payload
+
+    yield request
+    server.shutdown()
+    server.server_close()
+
+
+def test_non_object_batch_items_are_rejected(api, farm):
+    status, payload = api('POST', f'/milk/batch?farm={farm}', [1, 'x'])
+    assert status == 400
+    assert 'JSON object' in payload['error']
+
+
+def test_non_object_body_is_rejected(api, farm):
+    assert api('POST', f'/milk?farm={farm}', 5)[0] == 400
+
+
+@pytest.mark.parametrize('farm_id', ['no-such-farm', '../outside', 'Bad%20Farm'])
+def test_unknown_or_invalid_farm_is_not_found(api, farm_id, tmp_path):
+    # A database file outside FARMS_DIR must not be reachable through a crafted id
+    (tmp_path / 'outside.db').touch()
+    status, payload = api('GET', f'/animals?farm={farm_id}')
+    assert status == 404
+    assert 'Unknown farm' in payload['error']
+
+
+def test_unknown_animal_is_quarantined_not_rejected(api, farm, db):
+    animal = crud.create_animal(db, "Daisy", "Holstein", date(2020, 1, 1))
+    records = [{'animal_id': animal.id, 'date': '2024-01-01', 'quantity_liters': 12.0},
+               {'animal_id': animal.id + 100, 'date': '2024-01-01', 'quantity_liters': 12.0}]
+    status, payload = api('POST', f'/milk/batch?farm={farm}', records)
+    assert status == 201
+    assert payload['stored'] == 1
+    assert payload['quarantined'] == [{'index': 1, 'reasons': ['unknown animal']}]
+    status, payload = api('POST', f'/milk?farm={farm}', records[1])
+    assert status == 422
+    assert 'unknown animal' in payload['error']
+
+
+def test_committed_batch_succeeds_when_column_sync_fails(api, farm, db, monkeypatch):
+    def failing_sync(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(api_module, 'sync_milk_columns', failing_sync)
+    animal = crud.create_animal(db, "Daisy", "Holstein", date(2020, 1, 1))
+    status, payload = api('POST', f'/milk/batch?farm={farm}',
+                          [{'animal_id': animal.id, 'date': '2024-01-01', 'quantity_liters': 12.0}])
+    assert (status, payload['stored']) == (201, 1)
+    assert db.query(crud.MilkRecord).count() == 1
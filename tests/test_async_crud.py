@@ -0,0 +1,145 @@
+import asyncio
+import functools
+import time
+from datetime import date, timedelta
+
+import pytest
+
+import async_crud
+import crud
+import validation
+
+
+@pytest.fixture
+def animal_ids(db):
+    return [crud.create_animal(db, f"Cow {i}", "Holstein", date(2020, 1, 1)).id for i in range(3)]
+
+
+# A quantity the database write is made to fail on, standing in for an integrity error
+FAILING_QUANTITY = 57.5
+
+
+@pytest.fixture
+def upsert_calls(monkeypatch):
+    calls = []
+    upsert = validation.upsert_validated
+
+    @functools.wraps(upsert)
+    def counting(db_session, kind, records, source):
+        calls.append(len(records))
+        if any(r['quantity_liters'] == FAILING_QUANTITY for r in records):
+            raise RuntimeError("write failed")
+        return upsert(db_session, kind, records, source)
+
+    monkeypatch.setattr(validation, 'upsert_validated', counting)
+    return calls
+
+
+def _gather_milk(farm, entries):
+    async def one(fields):
+        async with async_crud.get_async_session(farm) as db:
+            return await async_crud.create_milk_record(db, **fields)
+
+    async def main():
+        try:
+            return await asyncio.gather(*(one(fields) for fields in entries), return_exceptions=True)
+        finally:
+            await async_crud.dispose_async_engines()
+
+    return asyncio.run(main())
+
+
+def _entries(animal_ids, count):
+    return [{'animal_id': animal_ids[i % len(animal_ids)], 'date': date(2024, 1, 1 + i),
+             'quantity_liters': 10.0 + i} for i in range(count)]
+
+
+def test_concurrent_inserts_are_coalesced(farm, animal_ids, upsert_calls):
+    results = _gather_milk(farm, _entries(animal_ids, 20))
+    assert not [r for r in results if isinstance(r, Exception)]
+    assert sum(upsert_calls) == 20
+    assert len(upsert_calls) < 20
+
+
+def test_each_caller_gets_its_own_row(farm, animal_ids, upsert_calls):
+    entries = _entries(animal_ids, 20)
+    results = _gather_milk(farm, entries)
+    for fields, row in zip(entries, results):
+        assert (row.animal_id, row.date, row.quantity_liters) == \
+            (fields['animal_id'], fields['date'], fields['quantity_liters'])
+    assert len({row.id for row in results}) == 20
+
+
+def test_invalid_record_is_quarantined_for_its_caller(farm, animal_ids, db, upsert_calls):
+    entries = _entries(animal_ids, 10)
+    entries[5]['quantity_liters'] = None
+    results = _gather_milk(farm, entries)
+    assert len(upsert_calls) < 10
+    assert isinstance(results[5], validation.RecordRejected)
+    assert all(isinstance(r, crud.MilkRow) for i, r in enumerate(results) if i != 5)
+    assert db.query(crud.MilkRecord).count() == 9
+    assert db.query(crud.QuarantinedRecord.source).scalar() == 'async'
+
+
+def test_failed_write_fails_only_its_caller(farm, animal_ids, db, upsert_calls):
+    entries = _entries(animal_ids, 10)
+    entries[3]['quantity_liters'] = FAILING_QUANTITY
+    results = _gather_milk(farm, entries)
+    assert isinstance(results[3], RuntimeError)
+    assert all(isinstance(r, crud.MilkRow) for i, r in enumerate(results) if i != 3)
+    assert db.query(crud.MilkRecord).count() == 9
+
+
+WRITERS = 20
+RECORDS_PER_WRITER = 25
+# Timing noise allowance on a shared test machine
+THROUGHPUT_TOLERANCE = 0.8
+
+
+def _writer_batches(animal_ids):
+    # Distinct natural keys, so every write must show up as its own row
+    return [[(animal_id, date(2023, 1, 1) + timedelta(days=d), 20.0) for d in range(RECORDS_PER_WRITER)]
+            for animal_id in animal_ids]
+
+
+def _stored_keys(farm):
+    with crud.get_read_session(farm) as db:
+        return db.query(crud.MilkRecord.animal_id, crud.MilkRecord.date).all()
+
+
+def _herd(farm):
+    with crud.get_db_session(farm) as db:
+        return [crud.create_animal(db, f"Cow {i}", "Holstein", date(2020, 1, 1)).id for i in range(WRITERS)]
+
+
+def test_concurrent_async_writers_match_sync_throughput(new_farm):
+    sync_farm, async_farm = new_farm(), new_farm()
+    sync_batches, async_batches = _writer_batches(_herd(sync_farm)), _writer_batches(_herd(async_farm))
+
+    began = time.perf_counter()
+    with crud.get_db_session(sync_farm) as db:
+        for batch in sync_batches:
+            for animal_id, day, liters in batch:
+                crud.upsert_milk_record(db, animal_id, day, liters)
+    sync_elapsed = time.perf_counter() - began
+
+    async def writer(records):
+        async with async_crud.get_async_session(async_farm) as db:
+            for animal_id, day, liters in records:
+                await async_crud.create_milk_record(db, animal_id, day, liters)
+
+    async def main():
+        began = time.perf_counter()
+        try:
+            await asyncio.gather(*(writer(batch) for batch in async_batches))
+            return time.perf_counter() - began
+        finally:
+            await async_crud.dispose_async_engines()
+
+    async_elapsed = asyncio.run(main())
+    total = WRITERS * RECORDS_PER_WRITER
+    assert total / async_elapsed >= THROUGHPUT_TOLERANCE * total / sync_elapsed
+    for farm, batches in ((sync_farm, sync_batches), (async_farm, async_batches)):
+        keys = _stored_keys(farm)
+        assert len(keys) == total
+        assert set(keys) == {(a, d) for batch in batches for a, d, _ in batch}
@@ -0,0 +1,42 @@
+from datetime import date
+
+from sqlalchemy import text
+
+import crud
+import maintenance
+
+
+def _stocked(db):
+    crud.create_feed_delivery(db, date(2024, 1, 1), 'Hay', 100.0)
+    daisy = crud.create_animal(db, "Daisy", "Jersey", date(2020, 1, 1))
+    bella = crud.create_animal(db, "Bella", "Holstein", date(2020, 1, 1))
+    crud.create_feed_record(db, daisy.id, date(2024, 1, 2), 'Hay', 10.0)
+    crud.create_feed_record(db, bella.id, date(2024, 1, 2), 'Hay', 15.0)
+    return daisy, bella
+
+
+def test_deleting_an_animal_keeps_its_feed_consumed(db):
+    daisy, _ = _stocked(db)
+    assert crud.get_feed_stock(db) == {'Hay': 75.0}
+    crud.delete_animal(db, daisy.id)
+    assert crud.get_feed_stock(db) == {'Hay': 75.0}
+
+
+def test_deleting_orphans_keeps_their_feed_consumed(farm, db):
+    daisy, _ = _stocked(db)
+    bind = crud.get_engine(farm)
+    with bind.begin() as conn:
+        conn.execute(text('DELETE FROM animals WHERE id = :id'), {'id': daisy.id})
+        maintenance.delete_orphans(conn)
+    db.expire_all()
+    assert db.query(crud.FeedRecord).count() == 1
+    assert crud.get_feed_stock(db) == {'Hay': 75.0}
+
+
+def test_correcting_entries_adjusts_stock(db):
+    daisy, bella = _stocked(db)
+    record = db.query(crud.FeedRecord).filter(crud.FeedRecord.animal_id == bella.id).one()
+    crud.update_feed_record(db, record.id, quantity_kg=5.0)
+    assert crud.get_feed_stock(db) == {'Hay': 85.0}
+    crud.delete_feed_record(db, record.id)
+    assert crud.get_feed_stock(db) == {'Hay': 90.0}
@@ -0,0 +1,16 @@
+from datetime import date
+
+import crud
+import maintenance
+from validation import upsert_validated
+
+
+def test_orphan_cleanup_keeps_quarantined_records(db):
+    animal = crud.create_animal(db, "Daisy", "Holstein", date(2020, 1, 1))
+    upsert_validated(db, 'milk', [{'animal_id': animal.id + 100, 'date': date(2024, 1, 1),
+                                   'quantity_liters': 12.0}], 'api')
+    connection = db.connection()
+    assert 'quarantined_records' not in maintenance.find_orphans(connection)
+    maintenance.delete_orphans(connection)
+    db.commit()
+    assert db.query(crud.QuarantinedRecord).count() == 1
@@ -0,0 +1,68 @@
+import multiprocessing
+import os
+import shutil
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import func
+
+import crud
+import milk_columns
+
+ROUNDS = 15
+
+
+@pytest.fixture(autouse=True)
+def columnar_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(milk_columns, 'COLUMNAR_DIR', str(tmp_path / 'columnar'))
+
+
+@pytest.fixture
+def animal_ids(db):
+    ids = [crud.create_animal(db, f"Cow {i}", "Holstein", date(2020, 1, 1)).id for i in range(3)]
+    crud.upsert_milk_records(db, [{'animal_id': a, 'date': date(2024, 1, 1) + timedelta(days=d),
+                                   'quantity_liters': 10.0} for a in ids for d in range(30)])
+    return ids
+
+
+def _stored_total(farm):
+    with crud.get_read_session(farm) as db:
+        return db.query(func.sum(crud.MilkRecord.quantity_liters)).scalar()
+
+
+def _write_and_read(farm, animal_id, worker):
+    # Connections inherited from the parent must not be used after the fork
+    for registry in (crud._engines, crud._read_engines):
+        if farm in registry:
+            registry[farm].dispose(close=False)
+    for i in range(ROUNDS):
+        with crud.get_db_session(farm) as db:
+            # Overwriting a quantity forces a rebuild into a new generation
+            crud.upsert_milk_records(db, [{'animal_id': animal_id, 'date': date(2024, 1, 1) + timedelta(days=i),
+                                           'quantity_liters': 11.0 + worker}])
+        columns = milk_columns.open_milk_columns(farm)
+        assert len(columns) == 90
+        columns.totals_by_animal().sum()
+
+
+def test_concurrent_rebuilds_from_several_processes(farm, animal_ids):
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_write_and_read, args=(farm, animal_ids[i % len(animal_ids)], i))
+               for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [worker.exitcode for worker in workers] == [0] * len(workers)
+    columns = milk_columns.open_milk_columns(farm)
+    assert columns.totals_by_animal().sum() == pytest.approx(_stored_total(farm))
+    generations = [name for name in os.listdir(milk_columns._farm_dir(farm)) if name.startswith('g')]
+    assert generations == [columns.meta['generation']]
+
+
+def test_missing_generation_is_rebuilt(farm, animal_ids):
+    meta = milk_columns.sync_milk_columns(farm)
+    shutil.rmtree(os.path.join(milk_columns._farm_dir(farm), meta['generation']))
+    columns = milk_columns.open_milk_columns(farm)
+    assert columns.meta['generation'] != meta['generation']
+    assert columns.totals_by_animal().sum() == pytest.approx(_stored_total(farm))
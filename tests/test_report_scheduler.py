@@ -0,0 +1,18 @@
+import multiprocessing
+
+import report_scheduler
+
+
+def test_concurrent_processes_keep_every_manifest_entry(new_farm, tmp_path):
+    farms = [new_farm() for _ in range(4)]
+    reports_dir = str(tmp_path / 'reports')
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=report_scheduler.run_scheduled_reports, args=([f], 1, reports_dir))
+               for f in farms]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [worker.exitcode for worker in workers] == [0] * len(farms)
+    manifest = report_scheduler.load_manifest(reports_dir)
+    assert sorted(r['farm'] for r in manifest['reports']) == sorted(farms)
@@ -0,0 +1,51 @@
+from datetime import date, datetime
+
+import crud
+import sensors
+import validation
+
+
+def _reading(animal_id, hour, liters):
+    return {'animal_id': animal_id, 'ts': datetime(2024, 3, 1, hour).timestamp(), 'yield_liters': liters}
+
+
+def _milk(db, animal_id):
+    db.expire_all()
+    records = db.query(crud.MilkRecord).filter(crud.MilkRecord.animal_id == animal_id)
+    return {r.session: r.quantity_liters for r in records}
+
+
+def test_meter_totals_are_kept_apart_from_manual_daily_records(db, farm):
+    metered = crud.create_animal(db, "Daisy", "Jersey", date(2020, 1, 1))
+    manual = crud.create_animal(db, "Bella", "Holstein", date(2020, 1, 1))
+    crud.upsert_milk_record(db, manual.id, date(2024, 3, 1), 20.0, 'Daily')
+
+    assert sensors.ingest_readings(farm, [_reading(metered.id, 6, 9.0), _reading(manual.id, 6, 8.0)]) == 2
+    sensors.ingest_readings(farm, [_reading(metered.id, 17, 7.5)])
+
+    assert _milk(db, metered.id) == {crud.METER_SESSION: 16.5}
+    # The manual total is untouched and the meter total is held for review instead of double counting
+    assert _milk(db, manual.id) == {'Daily': 20.0}
+    quarantined = db.query(crud.QuarantinedRecord).one()
+    assert (quarantined.animal_id, quarantined.source, quarantined.reasons) == \
+        (manual.id, 'sensors', 'overlaps meter total')
+
+
+def test_manual_entry_for_a_metered_day_is_quarantined(db, farm):
+    animal = crud.create_animal(db, "Daisy", "Jersey", date(2020, 1, 1))
+    sensors.ingest_readings(farm, [_reading(animal.id, 6, 9.0)])
+    stored, rejected = validation.upsert_validated(
+        db, 'milk', [{'animal_id': animal.id, 'date': date(2024, 3, 1), 'quantity_liters': 9.0,
+                      'session': 'Morning'}], 'form')
+    assert stored == [] and rejected[0].reasons == ['overlaps meter total']
+
+
+def test_repeated_batches_keep_one_quarantined_total_per_day(db, farm):
+    animal = crud.create_animal(db, "Bella", "Holstein", date(2020, 1, 1))
+    crud.upsert_milk_record(db, animal.id, date(2024, 3, 1), 20.0, 'Daily')
+    for _ in range(3):
+        sensors.ingest_readings(farm, [_reading(animal.id, 6, 8.0)])
+    sensors.ingest_readings(farm, [_reading(animal.id, 17, 7.0)])
+    db.expire_all()
+    quarantined = db.query(crud.QuarantinedRecord).all()
+    assert [(q.animal_id, q.quantity) for q in quarantined] == [(animal.id, 15.0)]
@@ -0,0 +1,73 @@
+from datetime import date
+
+import pytest
+
+import crud
+import sketches
+
+
+def _yields(db):
+    db.expire_all()
+    return {(y.month, y.animal_id): (round(y.liters, 6), y.days) for y in db.query(crud.AnimalMonthYield)}
+
+
+def test_month_yields_follow_every_milk_write(db):
+    cow = crud.create_animal(db, "Daisy", "Jersey", date(2020, 1, 1))
+    crud.upsert_milk_records(db, [
+        {'animal_id': cow.id, 'date': date(2024, 1, 1), 'quantity_liters': 8.0, 'session': 'Morning'},
+        {'animal_id': cow.id, 'date': date(2024, 1, 1), 'quantity_liters': 7.0, 'session': 'Evening'},
+        {'animal_id': cow.id, 'date': date(2024, 1, 2), 'quantity_liters': 14.0, 'session': 'Daily'},
+    ])
+    assert _yields(db) == {('2024-01', cow.id): (29.0, 2)}
+
+    # An upsert that overwrites a quantity in place
+    crud.upsert_milk_record(db, cow.id, date(2024, 1, 2), 16.0, 'Daily')
+    assert _yields(db) == {('2024-01', cow.id): (31.0, 2)}
+
+    # Moving a record into another month
+    record = db.query(crud.MilkRecord).filter(crud.MilkRecord.date == date(2024, 1, 2)).one()
+    crud.update_milk_record(db, record.id, date=date(2024, 2, 1))
+    assert _yields(db) == {('2024-01', cow.id): (15.0, 1), ('2024-02', cow.id): (16.0, 1)}
+
+    crud.delete_animal(db, cow.id)
+    assert _yields(db) == {}
+
+
+def test_ranks_compare_average_daily_yields(farm, db):
+    breed_yields = {'Jersey': [10.0, 12.0, 14.0, 16.0], 'Holstein': [30.0]}
+    for breed, yields in breed_yields.items():
+        for i, liters in enumerate(yields):
+            cow = crud.create_animal(db, f"{breed} {i}", breed, date(2020, 1, 1))
+            # Two sessions a day: the per-record quantity is half the daily yield
+            crud.upsert_milk_records(db, [{'animal_id': cow.id, 'date': date(2024, 3, day),
+                                           'quantity_liters': liters / 2, 'session': session}
+                                          for day in (1, 2) for session in ('Morning', 'Evening')])
+
+    with crud.get_read_session(farm) as read_db:
+        month, ranks = sketches.get_percentile_ranks(read_db)
+    assert month == '2024-03'
+    by_yield = {r.average_liters: r for r in ranks.values()}
+    assert sorted(by_yield) == [10.0, 12.0, 14.0, 16.0, 30.0]
+    assert by_yield[16.0].breed_rank == 1.0 and by_yield[10.0].breed_rank == 0.25
+    assert by_yield[30.0].breed_rank == 1.0 and by_yield[30.0].herd_rank == 1.0
+    assert by_yield[16.0].herd_rank == pytest.approx(0.8)
+    # Looking up ranks does not store anything; a refresh stores the stale month once
+    assert db.query(crud.YieldSketch).count() == 0
+    assert sketches.refresh_yield_sketches(farm) == 1
+    assert sketches.refresh_yield_sketches(farm) == 0
+    db.expire_all()
+    assert {s.breed for s in db.query(crud.YieldSketch)} == {'Jersey', 'Holstein', sketches.HERD}
+
+    # A new write flags the month instead of deleting its sketches, and lookups rebuild it until refreshed
+    cow_id = next(r.animal_id for r in ranks.values() if r.average_liters == 16.0)
+    crud.upsert_milk_record(db, cow_id, date(2024, 3, 3), 40.0)
+    db.expire_all()
+    assert db.query(crud.YieldSketch).count() == 3
+    assert [m.month for m in db.query(crud.StaleSketchMonth)] == ['2024-03']
+    with crud.get_read_session(farm) as read_db:
+        _, ranks = sketches.get_percentile_ranks(read_db)
+    assert ranks[cow_id].average_liters == 24.0 and ranks[cow_id].herd_rank == pytest.approx(0.8)
+    assert sketches.refresh_yield_sketches(farm) == 1
+    assert sketches.get_yield_sketch(db, sketches.HERD, ['2024-03']).n == 5
+    db.expire_all()
+    assert db.query(crud.StaleSketchMonth).count() == 0
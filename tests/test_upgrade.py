@@ -0,0 +1,25 @@
+import json
+import sqlite3
+from datetime import date
+
+import crud
+
+
+def test_legacy_duplicates_are_summed_or_quarantined(farm, db):
+    animal = crud.create_animal(db, "Daisy", "Jersey", date(2020, 1, 1))
+    with sqlite3.connect(crud._farm_path(farm)) as conn:
+        conn.execute("DROP INDEX uq_milk_records_animal_date_session")
+        conn.executemany("INSERT INTO milk_records (animal_id, date, quantity_liters, session) VALUES (?, ?, ?, ?)",
+                         [(animal.id, '2024-01-01', 10.0, 'Morning'),
+                          (animal.id, '2024-01-01', 10.0, 'Morning'),
+                          (animal.id, '2024-01-01', 4.0, 'Morning'),
+                          (animal.id, '2024-01-02', 7.0, 'Daily')])
+    crud._upgrade_schema(crud.get_engine(farm))
+
+    milk = {(r.date, r.session): r.quantity_liters for r in db.query(crud.MilkRecord)}
+    assert milk == {(date(2024, 1, 1), 'Morning'): 14.0, (date(2024, 1, 2), 'Daily'): 7.0}
+    quarantined = db.query(crud.QuarantinedRecord).all()
+    assert len(quarantined) == 1
+    assert (quarantined[0].kind, quarantined[0].quantity, quarantined[0].source) == ('milk', 10.0, 'upgrade')
+    assert json.loads(quarantined[0].payload) == {'animal_id': animal.id, 'date': '2024-01-01',
+                                                  'session': 'Morning', 'quantity_liters': 10.0}
@@ -0,0 +1,37 @@
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+import crud
+
+
+def _milk(animal_id, session, liters=10.0, day=date(2024, 3, 1)):
+    return {'animal_id': animal_id, 'date': day, 'quantity_liters': liters, 'session': session}
+
+
+def test_upsert_returns_each_input_its_stored_row(db):
+    cow = crud.create_animal(db, "Daisy", "Holstein", date(2020, 1, 1))
+    records = [_milk(cow.id, 'Morning', 8.0), _milk(cow.id, 'Evening', 7.0), _milk(cow.id, 'Morning', 9.0)]
+    rows = crud.upsert_milk_records(db, records)
+    assert [(row.session, row.quantity_liters) for row in rows] == [('Morning', 9.0), ('Evening', 7.0),
+                                                                    ('Morning', 9.0)]
+    assert rows[0].id == rows[2].id
+    assert db.query(crud.MilkRecord).count() == 2
+
+
+def test_upsert_is_not_sent_row_by_row(farm, db):
+    cow = crud.create_animal(db, "Daisy", "Holstein", date(2020, 1, 1))
+    records = [_milk(cow.id, 'Daily', day=date(2023, 1, 1) + timedelta(days=d)) for d in range(500)]
+    inserts = []
+
+    def listener(conn, cursor, statement, *args):
+        if statement.startswith('INSERT'):
+            inserts.append(statement)
+
+    event.listen(crud.get_engine(farm), 'before_cursor_execute', listener)
+    try:
+        rows = crud.upsert_milk_records(db, records)
+    finally:
+        event.remove(crud.get_engine(farm), 'before_cursor_execute', listener)
+    assert [row.date for row in rows] == [r['date'] for r in records]
+    assert len(inserts) < 10
@@ -0,0 +1,20 @@
+from datetime import date
+
+import crud
+from validation import upsert_validated
+
+
+def _milk(animal_id, session, liters=10.0):
+    return {'animal_id': animal_id, 'date': date(2024, 3, 1), 'quantity_liters': liters, 'session': session}
+
+
+def test_daily_total_and_session_records_do_not_mix(db):
+    cow = crud.create_animal(db, "Daisy", "Holstein", date(2020, 1, 1))
+    other = crud.create_animal(db, "Bella", "Holstein", date(2020, 1, 1))
+    upsert_validated(db, 'milk', [_milk(cow.id, 'Morning'), _milk(other.id, 'Daily', 20.0)], 'form')
+    stored, rejected = upsert_validated(db, 'milk', [_milk(cow.id, 'Daily', 20.0), _milk(other.id, 'Evening'),
+                                                     _milk(cow.id, 'Evening')], 'form')
+    assert [r.index for r in rejected] == [0, 1]
+    assert all(r.reasons == ['mixes daily and sessions'] for r in rejected)
+    assert [(row.animal_id, row.session) for row in stored] == [(cow.id, 'Evening')]
+
@@ -0,0 +1,36 @@
+import sqlite3
+from datetime import date
+
+import crud
+
+
+def test_index_sees_treatments_written_by_another_process(farm, db):
+    cow = crud.create_animal(db, "Daisy", "Holstein", date(2020, 1, 1))
+    crud.set_withdrawal_period(db, "Penicillin", 4)
+    assert not crud.get_withdrawal_index(db).is_withheld(cow.id, date(2024, 5, 2))
+
+    # A plain sqlite3 connection stands in for the API process: it never
+    # touches this process's in-memory index
+    other = sqlite3.connect(crud._farm_path(farm))
+    other.execute("INSERT INTO medicine_records (animal_id, date, medicine_name, dosage, reason) "
+                  "VALUES (?, '2024-05-01', 'Penicillin', '10 ml', 'Mastitis')", (cow.id,))
+    other.commit()
+    other.close()
+    db.commit()
+
+    assert crud.get_withdrawal_index(db).is_withheld(cow.id, date(2024, 5, 2))
+    assert crud.upsert_milk_record(db, cow.id, date(2024, 5, 3), 12.0).withheld
+
+
+def test_index_sees_withdrawal_period_changes(farm, db):
+    cow = crud.create_animal(db, "Bella", "Jersey", date(2020, 1, 1))
+    crud.create_medicine_record(db, cow.id, date(2024, 5, 1), "Oxytet", "5 ml", "Foot rot")
+    assert not crud.get_withdrawal_index(db).is_withheld(cow.id, date(2024, 5, 2))
+
+    other = sqlite3.connect(crud._farm_path(farm))
+    other.execute("INSERT INTO medicine_withdrawals (medicine_name, milk_withdrawal_days) VALUES ('Oxytet', 7)")
+    other.commit()
+    other.close()
+    db.commit()
+
+    assert crud.get_withdrawal_index(db).is_withheld(cow.id, date(2024, 5, 6))
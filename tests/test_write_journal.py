@@ -0,0 +1,61 @@
+import multiprocessing
+from datetime import date, timedelta
+
+import pytest
+
+import crud
+import write_journal
+
+
+def test_conflicts_survive_a_failure_in_a_later_chunk(farm, db, tmp_path, monkeypatch):
+    journal_dir = str(tmp_path / 'journal')
+    animal = crud.create_animal(db, "Daisy", "Jersey", date(2020, 1, 1))
+    unknown = write_journal.append(farm, 'milk', {'animal_id': animal.id + 100, 'date': date(2024, 1, 1),
+                                                  'quantity_liters': 10.0, 'session': 'Morning'}, journal_dir)
+    write_journal.append(farm, 'milk', {'animal_id': animal.id, 'date': date(2024, 1, 1),
+                                        'quantity_liters': 12.0, 'session': 'Morning'}, journal_dir)
+
+    replay_chunk = write_journal._replay_chunk
+    calls = []
+
+    def failing_second_chunk(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("database went away")
+        return replay_chunk(*args)
+
+    monkeypatch.setattr(write_journal, '_replay_chunk', failing_second_chunk)
+    with pytest.raises(RuntimeError):
+        write_journal.replay(farm, journal_dir, chunk_size=1)
+    # The first chunk's receipt is committed, so its conflict must already be on disk
+    assert db.query(crud.JournalReceipt).filter(crud.JournalReceipt.key == unknown).count() == 1
+    assert [c['key'] for c in write_journal.conflicts(farm, journal_dir)] == [unknown]
+
+    monkeypatch.setattr(write_journal, '_replay_chunk', replay_chunk)
+    result = write_journal.replay(farm, journal_dir, chunk_size=1)
+    assert (result.applied, result.duplicates, result.conflicts) == (1, 1, [])
+    assert [c['key'] for c in write_journal.conflicts(farm, journal_dir)] == [unknown]
+    assert write_journal.pending(farm, journal_dir) == []
+
+
+APPENDED = 200
+
+
+def _append_many(farm, animal_id, journal_dir):
+    for i in range(APPENDED):
+        write_journal.append(farm, 'milk', {'animal_id': animal_id, 'date': date(2023, 1, 1) + timedelta(days=i),
+                                            'quantity_liters': 10.0, 'session': 'Daily'}, journal_dir)
+
+
+def test_entries_appended_by_another_process_during_replay_are_kept(farm, db, tmp_path):
+    journal_dir = str(tmp_path / 'journal')
+    animal = crud.create_animal(db, "Daisy", "Jersey", date(2020, 1, 1))
+    writer = multiprocessing.get_context('fork').Process(target=_append_many, args=(farm, animal.id, journal_dir))
+    writer.start()
+    while writer.is_alive():
+        write_journal.replay(farm, journal_dir)
+    writer.join()
+    assert writer.exitcode == 0
+    write_journal.replay(farm, journal_dir)
+    assert db.query(crud.JournalReceipt).count() == APPENDED
+    assert db.query(crud.MilkRecord).count() == APPENDED
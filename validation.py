@@ -0,0 +1,280 @@
+"""
+Batch validation and quarantine for milk and feed records.
+
+The milk and feed write paths (the Milk and Feed forms, API single and batch
+posts, async_crud's group-committed inserts, sensor meter rollups and
+offline journal replay) pass their records through `validate_records`
+before the upsert. Group feedings (crud.feed_group) are written in one
+INSERT ... SELECT over the group's members without these checks, and the
+crud and async_crud bulk functions (used for seeding and benchmarks) and
+releases from quarantine store records as given.
+
+The rules run on the whole batch at once as pandas/numpy column operations.
+Reference data is fetched with two grouped queries per batch, one for the
+animals (date of birth and first cull date) and one for recent history
+statistics, so checking a 10,000 record batch costs about the same as
+checking one record.
+
+Rules:
+    quantity out of range       <= 0, or above MAX_QUANTITY for the kind/session
+    date in the future          after today
+    unknown animal              animal_id not in the farm
+    before date of birth        dated before the animal was born
+    after cull                  dated after the animal's first Cull event
+    outlier vs recent history   more than Z_LIMIT standard deviations from the
+                                animal's mean for the same session/feed type over
+                                the HISTORY_DAYS before the batch (needs at
+                                least MIN_HISTORY records; not applied to meter
+                                totals, which grow through the day)
+    overlaps meter total        a manual milk record for an animal-day that has a
+                                sensor meter total, or the reverse, which would
+                                count the same milk twice
+    mixes daily and sessions    a Daily milk total for an animal-day that has
+                                Morning/Evening records, or the reverse, which
+                                would also count the same milk twice
+
+Rejected records are written to quarantined_records with their reasons and
+can be released (stored as submitted) or discarded from the review panels on
+the Milk and Feed pages or this CLI.
+
+Usage:
+    python validation.py [--farm FARM] [--kind milk|feed]
+    python validation.py [--farm FARM] --release ID [ID ...]
+    python validation.py [--farm FARM] --discard ID [ID ...]
+"""
+import argparse
+import json
+from datetime import date
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+
+from crud import (Animal, DEFAULT_FARM, FeedRecord, LifecycleEvent, METER_SESSION, MilkRecord, QuarantinedRecord,
+                  get_db_session, init_db, upsert_feed_records, upsert_milk_records)
+
+# Highest plausible single record; sessions are a part of the day's milk
+MAX_QUANTITY = {
+    'milk': {'Daily': 100.0, METER_SESSION: 100.0, None: 60.0},
+    'feed': {None: 100.0},
+}
+Z_LIMIT = 4.0
+HISTORY_DAYS = 30
+MIN_HISTORY = 7
+# Floor on the standard deviation as a fraction of the mean, so a perfectly
+# steady history does not turn every small change into an outlier
+MIN_SPREAD = 0.1
+
+
+class _Kind(NamedTuple):
+    upsert_many: object
+    model: object
+    quantity: str
+    group: str
+
+
+KINDS = {
+    'milk': _Kind(upsert_milk_records, MilkRecord, 'quantity_liters', 'session'),
+    'feed': _Kind(upsert_feed_records, FeedRecord, 'quantity_kg', 'feed_type'),
+}
+
+
+class Rejection(NamedTuple):
+    index: int
+    record: dict
+    reasons: list
+
+
+class ValidationResult(NamedTuple):
+    accepted: list
+    rejected: list
+
+
+class RecordRejected(ValueError):
+    """Raised by single-record saves when the record was quarantined instead of stored."""
+
+    def __init__(self, reasons):
+        super().__init__(", ".join(reasons))
+        self.reasons = reasons
+
+
+def _reference(db_session, animal_ids):
+    culls = (db_session.query(LifecycleEvent.animal_id, func.min(LifecycleEvent.date).label('culled_on'))
+             .filter(LifecycleEvent.event_type == 'Cull', LifecycleEvent.animal_id.in_(animal_ids))
+             .group_by(LifecycleEvent.animal_id).subquery())
+    rows = (db_session.query(Animal.id, Animal.date_of_birth, culls.c.culled_on)
+            .outerjoin(culls, culls.c.animal_id == Animal.id)
+            .filter(Animal.id.in_(animal_ids)).all())
+    return pd.DataFrame(rows, columns=['animal_id', 'date_of_birth', 'culled_on'])
+
+
+def _history(db_session, kind, animal_ids, start, end):
+    model = kind.model
+    quantity, group = getattr(model, kind.quantity), getattr(model, kind.group)
+    rows = (db_session.query(model.animal_id, group, func.count(), func.avg(quantity), func.avg(quantity * quantity))
+            .filter(model.animal_id.in_(animal_ids), model.date >= start, model.date <= end)
+            .group_by(model.animal_id, group).all())
+    return pd.DataFrame(rows, columns=['animal_id', kind.group, 'n', 'mean', 'mean_sq'])
+
+
+def _stored_days(db_session, frame, days):
+    """For each milk record, whether its animal-day already has stored meter, Daily and per-session records."""
+    is_meter = MilkRecord.session == METER_SESSION
+    is_daily = MilkRecord.session == 'Daily'
+    rows = (db_session.query(MilkRecord.animal_id, MilkRecord.date, func.max(is_meter), func.max(is_daily),
+                             func.max(~is_meter & ~is_daily))
+            .filter(MilkRecord.animal_id.in_(frame['animal_id'].unique().tolist()),
+                    MilkRecord.date >= days.min().date(), MilkRecord.date <= days.max().date())
+            .group_by(MilkRecord.animal_id, MilkRecord.date).all())
+    stored = pd.DataFrame(rows, columns=['animal_id', 'day', 'has_meter', 'has_daily', 'has_session'])
+    stored['day'] = pd.to_datetime(stored['day'])
+    found = pd.DataFrame({'animal_id': frame['animal_id'], 'day': days}).merge(
+        stored, on=['animal_id', 'day'], how='left')
+    return {column: found[column].fillna(0).astype(bool).to_numpy()
+            for column in ('has_meter', 'has_daily', 'has_session')}
+
+
+def _meter_overlap(frame, stored):
+    """Mask of milk records whose animal-day already has stored records on the other side of the meter split."""
+    metered = (frame['session'] == METER_SESSION).to_numpy()
+    return np.where(metered, stored['has_daily'] | stored['has_session'], stored['has_meter'])
+
+
+def _daily_overlap(frame, stored):
+    """Mask of Daily records for an animal-day with stored per-session records, or the reverse."""
+    daily = (frame['session'] == 'Daily').to_numpy()
+    session = ~daily & (frame['session'] != METER_SESSION).to_numpy()
+    return (daily & stored['has_session']) | (session & stored['has_daily'])
+
+
+def validate_records(db_session, kind, records, today=None):
+    """Split records (dicts as passed to the upserts) into accepted ones and Rejections."""
+    if not records:
+        return ValidationResult([], [])
+    spec = KINDS[kind]
+    today = pd.Timestamp(today or date.today())
+    frame = pd.DataFrame.from_records(records)
+    if kind == 'milk':
+        frame['session'] = frame['session'].fillna('Daily') if 'session' in frame else 'Daily'
+    frame['animal_id'] = frame['animal_id'].astype('int64')
+    days = pd.to_datetime(frame['date'])
+    quantity = pd.to_numeric(frame[spec.quantity], errors='coerce')
+    animal_ids = frame['animal_id'].unique().tolist()
+
+    limits = MAX_QUANTITY[kind]
+    maximum = frame[spec.group].map(limits).fillna(limits[None]) if spec.group in frame else limits[None]
+    reference = frame[['animal_id']].merge(_reference(db_session, animal_ids), on='animal_id', how='left')
+    history = frame[['animal_id', spec.group]].merge(
+        _history(db_session, spec, animal_ids, (days.min() - pd.Timedelta(days=HISTORY_DAYS)).date(),
+                 days.max().date()),
+        on=['animal_id', spec.group], how='left')
+    mean = history['mean'].to_numpy(float)
+    spread = np.maximum(np.sqrt(np.clip(history['mean_sq'].to_numpy(float) - mean ** 2, 0, None)),
+                        mean * MIN_SPREAD)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.abs(quantity.to_numpy(float) - mean) / spread
+
+    checks = {
+        'quantity out of range': (quantity.isna() | (quantity <= 0) | (quantity > maximum)).to_numpy(),
+        'date in the future': (days > today).to_numpy(),
+        'unknown animal': reference['date_of_birth'].isna().to_numpy(),
+        'before date of birth': (days < pd.to_datetime(reference['date_of_birth'])).to_numpy(),
+        'after cull': (days > pd.to_datetime(reference['culled_on'])).to_numpy(),
+        'outlier vs recent history': ((history['n'].fillna(0) >= MIN_HISTORY).to_numpy() & (z > Z_LIMIT)),
+    }
+    if kind == 'milk':
+        checks['outlier vs recent history'] &= (frame['session'] != METER_SESSION).to_numpy()
+        stored = _stored_days(db_session, frame, days)
+        checks['overlaps meter total'] = _meter_overlap(frame, stored)
+        checks['mixes daily and sessions'] = _daily_overlap(frame, stored)
+    failed = np.logical_or.reduce(list(checks.values()))
+    accepted = [records[i] for i in np.flatnonzero(~failed)]
+    rejected = [Rejection(int(i), records[i], [name for name, mask in checks.items() if mask[i]])
+                for i in np.flatnonzero(failed)]
+    return ValidationResult(accepted, rejected)
+
+
+def quarantine(db_session, kind, rejected, source):
+    """Add rejections to quarantined_records in the caller's transaction."""
+    quantity = KINDS[kind].quantity
+    today = date.today()
+    if rejected:
+        db_session.execute(QuarantinedRecord.__table__.insert(), [{
+            'kind': kind,
+            'animal_id': r.record.get('animal_id'),
+            'date': r.record.get('date'),
+            'quantity': r.record.get(quantity),
+            'payload': json.dumps(r.record, default=str),
+            'reasons': '; '.join(r.reasons),
+            'source': source,
+            'created_on': today,
+        } for r in rejected])
+    return len(rejected)
+
+
+def upsert_validated(db_session, kind, records, source):
+    """Validate a batch, quarantine the rejects and upsert the rest. Returns (stored rows, rejections)."""
+    accepted, rejected = validate_records(db_session, kind, records)
+    quarantine(db_session, kind, rejected, source)
+    # The upsert commits the quarantined rows with the records
+    stored = KINDS[kind].upsert_many(db_session, accepted)
+    if not accepted:
+        db_session.commit()
+    return stored, rejected
+
+
+def list_quarantined(db_session, kind=None):
+    query = db_session.query(QuarantinedRecord)
+    if kind is not None:
+        query = query.filter(QuarantinedRecord.kind == kind)
+    return query.order_by(QuarantinedRecord.created_on.desc(), QuarantinedRecord.id.desc()).all()
+
+
+def count_quarantined(db_session, kind=None):
+    query = db_session.query(func.count(QuarantinedRecord.id))
+    if kind is not None:
+        query = query.filter(QuarantinedRecord.kind == kind)
+    return query.scalar()
+
+
+def release_quarantined(db_session, ids):
+    """Store quarantined records as submitted, skipping validation, and remove them from quarantine."""
+    entries = db_session.query(QuarantinedRecord).filter(QuarantinedRecord.id.in_(ids)).all()
+    released = 0
+    for kind, spec in KINDS.items():
+        records = [json.loads(e.payload) for e in entries if e.kind == kind]
+        for record in records:
+            record['date'] = date.fromisoformat(record['date'])
+        if records:
+            spec.upsert_many(db_session, records)
+            released += len(records)
+    db_session.query(QuarantinedRecord).filter(QuarantinedRecord.id.in_(ids)).delete()
+    db_session.commit()
+    return released
+
+
+def discard_quarantined(db_session, ids):
+    discarded = db_session.query(QuarantinedRecord).filter(QuarantinedRecord.id.in_(ids)).delete()
+    db_session.commit()
+    return discarded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Review quarantined milk and feed records")
+    parser.add_argument('--farm', default=DEFAULT_FARM)
+    parser.add_argument('--kind', choices=list(KINDS))
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument('--release', type=int, nargs='+', metavar='ID', help="Store these records as submitted")
+    action.add_argument('--discard', type=int, nargs='+', metavar='ID', help="Delete these records")
+    args = parser.parse_args()
+    init_db(args.farm)
+    with get_db_session(args.farm) as db:
+        if args.release:
+            print(f"Released {release_quarantined(db, args.release)} records.")
+        elif args.discard:
+            print(f"Discarded {discard_quarantined(db, args.discard)} records.")
+        else:
+            for q in list_quarantined(db, args.kind):
+                print(f"{q.id:>6}  {q.kind:<4}  animal {q.animal_id}  {q.date}  {q.quantity}  "
+                      f"[{q.source}] {q.reasons}")
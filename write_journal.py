@@ -0,0 +1,244 @@
+"""
+Local write journal for barn terminals.
+
+When a terminal cannot reach the central database, milk and feed entries
+are appended to JOURNAL_DIR/<farm>.jsonl instead of being lost. Each line
+is one entry with a unique idempotency key and is fsynced before the save
+is acknowledged. `replay` later pushes pending entries to the database in
+bulk upserts, recording each key in journal_receipts in the same
+transaction, so a replay interrupted half way can simply be run again.
+
+Entries that disagree with what the central database already holds for the
+same natural key (another terminal stored a different quantity meanwhile),
+or that refer to an animal the database does not know, are not applied;
+they are moved to JOURNAL_DIR/<farm>.conflicts.jsonl for review. Entries
+that fail validation.py's rules are quarantined like any other write.
+
+The app and the replay CLI run as separate processes, so appends and
+replays hold a flock on JOURNAL_DIR/<farm>.jsonl.lock; an entry appended
+while a replay runs waits for it and lands in a fresh journal instead of
+being removed unreplayed.
+
+Usage:
+    python write_journal.py [--farm FARM | --all-farms] [--status]
+"""
+import argparse
+import fcntl
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import NamedTuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.exc import OperationalError
+
+from crud import (Animal, DEFAULT_FARM, FeedRecord, JournalReceipt, MilkRecord, get_db_session, list_farms,
+                  upsert_feed_records, upsert_milk_records)
+from validation import RecordRejected, quarantine, upsert_validated, validate_records
+
+JOURNAL_DIR = os.environ.get('DAIRY_JOURNAL_DIR', 'journal')
+
+# Entries are replayed this many at a time, one transaction per chunk
+REPLAY_CHUNK = 2000
+
+# kind -> (bulk upsert, model, natural key, quantity column)
+KINDS = {
+    'milk': (upsert_milk_records, MilkRecord, ('animal_id', 'date', 'session'), 'quantity_liters'),
+    'feed': (upsert_feed_records, FeedRecord, ('animal_id', 'date', 'feed_type'), 'quantity_kg'),
+}
+
+
+class ReplayResult(NamedTuple):
+    applied: int
+    duplicates: int
+    conflicts: list
+    quarantined: int = 0
+
+
+def _journal_path(farm_id, suffix='jsonl', journal_dir=None):
+    return os.path.join(journal_dir or JOURNAL_DIR, f'{farm_id or DEFAULT_FARM}.{suffix}')
+
+
+@contextmanager
+def _journal_lock(farm_id, journal_dir=None):
+    """Exclusive lock on a farm's journal across threads and processes."""
+    path = _journal_path(farm_id, 'jsonl.lock', journal_dir)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _append_lines(path, entries):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def append(farm_id, kind, fields, journal_dir=None):
+    """Durably journal one milk or feed entry and return its idempotency key."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown journal entry kind: {kind}")
+    entry = {
+        'key': uuid.uuid4().hex,
+        'kind': kind,
+        'fields': {k: v.isoformat() if isinstance(v, date) else v for k, v in fields.items()},
+        'queued_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    with _journal_lock(farm_id, journal_dir):
+        _append_lines(_journal_path(farm_id, journal_dir=journal_dir), [entry])
+    return entry['key']
+
+
+def pending(farm_id, journal_dir=None):
+    """Entries still waiting to be replayed, oldest first."""
+    path = _journal_path(farm_id, journal_dir=journal_dir)
+    if not os.path.isfile(path):
+        return []
+    entries = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            # A line cut short by a crash mid-append was never acknowledged
+            if line.endswith('}'):
+                entries.append(json.loads(line))
+    return entries
+
+
+def conflicts(farm_id, journal_dir=None):
+    path = _journal_path(farm_id, 'conflicts.jsonl', journal_dir)
+    if not os.path.isfile(path):
+        return []
+    # A chunk that failed after writing its conflicts writes them again when re-run
+    by_key = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.endswith('}'):
+                entry = json.loads(line)
+                by_key[entry['key']] = entry
+    return list(by_key.values())
+
+
+def save_or_journal(farm_id, kind, fields, journal_dir=None):
+    """
+    Validate and upsert one record, falling back to the journal when the
+    database is unreachable. Returns the stored row, or None when the entry
+    was journaled instead; raises RecordRejected when it was quarantined.
+    """
+    try:
+        with get_db_session(farm_id) as db:
+            stored, rejected = upsert_validated(db, kind, [fields], 'form')
+    except OperationalError:
+        append(farm_id, kind, fields, journal_dir)
+        return None
+    if rejected:
+        raise RecordRejected(rejected[0].reasons)
+    return stored[0]
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _replay_chunk(db, kind, entries, today, conflicts_path):
+    """
+    Apply one chunk of same-kind entries; return (applied, duplicates,
+    conflicts, quarantined). Conflicts are written to conflicts_path before
+    their receipts are committed, so a later failure cannot lose them.
+    """
+    upsert_many, model, key_columns, quantity = KINDS[kind]
+    keys = [e['key'] for e in entries]
+    seen = {k for (k,) in db.query(JournalReceipt.key).filter(JournalReceipt.key.in_(keys))}
+    fresh = [e for e in entries if e['key'] not in seen]
+    for e in fresh:
+        e['fields']['date'] = date.fromisoformat(e['fields']['date'])
+
+    # A later offline correction of the same record replaces the earlier one
+    latest = {}
+    for e in fresh:
+        latest[tuple(e['fields'][c] for c in key_columns)] = e
+    animal_ids = {natural[0] for natural in latest}
+    known = {a for (a,) in db.query(Animal.id).filter(Animal.id.in_(animal_ids))}
+    stored = dict(
+        (tuple(row[:-1]), row[-1]) for row in
+        db.query(*[getattr(model, c) for c in key_columns], getattr(model, quantity))
+        .filter(tuple_(*[getattr(model, c) for c in key_columns]).in_(list(latest)))
+    )
+
+    rows, clashes = [], []
+    for natural, e in latest.items():
+        if natural[0] not in known:
+            clashes.append(dict(e, reason='unknown animal'))
+        elif natural in stored and stored[natural] != e['fields'][quantity]:
+            clashes.append(dict(e, reason='central value differs', central_value=stored[natural]))
+        else:
+            rows.append(e['fields'])
+
+    if clashes:
+        for c in clashes:
+            c['fields']['date'] = c['fields']['date'].isoformat()
+        _append_lines(conflicts_path, clashes)
+
+    accepted, rejected = validate_records(db, kind, rows)
+    quarantine(db, kind, rejected, 'journal')
+    db.add_all(JournalReceipt(key=e['key'], applied_on=today) for e in fresh)
+    if accepted:
+        # Commits the receipts, quarantined entries and records together
+        upsert_many(db, accepted)
+    else:
+        db.commit()
+    return len(accepted), len(entries) - len(rows) - len(clashes), clashes, len(rejected)
+
+
+def replay(farm_id=None, journal_dir=None, chunk_size=REPLAY_CHUNK):
+    """
+    Push journaled entries to the farm database and truncate the journal.
+    Safe to re-run: entries whose key already has a receipt are skipped.
+    """
+    farm_id = farm_id or DEFAULT_FARM
+    path = _journal_path(farm_id, journal_dir=journal_dir)
+    with _journal_lock(farm_id, journal_dir):
+        entries = pending(farm_id, journal_dir)
+        if not entries:
+            return ReplayResult(0, 0, [])
+        applied = duplicates = quarantined = 0
+        clashes = []
+        today = date.today()
+        conflicts_path = _journal_path(farm_id, 'conflicts.jsonl', journal_dir)
+        with get_db_session(farm_id) as db:
+            for kind in KINDS:
+                of_kind = [e for e in entries if e['kind'] == kind]
+                for chunk in _chunks(of_kind, chunk_size):
+                    a, d, c, q = _replay_chunk(db, kind, chunk, today, conflicts_path)
+                    applied, duplicates, quarantined = applied + a, duplicates + d, quarantined + q
+                    clashes.extend(c)
+        # Every entry now has a receipt or a conflict line, so the journal can go
+        os.remove(path)
+    return ReplayResult(applied, duplicates, clashes, quarantined)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay journaled offline entries into the farm databases")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--farm', default=DEFAULT_FARM)
+    target.add_argument('--all-farms', action='store_true')
+    parser.add_argument('--status', action='store_true', help="Only show pending entry counts")
+    args = parser.parse_args()
+
+    for farm in (list_farms() if args.all_farms else [args.farm]):
+        if args.status:
+            print(f"{farm}: {len(pending(farm))} pending, {len(conflicts(farm))} conflicts")
+            continue
+        result = replay(farm)
+        print(f"{farm}: {result.applied} applied, {result.duplicates} duplicates, "
+              f"{len(result.conflicts)} conflicts, {result.quarantined} quarantined")